@@ -0,0 +1,146 @@
+"""
+asyncio runtime (BOT_RUNTIME=async).
+
+The default runtime receives updates with bot.polling, runs handlers on
+telebot's worker threads and sends replies from the outbox's sender threads,
+so concurrency is capped by those thread pools and each thread blocks on
+HTTPS in turn.
+
+AsyncRuntime moves the network I/O onto one asyncio loop built on
+telebot.async_telebot (which needs aiohttp installed):
+  - getUpdates long polling, or the webhook server, feeds the loop (at
+    most WEBHOOK_BATCHES webhook batches in flight),
+  - every update is handed to the unchanged synchronous handlers - the same
+    bot.process_new_updates the default runtime uses - on a dedicated
+    executor, since the handlers are mostly SQLite work,
+  - queued replies are taken from the Outbox in batches and sent concurrently
+    with asyncio.gather, so the per-admin notifications of one order go out
+    together instead of one after another.
+
+The synchronous TeleBot must be created with threaded=False so its handlers
+run inline on the executor threads.
+
+Limitation: only send_message goes through the outbox. The handlers' other
+Bot API calls (answer_callback_query, edit_message_text,
+edit_message_reply_markup, send_document) are still synchronous requests
+made from the executor thread running the handler, so each of them holds one
+of the DB_WORKERS threads for a full HTTPS round trip.
+"""
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.async_telebot import AsyncTeleBot
+
+import webhook
+
+logger = logging.getLogger(__name__)
+
+DB_WORKERS = 8
+SEND_BATCH = 32
+# Webhook batches handed to the loop but not finished yet; beyond this the webhook thread waits
+WEBHOOK_BATCHES = 4
+
+
+class AsyncRuntime(AsyncTeleBot):
+    def __init__(self, bot, outbox, db_workers=DB_WORKERS):
+        super().__init__(bot.token)
+        self.bot = bot
+        self.outbox = outbox
+        self.db_executor = ThreadPoolExecutor(db_workers, thread_name_prefix="db")
+        # Outbox.take_batch() blocks, so it gets its own thread instead of holding a db worker
+        self._take_executor = ThreadPoolExecutor(1, thread_name_prefix="outbox-take")
+        self._sending = set()
+
+    async def process_new_updates(self, updates):
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self.db_executor, self.bot.process_new_updates, [update])
+            for update in updates
+        ), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error("Update handler failed", exc_info=result)
+
+    def webhook_processor(self, loop, max_batches=WEBHOOK_BATCHES):
+        """
+        Return a process_updates(updates) for WebhookServer that runs each batch on loop.
+
+        It is called on the webhook's dispatcher thread and blocks while
+        max_batches batches are still running, so a backlog stays in the
+        webhook queue, which answers 503 when full and Telegram redelivers
+        later. A batch that fails is logged.
+        """
+        in_flight = threading.BoundedSemaphore(max_batches)
+
+        def finished(future):
+            in_flight.release()
+            if not future.cancelled() and future.exception() is not None:
+                logger.error("Webhook batch failed", exc_info=future.exception())
+
+        def process_updates(updates):
+            in_flight.acquire()
+            try:
+                future = asyncio.run_coroutine_threadsafe(self.process_new_updates(updates), loop)
+            except BaseException:
+                in_flight.release()
+                raise
+            future.add_done_callback(finished)
+
+        return process_updates
+
+    async def _send(self, item):
+        try:
+            await self.send_message(item.chat_id, item.text, **item.kwargs)
+        except Exception as e:
+            self.outbox.done(item, e)
+        else:
+            self.outbox.done(item)
+
+    async def _pump_outbox(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await loop.run_in_executor(self._take_executor, self.outbox.take_batch, SEND_BATCH)
+            if batch is None:
+                return
+            task = asyncio.ensure_future(asyncio.gather(*(self._send(item) for item in batch)))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def serve(self, mode="polling", url=None, secret_token=None, **webhook_options):
+        """
+        Deliver the outbox and receive updates until cancelled; mode works as in webhook.run().
+        """
+        loop = asyncio.get_running_loop()
+        pump = asyncio.ensure_future(self._pump_outbox())
+        server = None
+        try:
+            if mode == "webhook":
+                try:
+                    server = await loop.run_in_executor(None, functools.partial(
+                        webhook.start_webhook, self.bot, url, secret_token,
+                        process_updates=self.webhook_processor(loop), **webhook_options))
+                except Exception as e:
+                    logger.error(f"Webhook setup failed, falling back to polling: {e}", exc_info=True)
+                else:
+                    await asyncio.Event().wait()
+
+            await self.delete_webhook()
+            await self.polling(non_stop=True)
+        finally:
+            if server is not None:
+                server.stop()
+            await loop.run_in_executor(None, self.outbox.close)
+            await pump
+            await self.close_session()
+            self.db_executor.shutdown(wait=False)
+            self._take_executor.shutdown(wait=False)
+
+
+def run(bot, outbox, **options):
+    try:
+        asyncio.run(AsyncRuntime(bot, outbox).serve(**options))
+    except KeyboardInterrupt:
+        pass
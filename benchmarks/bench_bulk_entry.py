@@ -0,0 +1,72 @@
+"""
+Entering an order of N products: one product per message round trip
+(receive_order_data + receive_product_quantity) vs one pasted list.
+
+Message counts follow the two flows: picking a product takes the product
+message and the quantity message in, and the quantity prompt, "Mahsulot
+qo'shildi.", the cart so far and the product keyboard out. The bulk flow takes
+one message in and sends one summary.
+
+    python -m benchmarks.bench_bulk_entry [products_in_order] [repeats]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import bulk_entry
+import db
+import migrations
+import pricing
+from benchmarks import fixtures
+from catalogue import ProductCatalogue
+
+
+def enter_one_by_one(catalogue, lines):
+    cart = {}
+    for name, quantity in lines:
+        product_id = catalogue.id_by_name(name)
+        cart[product_id] = quantity
+        # receive_product_quantity re-renders the whole cart after every product
+        "".join(f"{catalogue.get(pid)[0]}: {q}\n" for pid, q in cart.items())
+    return pricing.price_cart(cart)
+
+
+def enter_pasted(catalogue, text):
+    cart, problems = bulk_entry.parse(text, catalogue.lookup)
+    return pricing.price_cart(cart)
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 25
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fixtures.build(path, users=10, products=500, orders=0)
+        db.configure(path)
+        migrations.migrate()
+        catalogue = ProductCatalogue()
+
+        lines = [(f"Mahsulot {i * 7 % 500 + 1}", i % 9 + 1) for i in range(size)]
+        text = "\n".join(f"{name.lower()} {quantity}" for name, quantity in lines)
+        assert enter_one_by_one(catalogue, lines) == enter_pasted(catalogue, text)
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            enter_one_by_one(catalogue, lines)
+        before = (time.perf_counter() - start) / repeats
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            enter_pasted(catalogue, text)
+        after = (time.perf_counter() - start) / repeats
+        db.close_all()
+
+    print(f"order of {size} products")
+    print(f"one by one : {2 * size + 1:4} messages in, {4 * size + 1:4} out, {before * 1e3:7.3f} ms of bot work")
+    print(f"pasted     : {1:4} messages in, {1:4} out, {after * 1e3:7.3f} ms of bot work")
+
+
+if __name__ == "__main__":
+    main()
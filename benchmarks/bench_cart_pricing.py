@@ -0,0 +1,86 @@
+"""
+Cart confirmation: per-product connection + SELECT + INSERT vs one IN query
+and one executemany.
+
+    python -m benchmarks.bench_cart_pricing [repeats]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import db
+import migrations
+import pricing
+from benchmarks import fixtures
+
+CART_SIZES = (1, 10, 100)
+
+
+def confirm_per_product(path, cart, user_id):
+    total_sum = 0
+    for product_id, quantity in cart.items():
+        conn = sqlite3.connect(path)
+        product_price = conn.execute("SELECT product_name, product_price FROM products WHERE product_id=?",
+                                     (product_id,)).fetchone()[1]
+        conn.close()
+        total_sum += product_price * quantity
+
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("INSERT INTO orders (user_id, total_sum, total_quantity) VALUES (?, ?, ?)",
+              (user_id, total_sum, sum(cart.values())))
+    order_id = c.lastrowid
+    for product_id, quantity in cart.items():
+        product_name, product_price = c.execute("SELECT product_name, product_price FROM products WHERE product_id=?",
+                                                (product_id,)).fetchone()
+        c.execute("INSERT INTO itemInOrder (order_id, product_id, product_name, product_price, quantity, price) "
+                  "VALUES (?, ?, ?, ?, ?, ?)", (order_id, product_id, product_name, product_price, quantity,
+                                                product_price))
+    conn.commit()
+    conn.close()
+    return total_sum
+
+
+def confirm_batched(cart, user_id):
+    lines, total_sum = pricing.price_cart(cart)
+    with db.transaction() as c:
+        c.execute("INSERT INTO orders (user_id, total_sum, total_quantity) VALUES (?, ?, ?)",
+                  (user_id, total_sum, sum(cart.values())))
+        pricing.insert_order_lines(c, c.lastrowid, [
+            (line.product_id, line.product_name, line.product_price, line.quantity, line.product_price)
+            for line in lines
+        ])
+    return total_sum
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fixtures.build(path, users=1000, products=200, orders=0)
+        db.configure(path)
+        migrations.migrate()
+
+        for size in CART_SIZES:
+            cart = {product_id: product_id % 7 + 1 for product_id in range(1, size + 1)}
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                expected = confirm_per_product(path, cart, 2)
+            before = (time.perf_counter() - start) / repeats
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                assert confirm_batched(cart, 2) == expected
+            after = (time.perf_counter() - start) / repeats
+
+            print(f"cart of {size:>3} : per product {before * 1e3:8.2f} ms | batched {after * 1e3:8.2f} ms "
+                  f"({before / after:.1f}x faster)")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
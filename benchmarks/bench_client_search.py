@@ -0,0 +1,56 @@
+"""
+Picking a client: a reply keyboard with every client vs a typed prefix
+search over the FTS5 index with one page of inline results.
+
+    python -m benchmarks.bench_client_search [clients] [repeats]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+import client_search
+import db
+import migrations
+from benchmarks import fixtures
+
+
+def keyboard_of_all_clients():
+    clients = db.query_all("SELECT * FROM users WHERE type='client'")
+    keyboard = [[{"text": f"{client[2]} {client[3]} ({client[0]})"}] for client in clients]
+    keyboard.append([{"text": "Bosh menyu"}])
+    return json.dumps({"keyboard": keyboard, "one_time_keyboard": True, "resize_keyboard": True})
+
+
+def search_page(query):
+    clients, has_more = client_search.search(query)
+    keyboard = [[{"text": f"{first_name} {last_name} ({client_id})", "callback_data": f"pick_client_{client_id}"}]
+                for client_id, first_name, last_name in clients]
+    if has_more:
+        keyboard.append([{"text": "Keyingi ➡️", "callback_data": "clients_page_1"}])
+    return json.dumps({"inline_keyboard": keyboard})
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fixtures.build(path, users=clients, products=10, orders=0)
+        db.configure(path)
+        migrations.migrate()
+        assert "(1234)" in search_page("ism123")
+
+        for name, build in (("all clients", keyboard_of_all_clients), ("prefix search", lambda: search_page("ism12"))):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                payload = build()
+            elapsed = (time.perf_counter() - start) / repeats
+            print(f"{name:13}: {elapsed * 1e3:7.3f} ms, {len(payload.encode()):8,} bytes of reply_markup")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Handler latency with a fresh connection per helper call vs the pooled db layer.
+
+A single admin keypress runs roughly eight user/product lookups, each of which
+used to open data.db, log "Database connection established." and close it.
+
+    python -m benchmarks.bench_connection [iterations]
+"""
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import db
+from benchmarks import fixtures
+
+KEYPRESS_QUERIES = [
+    ("SELECT * FROM users WHERE telegram_id=?", ('1500',)),
+    ("SELECT * FROM users WHERE telegram_id=?", ('1500',)),
+    ("SELECT type FROM users WHERE telegram_id=?", ('1500',)),
+    ("SELECT * FROM users WHERE user_id=?", (5,)),
+    ("SELECT discount FROM users WHERE user_id=?", (5,)),
+    ("SELECT debt FROM users WHERE user_id=?", (5,)),
+    ("SELECT product_id FROM products WHERE product_name=?", ('Mahsulot 7',)),
+    ("SELECT * FROM users WHERE telegram_id=?", ('1500',)),
+]
+
+
+def keypress_per_call_connection(path):
+    for sql, params in KEYPRESS_QUERIES:
+        conn = sqlite3.connect(path)
+        logging.info("Database connection established.")
+        conn.execute(sql, params).fetchone()
+        conn.close()
+
+
+def keypress_pooled():
+    for sql, params in KEYPRESS_QUERIES:
+        db.query_one(sql, params)
+
+
+def measure(func, iterations, *args):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(*args)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fixtures.build(path, users=1000, products=50)
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s",
+                            handlers=[logging.FileHandler(os.path.join(tmp, "bench.log"), encoding='utf-8')])
+
+        before = measure(keypress_per_call_connection, iterations, path)
+        db.configure(path)
+        after = measure(keypress_pooled, iterations)
+        db.close_all()
+
+    print(f"{len(KEYPRESS_QUERIES)} lookups per keypress, {iterations} keypresses")
+    print(f"connection per call : {before:8.1f} us/keypress")
+    print(f"pooled connection   : {after:8.1f} us/keypress ({before / after:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
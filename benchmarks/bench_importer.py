@@ -0,0 +1,75 @@
+"""
+Bulk order import from a synthetic sheet export: rows per second with one
+transaction per order vs batch_size orders per transaction.
+
+    python -m benchmarks.bench_importer [lines] [batch_size]
+"""
+import os
+import random
+import sys
+import tempfile
+
+import db
+import importer
+import migrations
+from benchmarks import fixtures
+from catalogue import ProductCatalogue
+
+HEADER = "Наименование товара  Цена  Количество(кб)  Оплата  Перечисление  Остаток долга"
+
+
+def write_export(path, lines, clients, products, seed=1):
+    """
+    Write orders in the sheet format until the file has about `lines` lines; return the order count.
+    """
+    rng = random.Random(seed)
+    written = orders = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < lines:
+            client = rng.randrange(clients)
+            items = [(rng.randrange(products), rng.randrange(1, 20)) for _ in range(rng.randrange(5, 15))]
+            total_sum = sum((1000 + 250 * (p % 40)) * q for p, q in items)
+            total_quantity = sum(q for _, q in items)
+            f.write(f"Mijoz {client}  Qarz  0 so'm  Sana  {rng.randrange(1, 29):02d},03,2025\n")
+            f.write(HEADER + "\n")
+            for p, q in items:
+                f.write(f"Mahsulot {p + 1}  {1000 + 250 * (p % 40)} so'm  {q}  0  0  0\n")
+            f.write(f"Jami  {total_sum} so'm  0  0  {total_sum} so'm\n")
+            f.write(f"Jami miqdor  -  {total_quantity}  0  {total_sum} so'm\n\n")
+            written += len(items) + 5
+            orders += 1
+    return orders
+
+
+def run(export, batch_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fixtures.build(path, users=200, products=500, orders=0)
+        db.configure(path)
+        migrations.migrate()
+        db.execute("UPDATE users SET saved_name = 'Mijoz ' || (user_id - 2) WHERE type = 'client'")
+        # Prices in the export follow 1000 + 250 * (index % 40)
+        db.execute("UPDATE products SET product_price = 1000 + 250 * ((product_id - 1) % 40)")
+        with open(export, encoding="utf-8") as f:
+            report = importer.import_orders(importer.text_rows(f), ProductCatalogue(), batch_size=batch_size)
+        db.close_all()
+    return report
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export = os.path.join(tmp, "export.txt")
+        orders = write_export(export, lines, clients=200, products=500)
+        print(f"{lines} lines, {orders} orders")
+        for size in (1, batch_size):
+            report = run(export, size)
+            assert not report.rejected, report.rejected[:3]
+            print(f"batch_size={size:4}: {report.rows:7} rows in {report.elapsed:6.2f} s, "
+                  f"{report.rows_per_second:9,.0f} rows/s, {report.orders} orders")
+
+
+if __name__ == "__main__":
+    main()
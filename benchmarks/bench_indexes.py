@@ -0,0 +1,75 @@
+"""
+Lookup cost on the hot columns before and after migrations.migrate().
+
+Builds an unindexed legacy database (100k clients, 1M order lines by default),
+times the membership / order lookups the handlers run, migrates, and times them
+again.
+
+    python -m benchmarks.bench_indexes [clients] [orders] [lines_per_order]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import db
+import migrations
+from benchmarks import fixtures
+
+
+def lookups(clients, orders):
+    rng = random.Random(7)
+    telegram_id = str(rng.randrange(1001, clients + 1001))
+    user_id = rng.randrange(2, clients + 2)
+    order_id = rng.randrange(1, orders + 1)
+    return {
+        "user by telegram_id": ("SELECT * FROM users WHERE telegram_id=?", (telegram_id,)),
+        "admins by type": ("SELECT telegram_id FROM users WHERE type='admin'", ()),
+        "orders by user_id": ("SELECT * FROM orders WHERE user_id = ?", (user_id,)),
+        "lines by order_id": ("SELECT product_name, quantity, product_price FROM itemInOrder WHERE order_id = ?",
+                              (order_id,)),
+        "payments by user_id": ("SELECT * FROM payments WHERE user_id = ?", (telegram_id,)),
+    }
+
+
+def time_queries(queries, repeat):
+    results = {}
+    for name, (sql, params) in queries.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            db.query_all(sql, params)
+        results[name] = (time.perf_counter() - start) / repeat * 1e3
+    return results
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    orders = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    lines_per_order = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        start = time.perf_counter()
+        fixtures.build(path, users=clients, products=200, orders=orders, lines_per_order=lines_per_order)
+        print(f"built {clients:,} clients, {orders * lines_per_order:,} order lines "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        db.configure(path)
+        queries = lookups(clients, orders)
+        before = time_queries(queries, repeat=5)
+
+        start = time.perf_counter()
+        migrations.migrate()
+        print(f"migrate() took {time.perf_counter() - start:.1f}s\n")
+
+        after = time_queries(queries, repeat=200)
+        db.close_all()
+
+    print(f"{'lookup':<22}{'before ms':>12}{'after ms':>12}")
+    for name in queries:
+        print(f"{name:<22}{before[name]:>12.3f}{after[name]:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
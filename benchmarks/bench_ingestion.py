@@ -0,0 +1,106 @@
+"""
+Update ingestion: long polling vs the webhook server, against the local fake
+Bot API.
+
+Latency is measured from the moment the fake API receives an update to the
+moment the bot's handler runs, for updates arriving one at a time; throughput
+is the time to handle a burst of updates.
+
+    python -m benchmarks.bench_ingestion [spaced_updates] [burst_updates] [latency]
+"""
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import telebot
+from telebot import apihelper
+
+import webhook
+from benchmarks.fake_bot_api import FakeBotApi, make_update
+
+SECRET = "bench-secret"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Recorder:
+    def __init__(self, bot):
+        self.pushed = {}
+        self.handled = {}
+        self._done = threading.Condition()
+        bot.message_handler(func=lambda m: True)(self.handle)
+
+    def handle(self, message):
+        with self._done:
+            self.handled[int(message.text)] = time.perf_counter()
+            self._done.notify_all()
+
+    def push(self, api, n):
+        self.pushed[n] = time.perf_counter()
+        api.push_update(make_update(n))
+
+    def wait_for(self, count, timeout=60):
+        with self._done:
+            return self._done.wait_for(lambda: len(self.handled) >= count, timeout)
+
+
+def measure(api, recorder, spaced, burst):
+    for n in range(spaced):
+        recorder.push(api, n)
+        time.sleep(0.01)
+    recorder.wait_for(spaced)
+    latencies = sorted((recorder.handled[n] - recorder.pushed[n]) * 1e3 for n in range(spaced))
+
+    start = time.perf_counter()
+    for n in range(spaced, spaced + burst):
+        recorder.push(api, n)
+    recorder.wait_for(spaced + burst)
+    elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+
+def report(name, latencies, elapsed, burst):
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:8}: latency median {statistics.median(latencies):6.1f} ms, p95 {p95:6.1f} ms | "
+          f"burst of {burst} in {elapsed:5.2f} s ({burst / elapsed:7.0f} updates/s)")
+
+
+def main():
+    spaced = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    burst = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.02
+
+    # Polling
+    api = FakeBotApi(latency=latency).start()
+    apihelper.API_URL = api.url
+    bot = telebot.TeleBot("123456:FAKE")
+    recorder = Recorder(bot)
+    thread = threading.Thread(target=bot.polling, kwargs={'interval': 0, 'long_polling_timeout': 1}, daemon=True)
+    thread.start()
+    latencies, elapsed = measure(api, recorder, spaced, burst)
+    bot.stop_polling()
+    thread.join(timeout=5)
+    api.stop()
+    report("polling", latencies, elapsed, burst)
+
+    # Webhook
+    api = FakeBotApi(latency=latency).start()
+    apihelper.API_URL = api.url
+    bot = telebot.TeleBot("123456:FAKE")
+    recorder = Recorder(bot)
+    port = free_port()
+    server = webhook.start_webhook(bot, f"http://127.0.0.1:{port}/webhook", SECRET, host="127.0.0.1", port=port)
+    latencies, elapsed = measure(api, recorder, spaced, burst)
+    server.stop()
+    api.stop()
+    report("webhook", latencies, elapsed, burst)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Inline queries while an admin types a product name: scanning the products
+table on every keystroke vs the catalogue's word index behind the per-prefix
+TTL cache.
+
+    python -m benchmarks.bench_inline [products] [repeats]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import db
+import inline_search
+import migrations
+from benchmarks import fixtures
+from catalogue import ProductCatalogue
+
+
+def scan(query):
+    return db.query_all("SELECT product_id, product_name, product_price FROM products "
+                        "WHERE product_name LIKE ? ORDER BY product_id LIMIT ?",
+                        (f"%{query}%", inline_search.MAX_RESULTS))
+
+
+def main():
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    probe = max(products // 2, 1)
+    typed = f"mahsulot {probe}"
+    keystrokes = [typed[:i] for i in range(1, len(typed) + 1)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fixtures.build(path, users=10, products=products, orders=0)
+        db.configure(path)
+        migrations.migrate()
+        lookup = inline_search.InlineSearch(ProductCatalogue())
+        assert lookup.products(typed)[0][0] == probe
+
+        for name, answer in (("table scan", scan), ("cached index", lookup.products)):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                for query in keystrokes:
+                    answer(query)
+            elapsed = (time.perf_counter() - start) / (repeats * len(keystrokes))
+            print(f"{name:12}: {elapsed * 1e3:7.3f} ms/keystroke")
+        print(f"cache: {lookup.stats()}")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
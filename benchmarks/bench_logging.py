@@ -0,0 +1,52 @@
+"""
+Cost of a log call on the handler thread: the old basicConfig FileHandler
+(formatted and written synchronously) vs logging_setup's QueueHandler, and
+the per-message DEBUG records unsampled vs sampled 1 in 100 by a
+SampledLogger, which drops calls before building the record.
+
+    python -m benchmarks.bench_logging [records]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import logging_setup
+
+
+def measure(records, log=None):
+    log = log or logging.getLogger("bot.messages")
+    start = time.perf_counter()
+    for i in range(records):
+        log.debug("User %s sent: %s", 1000 + i % 50, "Pomidor 5")
+    return (time.perf_counter() - start) / records
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = logging.getLogger()
+        handler = logging.FileHandler(os.path.join(tmp, "sync.log"), encoding='utf-8')
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG)
+        sync = measure(records)
+        root.removeHandler(handler)
+        handler.close()
+
+        logging_setup.configure(log_file=os.path.join(tmp, "queued.log"), level="DEBUG", console=False)
+        queued = measure(records)
+        logging_setup.configure(log_file=os.path.join(tmp, "sampled.log"), level="DEBUG", console=False,
+                                sample_rates={"bot.messages": 100})
+        sampled = measure(records, logging_setup.SampledLogger("bot.messages"))
+        logging_setup.shutdown()
+
+    print(f"sync FileHandler : {sync * 1e6:6.2f} us/record on the handler thread")
+    print(f"QueueHandler     : {queued * 1e6:6.2f} us/record")
+    print(f"sampled 1/100    : {sampled * 1e6:6.2f} us/record")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Overhead of metrics.Metrics.instrument() on update processing: the same
+router-dispatched handler (three queries and one queued reply) with and
+without instrumentation, then a sample of what /metrics exports.
+
+    python -m benchmarks.bench_metrics [updates]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import telebot
+from telebot.types import Update
+
+import db
+import metrics
+import migrations
+from benchmarks import fixtures
+from benchmarks.fake_bot_api import make_update
+from router import Router
+
+
+class QueueOnly:
+    def __init__(self):
+        self.queued = 0
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.queued += 1
+
+
+def build_bot(outbox):
+    bot = telebot.TeleBot("0:bench", threaded=False)
+    router = Router(lambda message: None)
+
+    @router.fallback
+    def handle(message):
+        db.query_one("SELECT user_id, type FROM users WHERE telegram_id=?", ("1001",))
+        db.query_one("SELECT debt FROM users WHERE user_id=?", (2,))
+        db.query_all("SELECT * FROM orders WHERE user_id=? LIMIT 5", (2,))
+        outbox.send_message(message.chat.id, "ok")
+
+    @bot.message_handler(func=lambda message: True)
+    def dispatch_message(message):
+        router.dispatch(message)
+
+    return bot, router, dispatch_message
+
+
+def run(bot, updates):
+    start = time.perf_counter()
+    for update in updates:
+        bot.process_new_updates([update])
+    return (time.perf_counter() - start) / len(updates)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    updates = [Update.de_json(dict(make_update(n), update_id=n)) for n in range(count)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fixtures.build(path, users=100, products=10, orders=1000)
+        db.configure(path)
+        migrations.migrate()
+
+        plain, _, _ = build_bot(QueueOnly())
+        before = run(plain, updates)
+
+        outbox = QueueOnly()
+        instrumented, router, dispatch = build_bot(outbox)
+        collected = metrics.Metrics()
+        collected.instrument(instrumented, router=router, outbox=outbox, dispatch=dispatch)
+        after = run(instrumented, updates)
+        db.close_all()
+
+    print(f"plain        : {before * 1e6:7.1f} us/update")
+    print(f"instrumented : {after * 1e6:7.1f} us/update ({(after - before) * 1e6:+.1f} us)")
+    summary = collected.summary()
+    print(f"updates={summary['updates']} queries/update={summary['queries_per_update']:.1f} "
+          f"api calls/update={summary['api_calls_per_update']:.1f} handlers={summary['handlers']}")
+    print("\n".join(line for line in collected.render().splitlines() if "_bucket" not in line))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Admin order listing: per-order item/name queries (2N+1) vs one streamed JOIN.
+
+    python -m benchmarks.bench_order_listing [orders] [lines_per_order]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import db
+import migrations
+import order_reports
+from benchmarks import fixtures
+
+
+def list_orders_n_plus_one(path):
+    conn = sqlite3.connect(path)
+    orders = conn.execute("SELECT * FROM orders").fetchall()
+    conn.close()
+    result = []
+    for order in orders:
+        conn = sqlite3.connect(path)
+        products = conn.execute("SELECT product_name, quantity, product_price FROM itemInOrder WHERE order_id = ?",
+                                (order[0],)).fetchall()
+        conn.close()
+        conn = sqlite3.connect(path)
+        name = conn.execute("SELECT first_name, last_name FROM users WHERE user_id=?", (order[1],)).fetchone()
+        conn.close()
+        result.append((order, name, products))
+    return len(result)
+
+
+def list_orders_joined():
+    return sum(1 for _ in order_reports.iter_orders())
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    lines_per_order = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fixtures.build(path, users=1000, products=200, orders=orders, lines_per_order=lines_per_order)
+        db.configure(path)
+        migrations.migrate()
+
+        start = time.perf_counter()
+        count = list_orders_n_plus_one(path)
+        before = time.perf_counter() - start
+
+        start = time.perf_counter()
+        assert list_orders_joined() == count
+        after = time.perf_counter() - start
+        db.close_all()
+
+    print(f"{count:,} orders, {count * lines_per_order:,} lines")
+    print(f"2N+1 connections : {before * 1e3:9.1f} ms")
+    print(f"single JOIN      : {after * 1e3:9.1f} ms ({before / after:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
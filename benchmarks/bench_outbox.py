@@ -0,0 +1,81 @@
+"""
+Handler-side cost of sending replies: direct bot.send_message vs the outbox,
+against the local fake Bot API.
+
+Each simulated update sends what receive_product_quantity sends: two plain
+texts and a third one carrying a keyboard. The fake API answers after
+`latency` seconds and floods out chats that send more often than every
+`chat_interval` seconds, so retries on 429 are exercised as well.
+
+    python -m benchmarks.bench_outbox [chats] [updates_per_chat] [latency]
+"""
+import sys
+import time
+
+import telebot
+from telebot import apihelper
+from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from benchmarks.fake_bot_api import FakeBotApi
+from outbox import Outbox
+
+
+def handle_update(send, chat_id, n):
+    markup = InlineKeyboardMarkup()
+    markup.add(InlineKeyboardButton("OK", callback_data=f"ok_{n}"))
+    send(chat_id, "Mahsulot qo'shildi.")
+    send(chat_id, f"Savat #{n}")
+    send(chat_id, "Iltimos, mahsulotni tanlang:", reply_markup=markup)
+
+
+def run(send, chats, updates):
+    start = time.perf_counter()
+    for n in range(updates):
+        for chat_id in range(1, chats + 1):
+            handle_update(send, chat_id, n)
+    return time.perf_counter() - start
+
+
+def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    total = chats * updates
+
+    api = FakeBotApi(latency=latency, chat_interval=0.5).start()
+    apihelper.API_URL = api.url
+    bot = telebot.TeleBot("123456:FAKE")
+
+    def send_direct(chat_id, text, **kwargs):
+        try:
+            bot.send_message(chat_id, text, **kwargs)
+        except apihelper.ApiTelegramException:
+            pass
+
+    direct = run(send_direct, chats, updates)
+    direct_calls = len(api.sent_messages())
+    direct_rejected = api.rejected
+
+    api.reset()
+    outbox = Outbox(bot.send_message)
+    outbox.start()
+    queued = run(outbox.send_message, chats, updates)
+    start = time.perf_counter()
+    outbox.flush()
+    drained = queued + time.perf_counter() - start
+    outbox.close()
+    api.stop()
+
+    stats = outbox.stats()
+    delivered = sum(params['text'].count("Iltimos") for _, params in api.sent_messages())
+    print(f"{total} updates x 3 messages, {chats} chats, {latency * 1e3:.0f} ms API latency")
+    print(f"direct send : handlers {direct * 1e3:8.1f} ms total, {direct / total * 1e3:6.2f} ms/update, "
+          f"{direct_calls} API calls ({direct_rejected} rejected with 429 and lost)")
+    print(f"outbox      : handlers {queued * 1e3:8.1f} ms total, {queued / total * 1e3:6.2f} ms/update, "
+          f"{len(api.sent_messages())} API calls, drained in {drained:.2f} s")
+    print(f"              coalesced {stats['coalesced']}, 429 retried {stats['rate_limited']}, "
+          f"failed {stats['failed']}, updates delivered {delivered}/{total}")
+
+
+if __name__ == "__main__":
+    main()
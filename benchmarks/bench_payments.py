@@ -0,0 +1,76 @@
+"""
+Payment confirmation: overwriting users.debt and total_debt on every
+confirmed order of the client vs one ledger entry; then confirming pending
+payments one callback at a time vs as one /pending_payments batch.
+
+    python -m benchmarks.bench_payments [orders_per_client] [payments]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import db
+import ledger
+import migrations
+import payments as payment_approval
+from benchmarks import fixtures
+
+
+def confirm_rewriting_orders(user_id, amount):
+    with db.transaction() as c:
+        current_debt = c.execute("SELECT debt FROM users WHERE user_id=?", (user_id,)).fetchone()[0]
+        new_debt = max(current_debt - amount, 0)
+        c.execute("UPDATE users SET debt=? WHERE user_id=?", (new_debt, user_id))
+        c.execute("UPDATE orders SET total_debt = ? WHERE user_id=? AND is_confirmed=1", (new_debt, user_id))
+        return c.rowcount + 1
+
+
+def confirm_with_ledger(user_id, amount):
+    with db.transaction() as c:
+        ledger.post(c, user_id, ledger.PAYMENT, -amount)
+        return 2  # users row + ledger row
+
+
+def main():
+    orders_per_client = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    payments = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    clients = 20
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fixtures.build(path, users=clients, products=50, orders=clients * orders_per_client, lines_per_order=1)
+        db.configure(path)
+        migrations.migrate()
+        db.execute("UPDATE users SET debt = 10000000000")
+        user_id = 2
+
+        for name, confirm in (("rewrite orders", confirm_rewriting_orders), ("ledger entry", confirm_with_ledger)):
+            start = time.perf_counter()
+            for _ in range(payments):
+                rows = confirm(user_id, 1000)
+            elapsed = (time.perf_counter() - start) / payments
+            print(f"{name:15}: {elapsed * 1e3:7.3f} ms/payment, {rows:5} rows written")
+
+        def add_pending():
+            with db.transaction() as c:
+                c.executemany("INSERT INTO payments (user_id, amount, is_confirmed) VALUES (?, 1000, 0)",
+                              [(str(1001 + i % clients),) for i in range(payments)])
+            return [row[0] for row in db.query_all("SELECT payment_id FROM payments WHERE is_confirmed = 0")]
+
+        pending = add_pending()
+        start = time.perf_counter()
+        for payment_id in pending:
+            payment_approval.confirm([payment_id])
+        one_by_one = time.perf_counter() - start
+        pending = add_pending()
+        start = time.perf_counter()
+        assert len(payment_approval.confirm(pending)) == len(pending)
+        batch = time.perf_counter() - start
+        print(f"{payments} pending payments of {clients} clients: one by one {one_by_one * 1e3:.1f} ms, "
+              f"one batch {batch * 1e3:.1f} ms")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+/report figures: scanning orders and itemInOrder vs reading the sales_daily*
+aggregates that add_order and delete_order_by_id keep up to date.
+
+    python -m benchmarks.bench_report [orders] [repeats]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import db
+import migrations
+import sales
+from benchmarks import fixtures
+
+START, END = "2025-03-01", "2025-03-31"
+
+
+def report_by_scan():
+    totals = db.query_one("SELECT COUNT(*), SUM(total_quantity), SUM(total_sum) FROM orders "
+                          "WHERE substr(order_date, 1, 10) BETWEEN ? AND ?", (START, END))
+    top = db.query_all('''
+        SELECT i.product_name, SUM(i.quantity) AS sold, SUM(i.quantity * i.price)
+        FROM itemInOrder i JOIN orders o ON o.order_id = i.order_id
+        WHERE substr(o.order_date, 1, 10) BETWEEN ? AND ?
+        GROUP BY i.product_id ORDER BY sold DESC LIMIT 10''', (START, END))
+    return tuple(totals), [row[1:] for row in top]
+
+
+def report_from_aggregates():
+    return tuple(sales.totals(START, END)), [row[1:] for row in sales.top_products(START, END)]
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fixtures.build(path, users=1000, products=200, orders=orders, lines_per_order=None)
+        db.configure(path)
+        start = time.perf_counter()
+        migrations.migrate()
+        print(f"{orders} orders, migrations incl. backfill: {time.perf_counter() - start:.2f} s")
+        assert report_by_scan() == report_from_aggregates()
+
+        for name, report in (("full scan", report_by_scan), ("aggregates", report_from_aggregates)):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                report()
+            print(f"{name:10}: {(time.perf_counter() - start) / repeats * 1e3:8.3f} ms/report")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
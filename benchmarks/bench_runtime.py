@@ -0,0 +1,117 @@
+"""
+Concurrent-update throughput of the sync runtime (threaded TeleBot + outbox
+sender threads) vs the asyncio runtime, against the local fake Bot API.
+
+Every update runs the same handler under both runtimes: one SQLite lookup,
+a reply to the sender and a notification to each admin, like
+handle_confirm_order_callback. The outbox rate limits are lifted so the
+runtimes themselves are measured.
+
+    python -m benchmarks.bench_runtime [updates] [latency]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import telebot
+from telebot import apihelper, asyncio_helper
+
+import async_runtime
+import db
+import migrations
+from benchmarks import fixtures
+from benchmarks.fake_bot_api import FakeBotApi, make_update
+from outbox import Outbox
+
+ADMINS = ("1", "2", "3")
+UNLIMITED = 1_000_000
+
+
+def make_outbox(bot):
+    return Outbox(bot.send_message, global_rate=UNLIMITED, chat_rate=UNLIMITED, chat_burst=UNLIMITED)
+
+
+def register_handler(bot, outbox):
+    @bot.message_handler(func=lambda m: True)
+    def handle(message):
+        total = db.query_one("SELECT total_sum FROM orders WHERE order_id=?", (int(message.text) % 1000 + 1,))[0]
+        outbox.send_message(message.chat.id, f"Buyurtma tasdiqlandi: {total:,}")
+        for admin in ADMINS:
+            outbox.send_message(admin, f"📢 Buyurtma tasdiqlandi: {total:,}", parse_mode="Markdown")
+
+
+def push_and_wait(api, updates):
+    expected = updates * (1 + len(ADMINS))
+    start = time.perf_counter()
+    for n in range(updates):
+        update = make_update(n)
+        update['message']['chat']['id'] = update['message']['from']['id'] = 10_000 + n
+        api.push_update(update)
+    # Sends to the same admin may be coalesced, so count delivered texts rather than API calls
+    while sum(params['text'].count("Buyurtma tasdiqlandi") for _, params in api.sent_messages()) < expected:
+        time.sleep(0.005)
+    return time.perf_counter() - start
+
+
+def bench_sync(api, updates):
+    bot = telebot.TeleBot("123456:FAKE")
+    outbox = make_outbox(bot)
+    register_handler(bot, outbox)
+    outbox.start()
+    thread = threading.Thread(target=bot.polling, kwargs={'interval': 0, 'long_polling_timeout': 1}, daemon=True)
+    thread.start()
+    elapsed = push_and_wait(api, updates)
+    bot.stop_polling()
+    thread.join(timeout=5)
+    outbox.close()
+    return elapsed
+
+
+def bench_async(api, updates):
+    bot = telebot.TeleBot("123456:FAKE", threaded=False)
+    outbox = make_outbox(bot)
+    register_handler(bot, outbox)
+    runtime = async_runtime.AsyncRuntime(bot, outbox)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(runtime.serve())
+
+    def run_loop():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=run_loop, daemon=True)
+    thread.start()
+    elapsed = push_and_wait(api, updates)
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(timeout=5)
+    return elapsed
+
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fixtures.build(path, users=1000, products=50, orders=1000, lines_per_order=5)
+        db.configure(path)
+        migrations.migrate()
+
+        print(f"{updates} concurrent updates, {1 + len(ADMINS)} sends each, {latency * 1e3:.0f} ms API latency")
+        for name, bench in (("sync", bench_sync), ("async", bench_async)):
+            api = FakeBotApi(latency=latency).start()
+            apihelper.API_URL = asyncio_helper.API_URL = api.url
+            elapsed = bench(api, updates)
+            api.stop()
+            print(f"{name:6}: {elapsed:6.2f} s, {updates / elapsed:7.1f} updates/s, "
+                  f"{len(api.sent_messages())} API calls")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
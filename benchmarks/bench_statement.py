@@ -0,0 +1,78 @@
+"""
+Account statement for a client with a long history: the whole history built
+as one string in memory vs statement.export() streaming into a spooled file.
+
+    python -m benchmarks.bench_statement [orders] [lines_per_order]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import db
+import migrations
+import order_reports
+import statement
+from benchmarks import fixtures
+
+CLIENT = 2
+
+
+def history_in_memory():
+    text = ""
+    for order in order_reports.iter_orders(CLIENT):
+        text += "".join(f"{name} ({quantity} x {price:,})\n" for name, quantity, price in order.products)
+        text += f"{order.order_date} {order.total_sum:,} {order.total_debt:,}\n\n"
+    return len(text.encode())
+
+
+def history_spooled(upto):
+    with statement.export(CLIENT, upto) as document:
+        document.seek(0, os.SEEK_END)
+        return document.tell()
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    size = func(*args)
+    elapsed = time.perf_counter() - start
+    # Memory on a second run: tracemalloc slows everything down
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    lines_per_order = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        # A single client, so every order is theirs
+        fixtures.build(path, users=1, products=200, orders=orders, lines_per_order=lines_per_order, payments=orders // 4)
+        db.configure(path)
+        migrations.migrate()
+        # Book the generated history in the ledger the way add_order and payment confirmation do
+        with db.transaction() as c:
+            c.execute("DELETE FROM ledger")
+            c.execute("INSERT INTO ledger (user_id, kind, amount, balance, created_at, order_id) "
+                      "SELECT user_id, 'order', total_sum, total_debt, order_date || ' 12:00:00', order_id FROM orders")
+            c.execute("INSERT INTO ledger (user_id, kind, amount, balance, created_at, payment_id) "
+                      "SELECT ?, 'payment', -amount, 0, '2026-01-01 12:00:00', payment_id FROM payments "
+                      "WHERE is_confirmed = 1", (CLIENT,))
+        upto = statement.version(CLIENT)
+
+        results = [("one message string", *measure(history_in_memory)),
+                   ("spooled CSV", *measure(history_spooled, upto))]
+        db.close_all()
+
+    print(f"{orders:,} orders x {lines_per_order} lines, {orders // 4:,} payments")
+    for name, size, elapsed, peak in results:
+        print(f"{name:18}: {elapsed * 1e3:8.1f} ms, {size / 1e6:6.2f} MB out, peak Python memory {peak / 1e6:7.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
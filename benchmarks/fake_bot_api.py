@@ -0,0 +1,195 @@
+"""
+Local stand-in for the Telegram Bot API.
+
+Serves /bot<token>/<method> on 127.0.0.1 with a configurable latency, records
+every call, and answers sendMessage with 429 + retry_after when a chat sends
+faster than chat_interval allows (the way Telegram floods out a bot), so the
+outbox can be exercised without touching api.telegram.org.
+
+Updates injected with push_update() are served through long-polling
+getUpdates, or POSTed to the URL registered with setWebhook (with the secret
+token header) once a webhook is set, like the real API.
+
+    api = FakeBotApi(latency=0.05).start()
+    telebot.apihelper.API_URL = api.url
+    ...
+    api.stop()
+"""
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# Telegram's default max_connections for webhook delivery
+WEBHOOK_CONNECTIONS = 40
+
+
+def make_update(n):
+    """
+    A text message update (without update_id) whose text is n, for push_update() or de_json.
+    """
+    return {'message': {
+        'message_id': n, 'date': int(time.time()), 'text': str(n),
+        'chat': {'id': 1, 'type': 'private'}, 'from': {'id': 1, 'is_bot': False, 'first_name': 'Bench'},
+    }}
+
+
+class FakeBotApi:
+    def __init__(self, latency=0.0, chat_interval=0.0, retry_after=1):
+        self.latency = latency
+        self.chat_interval = chat_interval
+        self.retry_after = retry_after
+        self.calls = []  # (monotonic time, method, params)
+        self.rejected = 0
+        self._last_sent = {}
+        self._message_id = 0
+        self._lock = threading.Lock()
+        self._updates_ready = threading.Condition(self._lock)
+        self._updates = []
+        self._update_id = 0
+        self._webhook = None  # (url, secret_token)
+        self._delivery = None
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, as clients (requests, aiohttp) expect from the real API
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+            def _handle(self):
+                # aiohttp sends getUpdates as a GET with a form body
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                url = urlsplit(self.path)
+                method = url.path.rsplit("/", 1)[-1]
+                params = dict(parse_qsl(url.query))
+                if body and self.headers.get('Content-Type', '').startswith('application/json'):
+                    params.update(json.loads(body))
+                elif body:
+                    params.update(parse_qsl(body.decode()))
+                status, payload = api.handle(method, params)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler, bind_and_activate=False)
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 128
+        self._server.server_bind()
+        self._server.server_activate()
+        threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._delivery is not None:
+            self._delivery.shutdown(wait=False)
+
+    def push_update(self, update):
+        """
+        Make an update available to the bot; update_id is assigned here.
+        """
+        with self._lock:
+            self._update_id += 1
+            update = dict(update, update_id=self._update_id)
+            webhook = self._webhook
+            if webhook is None:
+                self._updates.append(update)
+                self._updates_ready.notify_all()
+                return
+            if self._delivery is None:
+                self._delivery = ThreadPoolExecutor(WEBHOOK_CONNECTIONS, thread_name_prefix="fake-webhook")
+        self._delivery.submit(self._post_update, webhook, update)
+
+    def _post_update(self, webhook, update):
+        url, secret_token = webhook
+        headers = {'Content-Type': 'application/json'}
+        if secret_token:
+            headers['X-Telegram-Bot-Api-Secret-Token'] = secret_token
+        request = urllib.request.Request(url, json.dumps(update).encode(), headers)
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+
+    def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        deadline = time.monotonic() + float(params.get('timeout') or 0)
+        with self._lock:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._updates_ready.wait(deadline - time.monotonic())
+            return list(self._updates[:int(params.get('limit') or 100)])
+
+    def handle(self, method, params):
+        if self.latency:
+            time.sleep(self.latency)
+        if method == 'setWebhook':
+            with self._lock:
+                # remove_webhook() is setWebhook with an empty url
+                self._webhook = (params['url'], params.get('secret_token')) if params.get('url') else None
+            return 200, {'ok': True, 'result': True}
+        if method == 'deleteWebhook':
+            with self._lock:
+                self._webhook = None
+            return 200, {'ok': True, 'result': True}
+        if method == 'getUpdates':
+            if self._webhook is not None:
+                return 409, {'ok': False, 'error_code': 409,
+                             'description': "Conflict: can't use getUpdates method while webhook is active"}
+            return 200, {'ok': True, 'result': self._get_updates(params)}
+        now = time.monotonic()
+        with self._lock:
+            if method == 'sendMessage':
+                chat_id = str(params.get('chat_id'))
+                last = self._last_sent.get(chat_id)
+                if last is not None and now - last < self.chat_interval:
+                    self.rejected += 1
+                    return 429, {'ok': False, 'error_code': 429,
+                                 'description': f"Too Many Requests: retry after {self.retry_after}",
+                                 'parameters': {'retry_after': self.retry_after}}
+                self._last_sent[chat_id] = now
+            self.calls.append((now, method, params))
+            self._message_id += 1
+            message_id = self._message_id
+
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}}
+        if method == 'sendMessage':
+            chat_id = int(params.get('chat_id'))
+            return 200, {'ok': True, 'result': {
+                'message_id': message_id, 'date': int(time.time()), 'text': params.get('text', ''),
+                'chat': {'id': chat_id, 'type': 'private'},
+            }}
+        return 200, {'ok': True, 'result': True}
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.rejected = 0
+            self._last_sent.clear()
+
+    def sent_messages(self):
+        with self._lock:
+            return [(at, params) for at, method, params in self.calls if method == 'sendMessage']
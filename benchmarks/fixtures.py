@@ -0,0 +1,193 @@
+"""
+Synthetic databases for the benchmarks.
+
+create_legacy_schema() reproduces the drifted production data.db (no indexes,
+no schema version) so migrations can be measured against it; populate() fills
+it at any scale, and the benchmarks migrate the result like the bot does at
+startup.
+
+Run as a module it builds a standalone, migrated data.db:
+
+    python -m benchmarks.fixtures PATH [clients] [orders] [payments] [products]
+
+Rows are written with batched executemany under FAST_INSERT_PRAGMAS: 1M
+clients, 1.5M orders and 500k payments (11M rows) build in about 30 s, and
+migrating them takes another 40 s.
+"""
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+# Throwaway databases only: no fsync, no rollback journal, a 256 MB page cache
+FAST_INSERT_PRAGMAS = (
+    "PRAGMA synchronous=OFF",
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA cache_size=-262144",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA locking_mode=EXCLUSIVE",
+)
+
+BATCH_ROWS = 50_000
+
+# Realistic orders: mostly a handful of lines, with a tail of bulk orders up to MAX_LINES
+MEAN_LINES = 6
+MAX_LINES = 40
+
+# Pareto shape giving roughly 80% of orders to 20% of clients and products
+SKEW = 1.16
+
+FIRST_DAY = date(2025, 1, 1)
+DAYS = 365
+
+
+def create_legacy_schema(conn):
+    conn.executescript('''
+        CREATE TABLE users
+            (user_id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, first_name TEXT, last_name TEXT, type TEXT,
+             saved_name TEXT, debt INTEGER, telegram_id TEXT, discount INTEGER DEFAULT 0);
+        CREATE TABLE products (product_id INTEGER PRIMARY KEY, product_name TEXT, product_price INTEGER);
+        CREATE TABLE orders
+            (order_id INTEGER PRIMARY KEY, user_id INTEGER, order_date TEXT, total_sum INTEGER, total_quantity INTEGER,
+             total_debt INTEGER, before_order_debt INTEGER, is_confirmed INTEGER);
+        CREATE TABLE itemInOrder
+            (order_id INTEGER, product_id INTEGER, quantity INTEGER, price INTEGER, product_name TEXT,
+             product_price INTEGER);
+        CREATE TABLE payments
+            (payment_id INTEGER PRIMARY KEY, user_id INTEGER, amount INTEGER, is_confirmed INTEGER DEFAULT 0);
+    ''')
+
+
+def _cumulative_weights(rng, n):
+    weights = []
+    total = 0.0
+    for _ in range(n):
+        total += rng.paretovariate(SKEW)
+        weights.append(total)
+    return weights
+
+
+def populate(conn, users=1000, products=50, orders=0, lines_per_order=10, payments=0, seed=1):
+    """
+    Fill an empty legacy-schema database. Client user_ids are 2..users + 1, telegram_ids str(user_id + 999).
+
+    With lines_per_order=None orders get a realistic number of lines and go
+    to a skewed mix of clients and products; a number gives every order that
+    many lines from uniformly chosen clients and products, which is what the
+    older benchmarks were measured with. Orders are dated through 2025 in
+    order_id order and carry the client's running debt; payments store the
+    client's telegram_id like the bot does, and the confirmed ones (about 9 in
+    10) are taken off users.debt.
+    """
+    rng = random.Random(seed)
+    for pragma in FAST_INSERT_PRAGMAS:
+        conn.execute(pragma)
+
+    prices = [1000 + 250 * rng.randrange(40) for _ in range(products)]
+    conn.executemany("INSERT INTO products (product_id, product_name, product_price) VALUES (?, ?, ?)",
+                     ((i + 1, f"Mahsulot {i + 1}", prices[i]) for i in range(products)))
+
+    realistic = lines_per_order is None
+    client_ids = range(2, users + 2)
+    product_ids = range(1, products + 1)
+    client_weights = _cumulative_weights(rng, users) if realistic else None
+    product_weights = _cumulative_weights(rng, products) if realistic else None
+    debts = {}
+
+    order_rows = []
+    line_rows = []
+    for order_id in range(1, orders + 1):
+        if realistic:
+            user_id = rng.choices(client_ids, cum_weights=client_weights)[0]
+            line_count = min(1 + int(rng.expovariate(1 / (MEAN_LINES - 1))), MAX_LINES)
+            line_products = rng.choices(product_ids, cum_weights=product_weights, k=line_count)
+        else:
+            user_id = rng.randrange(2, users + 2)
+            line_count = lines_per_order
+            line_products = [rng.randrange(1, products + 1) for _ in range(line_count)]
+        total_sum = 0
+        for product_id in line_products:
+            price = prices[product_id - 1]
+            quantity = rng.randrange(1, 20)
+            total_sum += quantity * price
+            line_rows.append((order_id, product_id, quantity, price, f"Mahsulot {product_id}", price))
+        before_order_debt = debts.get(user_id, 0)
+        debts[user_id] = before_order_debt + total_sum
+        order_date = (FIRST_DAY + timedelta(days=(order_id - 1) * DAYS // orders)).isoformat()
+        order_rows.append((order_id, user_id, order_date, total_sum, line_count,
+                           debts[user_id], before_order_debt, int(order_id % 3 != 0)))
+        if len(line_rows) >= BATCH_ROWS:
+            conn.executemany("INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?)", order_rows)
+            conn.executemany("INSERT INTO itemInOrder VALUES (?, ?, ?, ?, ?, ?)", line_rows)
+            order_rows.clear()
+            line_rows.clear()
+    conn.executemany("INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?)", order_rows)
+    conn.executemany("INSERT INTO itemInOrder VALUES (?, ?, ?, ?, ?, ?)", line_rows)
+
+    if payments:
+        debtors = list(debts) or list(client_ids)
+        payment_rows = []
+        for payment_id in range(1, payments + 1):
+            user_id = rng.choice(debtors)
+            debt = debts.get(user_id, 0)
+            amount = max(1000, round(debt * rng.uniform(0.1, 0.6), -3))
+            is_confirmed = int(rng.random() < 0.9)
+            if is_confirmed:
+                debts[user_id] = max(debt - amount, 0)
+            payment_rows.append((payment_id, str(user_id + 999), amount, is_confirmed))
+            if len(payment_rows) >= BATCH_ROWS:
+                conn.executemany("INSERT INTO payments VALUES (?, ?, ?, ?)", payment_rows)
+                payment_rows.clear()
+        conn.executemany("INSERT INTO payments VALUES (?, ?, ?, ?)", payment_rows)
+
+    # Users go in last so they carry their final debt
+    conn.execute("INSERT INTO users (username, first_name, last_name, type, debt, telegram_id) "
+                 "VALUES ('admin', 'Admin', NULL, 'admin', 0, '1')")
+    conn.executemany(
+        "INSERT INTO users (username, first_name, last_name, type, debt, telegram_id) VALUES (?, ?, ?, ?, ?, ?)",
+        ((f"user{i}", f"Ism{i}", f"Familiya{i}", 'client', debts.get(i + 2, 0), str(i + 1001))
+         for i in range(users)))
+    conn.commit()
+
+
+def build(path, **kwargs):
+    conn = sqlite3.connect(path)
+    create_legacy_schema(conn)
+    populate(conn, **kwargs)
+    conn.close()
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    path = sys.argv[1]
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    orders = int(sys.argv[3]) if len(sys.argv) > 3 else clients * 10
+    payments = int(sys.argv[4]) if len(sys.argv) > 4 else orders // 2
+    products = int(sys.argv[5]) if len(sys.argv) > 5 else 200
+    if os.path.exists(path):
+        sys.exit(f"{path} already exists; pick a new path")
+
+    import db
+    import migrations
+
+    start = time.perf_counter()
+    build(path, users=clients, products=products, orders=orders, lines_per_order=None, payments=payments)
+    conn = sqlite3.connect(path)
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ("users", "products", "orders", "itemInOrder", "payments")}
+    conn.close()
+    rows = sum(counts.values())
+    built = time.perf_counter() - start
+    print(f"{rows:,} rows in {built:.1f} s ({rows / built:,.0f} rows/s): {counts}")
+
+    db.configure(path)
+    migrations.migrate()
+    db.close_all()
+    print(f"migrated to schema version {migrations.MIGRATIONS[-1][0]} in {time.perf_counter() - start - built:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Load test: realistic update streams fed through bot.process_new_updates with
+the Bot API replaced by an in-process fake.
+
+Every virtual user runs one session at a time, and sessions of different
+users run concurrently on `concurrency` threads:
+
+    signup    /start from a new Telegram user
+    order     an admin builds an order: /add_order, picks the client, adds
+              products one by one (selecting_client -> awaiting_order_data ->
+              awaiting_product_quantity -> confirming_order), confirms it, and
+              the client presses the confirm_order_ button
+    payment   a client reports a payment (/pay_debt, amount, comment) and an
+              admin presses confirm_payment_
+
+Bot API requests go to FakeBotApi on localhost, and the outbox delivers
+replies without rate limits. The report gives updates/s, p50/p99 latency of process_new_updates and
+the DB queries and Bot API calls per update from bot.bot_metrics.
+
+    python -m benchmarks.loadtest [sessions] [concurrency] [api_latency_ms]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from itertools import count
+
+import db
+import migrations
+from benchmarks import fixtures
+from benchmarks.fake_bot_api import FakeBotApi
+
+CLIENTS = 500
+PRODUCTS = 100
+SCENARIOS = (('signup', 2), ('order', 5), ('payment', 3))
+
+
+class Updates:
+    def __init__(self):
+        self._ids = count(1)
+
+    def _user(self, telegram_id):
+        return {'id': telegram_id, 'is_bot': False, 'first_name': f"User{telegram_id}",
+                'username': f"user{telegram_id}"}
+
+    def text(self, telegram_id, text):
+        update_id = next(self._ids)
+        return {'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': telegram_id, 'type': 'private'}, 'from': self._user(telegram_id),
+        }}
+
+    def callback(self, telegram_id, data):
+        update_id = next(self._ids)
+        return {'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'chat_instance': str(telegram_id), 'data': data,
+            'from': self._user(telegram_id),
+            'message': {'message_id': update_id, 'date': int(time.time()), 'text': "",
+                        'chat': {'id': telegram_id, 'type': 'private'}},
+        }}
+
+
+def signup(updates, rng, actor, new_users):
+    yield updates.text(next(new_users), "/start")
+
+
+def order(updates, rng, actor, new_users):
+    admin = actor
+    client_id = rng.randrange(2, CLIENTS + 2)  # fixtures: client telegram_id is user_id + 999
+    yield updates.text(admin, "/add_order")
+    yield updates.text(admin, f"Ism{client_id - 2} Familiya{client_id - 2} ({client_id})")
+    for product_id in rng.sample(range(1, PRODUCTS + 1), rng.randrange(2, 8)):
+        yield updates.text(admin, f"Mahsulot {product_id}")
+        yield updates.text(admin, str(rng.randrange(1, 20)))
+    yield updates.text(admin, "Buyurtma yig'ildi")
+    yield updates.text(admin, "Ha")
+    order_id = db.query_one("SELECT MAX(order_id) FROM orders WHERE user_id=?", (client_id,))[0]
+    yield updates.callback(client_id + 999, f"confirm_order_{order_id}")
+
+
+def payment(updates, rng, actor, new_users):
+    client = rng.randrange(CLIENTS) + 1001
+    yield updates.text(client, "/pay_debt")
+    yield updates.text(client, str(rng.randrange(1, 100) * 1000))
+    yield updates.text(client, "Yo'q")
+    payment_id = db.query_one("SELECT MAX(payment_id) FROM payments WHERE user_id=?", (str(client),))[0]
+    yield updates.callback(actor, f"confirm_payment_{payment_id}")
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run(bot_module, sessions, concurrency, seed=1):
+    """
+    Play `sessions` sessions on `concurrency` threads; return (elapsed, latencies, scenario counts).
+    """
+    from telebot.types import Update
+
+    updates = Updates()
+    new_users = count(10_000_000)
+    scenarios = [session for session, weight in SCENARIOS for _ in range(weight)]
+    rng = random.Random(seed)
+    plan = [rng.choice(scenarios) for _ in range(sessions)]
+    plan_lock = threading.Lock()
+    latencies = []
+    played = {}
+
+    def worker(index):
+        worker_rng = random.Random(seed * 1000 + index)
+        admin = 9000 + index  # one admin per thread, so admin conversations never interleave
+        own_latencies = []
+        while True:
+            with plan_lock:
+                if not plan:
+                    break
+                name = plan.pop()
+                played[name] = played.get(name, 0) + 1
+            for raw in globals()[name](updates, worker_rng, admin, new_users):
+                update = Update.de_json(raw)
+                start = time.perf_counter()
+                try:
+                    bot_module.bot.process_new_updates([update])
+                except Exception:
+                    # Without worker threads telebot re-raises handler errors; metrics counted it
+                    pass
+                own_latencies.append(time.perf_counter() - start)
+        with plan_lock:
+            latencies.extend(own_latencies)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, sorted(latencies), played
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    api_latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "load.db")
+        fixtures.build(path, users=CLIENTS, products=PRODUCTS, orders=CLIENTS * 20, lines_per_order=None,
+                       payments=CLIENTS * 5)
+        os.environ.update({
+            'TELEGRAM_BOT_TOKEN': "0:loadtest", 'DB_PATH': path, 'LOG_FILE': os.path.join(tmp, "bot.log"),
+            'LOG_LEVEL': "WARNING", 'LOG_CONSOLE': "0", 'OUTBOX_GLOBAL_RATE': "1e9", 'OUTBOX_CHAT_RATE': "1e9",
+        })
+        from telebot import apihelper
+        api = FakeBotApi(latency=api_latency).start()
+        apihelper.API_URL = api.url
+
+        db.configure(path)
+        migrations.migrate()
+        with db.transaction() as c:
+            c.executemany("INSERT INTO users (username, first_name, type, debt, telegram_id) VALUES (?, ?, 'admin', 0, ?)",
+                          [(f"admin{i}", f"Admin{i}", str(9000 + i)) for i in range(concurrency)])
+
+        import bot
+        bot.bot.threaded = False  # run handlers on the calling thread so latency is measured per update
+        bot.conversation_state.start()
+        bot.outbox.start()
+
+        elapsed, latencies, played = run(bot, sessions, concurrency)
+        bot.outbox.flush(timeout=60)
+        summary = bot.bot_metrics.summary()
+        bot.outbox.close()
+        bot.conversation_state.close()
+        db.close_all()
+        api.stop()
+        api_calls = {}
+        for _, method, _ in api.calls:
+            api_calls[method] = api_calls.get(method, 0) + 1
+
+    total = len(latencies)
+    print(f"{sessions} sessions {played}, {concurrency} threads, fake API latency {api_latency * 1e3:g} ms")
+    print(f"{total} updates in {elapsed:.2f} s: {total / elapsed:,.0f} updates/s")
+    print(f"process_new_updates latency: p50 {percentile(latencies, 0.5) * 1e3:.2f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1e3:.2f} ms, max {latencies[-1] * 1e3:.2f} ms")
+    print(f"per update: {summary['queries_per_update']:.1f} DB queries, "
+          f"{summary['api_calls_per_update']:.1f} Bot API calls; handler errors: {summary['errors']}")
+    print(f"fake API calls: {dict(sorted(api_calls.items()))}")
+    print("slowest handlers (p99 bucket):")
+    for handler, calls, p50_ms, p99_ms, errors in summary['handlers'][:5]:
+        print(f"  {handler:40} {calls:6} calls, p50 <= {p50_ms:g} ms, p99 <= {p99_ms:g} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,51 @@
 import os
 from datetime import datetime
 import telebot
-from telebot.types import BotCommand, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
+from telebot.types import BotCommand, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup, \
+    InlineQueryResultArticle, InputTextMessageContent
 from dotenv import load_dotenv
-import sqlite3
 import logging
 import sys
 
-# Ensure logs directory exists
-log_file = "bot.log"
+import re
+
+import bulk_entry
+import client_search
+import db
+import importer
+import inline_search
+import ledger
+import logging_setup
+import metrics
+from catalogue import ProductCatalogue
+import migrations
+import order_reports
+import payments
+from outbox import Outbox, GLOBAL_RATE, CHAT_RATE
+import pricing
+import receipts
+import sales
+import state_store
+import statement
+import webhook
+from router import Router
+from cache import TTLCache, MISSING
+
+# Load environment variables
+load_dotenv()
+
+# Logs go through a queue to a rotated JSON-lines file (see logging_setup.py for the LOG_* settings)
+logging_setup.configure_from_env()
+logger = logging.getLogger("bot")
+message_log = logging_setup.SampledLogger("bot.messages")  # every inbound text, at DEBUG; sample it with LOG_SAMPLE
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,  # Change to DEBUG for more detailed logs
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(log_file, encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)  # Optional: Also print logs to console
-    ]
-)
 
 # Log uncaught exceptions
 def log_exceptions(exctype, value, traceback):
-    logging.error("Uncaught exception", exc_info=(exctype, value, traceback))
+    logger.error("Uncaught exception", exc_info=(exctype, value, traceback))
 
 sys.excepthook = log_exceptions
 
-
-# Load environment variables
-load_dotenv()
-
 # Retrieve the token
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
@@ -37,36 +53,58 @@ TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 if not TOKEN:
     raise ValueError("ERROR: TELEGRAM_BOT_TOKEN not found! Set it in the .env file.")
 
-bot = telebot.TeleBot(TOKEN)
+# BOT_RUNTIME=async receives and sends on an asyncio loop (async_runtime.py) and runs
+# the handlers below inline on its executor, so telebot's own worker threads are off
+BOT_RUNTIME = os.getenv("BOT_RUNTIME", "sync")
 
-# Dictionary to keep track of which users are expected to provide data
-user_states = {}
-admin_selected_clients = {}  # To keep track of the client selected by the admin for adding an order
-user_cart = {}  # To keep track of the products added to the cart by the admin
-cur_product = {}
+bot = telebot.TeleBot(TOKEN, threaded=BOT_RUNTIME != "async")
+
+# Replies are queued and delivered by background senders within Telegram's rate limits
+# (messages per second overall and per chat; raise them only for a stubbed API)
+outbox = Outbox(bot.send_message,
+                global_rate=float(os.getenv("OUTBOX_GLOBAL_RATE", GLOBAL_RATE)),
+                chat_rate=float(os.getenv("OUTBOX_CHAT_RATE", CHAT_RATE)))
+
+# Conversation state for multi-step flows, persisted across restarts unless STATE_BACKEND=memory
+conversation_state = state_store.create_store(os.getenv("STATE_BACKEND", "sqlite"))
+
+# To keep track of which users are expected to provide data
+user_states = conversation_state.namespace('user_states')
+admin_selected_clients = conversation_state.namespace('admin_selected_clients')  # To keep track of the client selected by the admin for adding an order
+user_cart = conversation_state.namespace('user_cart')  # To keep track of the products added to the cart by the admin
+cur_product = conversation_state.namespace('cur_product')
+client_search_queries = conversation_state.namespace('client_search_queries')  # Last client search typed by each admin
+payment_selections = conversation_state.namespace('payment_selections')  # Payments shown to and ticked by each admin in /pending_payments
+
+
+def get_user_state(message):
+    state = user_states.get(str(message.from_user.id))
+    # The payment flow stores a dict carrying the state name and the entered amount
+    if isinstance(state, dict):
+        return state.get('state')
+    return state
 
-commands_list = [
-    "/start", "/help", "/add_order", "/delete_order", "/edit_client", "/list_orders", "/list_products"
-]
 
+router = Router(get_state=get_user_state)
 
-def create_db_connection():
-    conn = sqlite3.connect('data.db')
-    return conn
+# Products, their name/id indexes and the prebuilt product keyboard; invalidate() after writing to products
+product_catalogue = ProductCatalogue()
 
+# telegram_id -> (user_id, type), or None for unknown users
+identity_cache = TTLCache(maxsize=10000, ttl=300)
 
-def create_db_tables():
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (user_id INTEGER PRIMARY KEY AUTOINCREMENT , username TEXT, first_name TEXT, last_name TEXT, type TEXT DEFAULT client, saved_name TEXT, debt INTEGER DEFAULT 0, telegram_id TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS products
-                    (product_id INTEGER PRIMARY KEY, product_name TEXT, product_price INTEGER)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS itemInOrder
-                    (order_id INTEGER, product_id INTEGER, quantity INTEGER, price INTEGER, FOREIGN KEY(order_id) REFERENCES orders(order_id), FOREIGN KEY(product_id) REFERENCES products(product_id))''')
-    c.execute('''CREATE TABLE IF NOT EXISTS orders
-                    (order_id INTEGER PRIMARY KEY, user_id INTEGER, order_date TEXT, total_sum INTEGER, total_quantity INTEGER, total_debt INTEGER DEFAULT 0, before_order_debt INTEGER, is_confirmed INTEGER DEFAULT 0)''')
-    conn.commit()
+# Rendered order receipts, filled by add_order and shared by the client and admin notifications
+receipt_cache = receipts.ReceiptCache()
+
+# Inline mode answers every keystroke from cached per-prefix results
+inline_lookup = inline_search.InlineSearch(product_catalogue)
+
+# (client user_id, newest ledger entry_id) -> file_id of the uploaded statement document
+statement_files = TTLCache(maxsize=1000, ttl=7 * 24 * 60 * 60)
+
+commands_list = [
+    "/start", "/help", "/add_order", "/delete_order", "/edit_client", "/list_orders", "/list_products"
+]
 
 
 def redirect_to_command(message):
@@ -85,8 +123,8 @@ def redirect_to_command(message):
     elif message.text == "/list_products":
         handle_list_products(message)
     else:
-        bot.send_message(message.chat.id, "Noto`g`ri buyruq. Iltimos, quyidagi buyruqlardan birini tanlang:")
-        bot.send_message(message.chat.id, "\n".join(commands_list))
+        outbox.send_message(message.chat.id, "Noto`g`ri buyruq. Iltimos, quyidagi buyruqlardan birini tanlang:")
+        outbox.send_message(message.chat.id, "\n".join(commands_list))
 
 
 # Wrapper to check if user exists for each command
@@ -94,7 +132,7 @@ def user_command_wrapper(func):
     def wrapper(message):
         user_id = str(message.from_user.id)
         if not user_exists(user_id):
-            bot.send_message(message.chat.id,
+            outbox.send_message(message.chat.id,
                              "Sizning profilingiz topilmadi. Iltimos, foydalanishni boshlash uchun /start ni kiriting.")
         else:
             func(message)
@@ -102,36 +140,95 @@ def user_command_wrapper(func):
     return wrapper
 
 
+def get_identity(telegram_id):
+    """
+    Return (user_id, type) for a Telegram user, or None if they are not registered.
+
+    Backed by identity_cache, so resolving the caller's role costs one dict lookup
+    on the hot path. create_user, delete_user and type edits invalidate entries.
+    """
+    telegram_id = str(telegram_id)
+    identity = identity_cache.get(telegram_id)
+    if identity is MISSING:
+        identity = db.query_one("SELECT user_id, type FROM users WHERE telegram_id=?", (telegram_id,))
+        identity_cache.set(telegram_id, identity)
+    return identity
+
+
+def invalidate_identity(user_id):
+    """
+    Drop the cached identity of the user with the given internal user_id.
+    """
+    telegram_id = get_user_telegram_id(user_id)
+    if telegram_id:
+        identity_cache.invalidate(str(telegram_id))
+
+
 # Check if user is an admin
 def is_admin(user_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE telegram_id=?", (user_id,))
-    user = c.fetchone()
-    conn.close()
-    return user is not None and user[4] == 'admin'
+    user = get_identity(user_id)
+    return user is not None and user[1] == 'admin'
 
 
 # Check if user is a client
 def is_client(user_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT type FROM users WHERE telegram_id=?", (user_id,))
-    user = c.fetchone()
-    conn.close()
+    user = get_identity(user_id)
     # Debug log
-    print(f"Debug: User ID {user_id}, Query Result: {user}")
-    return user is not None and user[0] == 'client'
+    logger.debug("User ID %s, query result: %s", user_id, user)
+    return user is not None and user[1] == 'client'
 
 
 # Function to list all clients for admin to select
-def list_clients():
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE type='client'")
-    clients = c.fetchall()
-    conn.close()
-    return {client[0]: {'first_name': client[2], 'last_name': client[3]} for client in clients}
+# A picked client is "<name> (<user_id>)"; anything else typed while picking is a search
+CLIENT_CHOICE = re.compile(r"\((\d+)\)$")
+
+
+def client_label(client_id, first_name, last_name):
+    if last_name:
+        return f"{first_name} {last_name} ({client_id})"
+    return f"{first_name} ({client_id})"
+
+
+def client_results_markup(query, page):
+    """
+    Return (clients, inline keyboard) for one page of client search results.
+    """
+    clients, has_more = client_search.search(query, page)
+    markup = InlineKeyboardMarkup()
+    for client_id, first_name, last_name in clients:
+        markup.add(InlineKeyboardButton(client_label(client_id, first_name, last_name),
+                                        callback_data=f"pick_client_{client_id}"))
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("⬅️ Oldingi", callback_data=f"clients_page_{page - 1}"))
+    if has_more:
+        navigation.append(InlineKeyboardButton("Keyingi ➡️", callback_data=f"clients_page_{page + 1}"))
+    if navigation:
+        markup.row(*navigation)
+    return clients, markup
+
+
+def send_client_results(chat_id, user_id, query):
+    client_search_queries[user_id] = query
+    clients, markup = client_results_markup(query, 0)
+    if not clients:
+        outbox.send_message(chat_id, "Bunday mijoz topilmadi. Boshqa ism yozib ko'ring.")
+        return
+    title = f"🔎 \"{query}\" bo'yicha mijozlar:" if query else "Mijozlar:"
+    outbox.send_message(chat_id, title, reply_markup=markup)
+
+
+def ask_for_client(message, state, prompt):
+    """
+    Start picking a client: the first page of clients, then typed text searches.
+    """
+    user_id = str(message.from_user.id)
+    user_states[user_id] = state
+    markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
+    markup.add(KeyboardButton("Bosh menyu"))
+    outbox.send_message(message.chat.id, f"{prompt}\nQidirish uchun ism, familiya yoki username boshini yozing.",
+                        reply_markup=markup)
+    send_client_results(message.chat.id, user_id, "")
 
 
 def back_to_menu(message):
@@ -142,23 +239,17 @@ def back_to_menu(message):
         markup.add(KeyboardButton("Mijoz ma'lumotlarini o'zgartirish"), KeyboardButton("Mahsulotni tahrirlash"))
         markup.add(KeyboardButton("Buyurtmalarni ko'rish"))
         user_states[user_id] = None
-        bot.send_message(message.chat.id, "Menyu", reply_markup=markup)
-        print("Back to menu")
+        outbox.send_message(message.chat.id, "Menyu", reply_markup=markup)
     else:
         markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
         markup.add(KeyboardButton("Buyurtmalarni ko'rish"))  # View orders
         markup.add(KeyboardButton("To'lovni amalga oshirish"))  # New payment button
         user_states[user_id] = None
-        bot.send_message(message.chat.id, "Menyu", reply_markup=markup)
-        print("Back to menu")
+        outbox.send_message(message.chat.id, "Menyu", reply_markup=markup)
 
 
 def get_orders_number():
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users")
-    data = {row[0]: row for row in c.fetchall()}  # Convert rows to a dictionary if needed
-    conn.close()
+    data = {row[0]: row for row in db.query_all("SELECT * FROM users")}  # Convert rows to a dictionary if needed
     num = 0
     for user_id, user_data in data.items():
         if user_data.get('type') == 'client':
@@ -168,11 +259,7 @@ def get_orders_number():
 
 
 def get_max_order_id():
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users")
-    data = {row[0]: row for row in c.fetchall()}  # Convert rows to a dictionary if needed
-    conn.close()
+    data = {row[0]: row for row in db.query_all("SELECT * FROM users")}  # Convert rows to a dictionary if needed
     max_id = 0
     for user_id, user_data in data.items():
         if user_data.get('type') == 'client':
@@ -181,35 +268,13 @@ def get_max_order_id():
                 order_id = int(order['order_id'])
                 if order_id > max_id:
                     max_id = order_id
-    print("Max order ID:", max_id)
+    logger.debug("Max order ID: %s", max_id)
     return max_id
 
 
 
-def create_payments_table():
-    """
-    Create the 'payments' table in the database if it doesn't exist.
-    """
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS payments (
-            payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            amount INTEGER,
-            is_confirmed INTEGER DEFAULT 0,
-            FOREIGN KEY(user_id) REFERENCES users(user_id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-
-
-
 # Admin selects a client to edit
-@bot.message_handler(
-    func=lambda message: message.text == "/edit_client" or message.text == "Mijoz ma'lumotlarini o'zgartirish")
+@router.text("/edit_client", "Mijoz ma'lumotlarini o'zgartirish")
 @user_command_wrapper
 def handle_edit_client(message):
     user_id = str(message.from_user.id)
@@ -224,57 +289,24 @@ def handle_edit_client(message):
         return
 
     if is_admin(user_id):
-        clients = list_clients()
-
-        if clients:
-            markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-            for client_id, client_data in clients.items():
-                if client_data['last_name'] == '' or client_data['last_name'] is None:
-                    markup.add(KeyboardButton(f"{client_data['first_name']} ({client_id})"))
-                else:
-                    markup.add(KeyboardButton(f"{client_data['first_name']} {client_data['last_name']} ({client_id})"))
-            markup.add(KeyboardButton("Bosh menyu"))
-
-            user_states[user_id] = 'selecting_client_for_edit'
-            bot.send_message(message.chat.id, "O'zgartirish uchun mijozni tanlang:", reply_markup=markup)
-        else:
-            bot.send_message(message.chat.id, "Bunday mijoz topilmadi.")
+        ask_for_client(message, 'selecting_client_for_edit', "O'zgartirish uchun mijozni tanlang:")
     else:
-        bot.send_message(message.chat.id, "Sizda mijozlarni o'zgartirishga ruxsat yo`q.")
+        outbox.send_message(message.chat.id, "Sizda mijozlarni o'zgartirishga ruxsat yo`q.")
 
 
 def get_client_by_id(client_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE user_id=?", (client_id,))
-    client = c.fetchone()
-    conn.close()
-    return client
+    return db.query_one("SELECT * FROM users WHERE user_id=?", (client_id,))
 
 def get_client_discount(client_id):
     """
     Retrieve the last applied discount for a client from the database.
     """
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT discount FROM users WHERE user_id=?", (client_id,))
-    result = c.fetchone()
-    conn.close()
+    result = db.query_one("SELECT discount FROM users WHERE user_id=?", (client_id,))
     return result[0] if result and result[0] is not None else 0
 
 
-def create_db_connection():
-    try:
-        conn = sqlite3.connect('data.db')
-        logging.info("Database connection established.")
-        return conn
-    except Exception as e:
-        logging.error(f"Database connection error: {e}", exc_info=True)
-
-
-
 # Handle the selection of a client for editing
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'selecting_client_for_edit')
+@router.state('selecting_client_for_edit')
 @user_command_wrapper
 def handle_select_client_for_edit(message):
     user_id = str(message.from_user.id)
@@ -288,16 +320,19 @@ def handle_select_client_for_edit(message):
         redirect_to_command(message)
         return
 
+    if not CLIENT_CHOICE.search(client_choice):
+        send_client_results(message.chat.id, user_id, client_choice)
+        return
+
     # Extract client ID from the selected text (the ID is in parentheses)
     try:
         selected_client_id = client_choice.split('(')[-1].strip(')')
-        print(f"Selected client ID: {selected_client_id}")
+        logger.debug("Selected client ID: %s", selected_client_id)
         admin_selected_clients[user_id] = selected_client_id
-        print(f"Admin selected clients: {admin_selected_clients}")
-
+        
         # Display the current client data
         client_data = get_client_by_id(selected_client_id)
-        print(f"Client data: {client_data}")
+        logger.debug("Client data: %s", client_data)
         username = client_data[1] if client_data[1] else "None"
         first_name = client_data[2] if client_data[2] else "None"
         last_name = client_data[3] if client_data[3] else "None"
@@ -315,7 +350,7 @@ def handle_select_client_for_edit(message):
             f"Type: {user_type.capitalize()}\n"
             f"So'nggi chegirma: {discount_amount:,.0f} so'm"
         )
-        bot.send_message(message.chat.id, client_info)
+        outbox.send_message(message.chat.id, client_info)
 
         # Ask admin which field they want to edit
         markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
@@ -325,14 +360,14 @@ def handle_select_client_for_edit(message):
         markup.add(KeyboardButton("Mijozni o'chirish"))  # New option to delete the client
         markup.add(KeyboardButton("Bosh menyu"))
         user_states[user_id] = 'choosing_field_to_edit'
-        bot.send_message(message.chat.id, "Qaysi maydonni o'zgartirish?", reply_markup=markup)
+        outbox.send_message(message.chat.id, "Qaysi maydonni o'zgartirish?", reply_markup=markup)
 
     except Exception as e:
-        bot.send_message(message.chat.id, f"Noto`g'ri mijoz tanlandi: {e}")
+        outbox.send_message(message.chat.id, f"Noto`g'ri mijoz tanlandi: {e}")
 
 
 # Handle field selection for editing
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'choosing_field_to_edit')
+@router.state('choosing_field_to_edit')
 @user_command_wrapper
 def handle_choose_field_to_edit(message):
     user_id = str(message.from_user.id)
@@ -352,7 +387,7 @@ def handle_choose_field_to_edit(message):
         markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
         markup.add(KeyboardButton("Ha"), KeyboardButton("Yo'q"))
         user_states[user_id] = 'confirming_client_deletion'
-        bot.send_message(message.chat.id, f"Siz haqiqatan ham mijozni o'chirishni xohlaysizmi? ({selected_client_id})",
+        outbox.send_message(message.chat.id, f"Siz haqiqatan ham mijozni o'chirishni xohlaysizmi? ({selected_client_id})",
                          reply_markup=markup)
     elif field_choice in ["Username", "Ism", "Familiya", "Sistemadagi Ism", "Qarzi", "Type"]:
         # Special handling for 'Type' to show buttons
@@ -361,23 +396,23 @@ def handle_choose_field_to_edit(message):
             markup.add(KeyboardButton("Admin"), KeyboardButton("Client"))
             markup.add(KeyboardButton("Bosh menyu"))
             user_states[user_id] = 'editing_type'
-            bot.send_message(message.chat.id, "Mijoz typeni tanlang:", reply_markup=markup)
+            outbox.send_message(message.chat.id, "Mijoz typeni tanlang:", reply_markup=markup)
         else:
             user_states[user_id] = f"editing_{field_choice.lower().replace(' ', '_')}"
             markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
             markup.add(KeyboardButton("Bosh menyu"))
-            bot.send_message(message.chat.id, f"Yangi {field_choice.lower()} kiriting:", reply_markup=markup)
+            outbox.send_message(message.chat.id, f"Yangi {field_choice.lower()} kiriting:", reply_markup=markup)
     elif field_choice == "Chegirma qo'shish":
         user_states[user_id] = 'applying_discount'
-        bot.send_message(message.chat.id, "Chegirma miqdorini kiriting:\n\n"
+        outbox.send_message(message.chat.id, "Chegirma miqdorini kiriting:\n\n"
                                       "Masalan:\n"
                                       "- 5% (foiz sifatida)\n"
                                       "- 10000 (aniq miqdor sifatida)")
     else:
-        bot.send_message(message.chat.id, "Invalid choice. Please select a valid field.")
+        outbox.send_message(message.chat.id, "Invalid choice. Please select a valid field.")
 
 
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'applying_discount')
+@router.state('applying_discount')
 @user_command_wrapper
 def handle_apply_discount(message):
     user_id = str(message.from_user.id)
@@ -393,15 +428,10 @@ def handle_apply_discount(message):
         return
 
     try:
-        # Validate and parse discount input
-        conn = create_db_connection()
-        c = conn.cursor()
-
         # Fetch the current debt for the client
-        c.execute("SELECT debt FROM users WHERE user_id=?", (selected_client_id,))
-        result = c.fetchone()
+        result = db.query_one("SELECT debt FROM users WHERE user_id=?", (selected_client_id,))
         if not result:
-            bot.send_message(message.chat.id, "Mijoz topilmadi.")
+            outbox.send_message(message.chat.id, "Mijoz topilmadi.")
             return
 
         current_debt = result[0]
@@ -417,35 +447,22 @@ def handle_apply_discount(message):
 
         # Ensure discount doesn't exceed the debt
         if discount_amount > current_debt:
-            bot.send_message(message.chat.id, "Chegirma miqdori qarzdan ko'p bo'lishi mumkin emas.")
+            outbox.send_message(message.chat.id, "Chegirma miqdori qarzdan ko'p bo'lishi mumkin emas.")
             return
 
-        new_debt = current_debt - discount_amount
-
-        # Update the debt in users table
-        c.execute("UPDATE users SET debt=?, discount=? WHERE user_id=?", (new_debt, discount_amount, selected_client_id))
-
-        # Update the total_debt in the latest order for the user
-        c.execute("""
-            UPDATE orders
-            SET total_debt = ?
-            WHERE user_id = ? AND order_id = (
-                SELECT MAX(order_id) FROM orders WHERE user_id = ?
-            )
-        """, (new_debt, selected_client_id, selected_client_id))
-
-        conn.commit()
-        conn.close()
+        with db.transaction() as c:
+            new_debt = ledger.post(c, selected_client_id, ledger.DISCOUNT, -discount_amount)
+            c.execute("UPDATE users SET discount=? WHERE user_id=?", (discount_amount, selected_client_id))
 
         # Notify admin
-        bot.send_message(message.chat.id, 
+        outbox.send_message(message.chat.id, 
                          f"Mijozga {discount_amount:,.0f} so'm chegirma qo'llandi.\n"
                          f"Yangi qarz miqdori: {new_debt:,.0f} so'm.")
 
         # Notify client
         client_telegram_id = get_user_telegram_id(selected_client_id)
         if client_telegram_id:
-            bot.send_message(client_telegram_id, 
+            outbox.send_message(client_telegram_id, 
                              f"Sizga {discount_amount:,.0f} so'm chegirma qo'llandi.\n"
                              f"Hozirgi qarzingiz: {new_debt:,.0f} so'm.")
 
@@ -457,24 +474,21 @@ def handle_apply_discount(message):
         markup.add(KeyboardButton("Chegirma qo'shish"))
         markup.add(KeyboardButton("Mijozni o'chirish"))
         markup.add(KeyboardButton("Bosh menyu"))
-        bot.send_message(message.chat.id, "Qaysi maydonni o'zgartirishni tanlang:", reply_markup=markup)
+        outbox.send_message(message.chat.id, "Qaysi maydonni o'zgartirishni tanlang:", reply_markup=markup)
         
     except ValueError:
-        bot.send_message(message.chat.id, "Chegirma miqdori noto'g'ri kiritilgan. Iltimos, qaytadan kiriting.")
+        outbox.send_message(message.chat.id, "Chegirma miqdori noto'g'ri kiritilgan. Iltimos, qaytadan kiriting.")
     except Exception as e:
-        bot.send_message(message.chat.id, f"Xatolik yuz berdi: {e}")
+        outbox.send_message(message.chat.id, f"Xatolik yuz berdi: {e}")
 
 
 
 def delete_user(user_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("DELETE FROM users WHERE user_id=?", (user_id,))
-    conn.commit()
-    conn.close()
+    invalidate_identity(user_id)
+    db.execute("DELETE FROM users WHERE user_id=?", (user_id,))
 
 # Handle client deletion confirmation
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'confirming_client_deletion')
+@router.state('confirming_client_deletion')
 @user_command_wrapper
 def handle_confirm_client_deletion(message):
     user_id = str(message.from_user.id)
@@ -487,35 +501,34 @@ def handle_confirm_client_deletion(message):
         if user:
             # Send a message to the deleted user
             try:
-                bot.send_message(user[7],
+                outbox.send_message(user[7],
                                  "Sizning profilingiz o'chirildi. Bottan foydalanish uchun /start ni kiriting.")
             except Exception as e:
-                print(f"Could not send message to deleted user: {e}")
+                logger.warning("Could not send message to deleted user: %s", e)
 
             # Delete the user from the database
             delete_user(user[0])
-            bot.send_message(message.chat.id, f"Mijoz ({selected_client_id}) muvaffaqiyatli o'chirildi.")
+            outbox.send_message(message.chat.id, f"Mijoz ({selected_client_id}) muvaffaqiyatli o'chirildi.")
         else:
-            bot.send_message(message.chat.id, "Mijoz topilmadi.")
+            outbox.send_message(message.chat.id, "Mijoz topilmadi.")
 
         # Reset state and return to menu
         user_states[user_id] = None
         admin_selected_clients[user_id] = None
         back_to_menu(message)
     elif confirmation == "Yo'q":
-        bot.send_message(message.chat.id, "Mijoz o'chirilmaydi.")
+        outbox.send_message(message.chat.id, "Mijoz o'chirilmaydi.")
         # Reset state and return to menu
         user_states[user_id] = None
         admin_selected_clients[user_id] = None
         back_to_menu(message)
     else:
-        bot.send_message(message.chat.id, "Noto`g'ri tanlov. Iltimos, 'Ha' yoki 'Yo'q' ni tanlang.")
+        outbox.send_message(message.chat.id, "Noto`g'ri tanlov. Iltimos, 'Ha' yoki 'Yo'q' ni tanlang.")
 
 
 # Handle updating the selected field
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) 
-                     and isinstance(user_states.get(str(message.from_user.id)), str) 
-                     and user_states.get(str(message.from_user.id)).startswith('editing'))
+@router.state('editing_username', 'editing_ism', 'editing_familiya', 'editing_sistemadagi_ism', 'editing_qarzi',
+              'editing_type', 'editing_product_name', 'editing_product_price')
 def handle_edit_field(message):
     user_id = str(message.from_user.id)
     state = user_states.get(user_id)
@@ -532,26 +545,22 @@ def handle_edit_field(message):
     if state.startswith('editing_product_'):
         selected_product_id = cur_product.get(user_id)
         if not selected_product_id:
-            bot.send_message(message.chat.id, "Mahsulot tanlanmadi. Iltimos, qayta urinib ko'ring.")
+            outbox.send_message(message.chat.id, "Mahsulot tanlanmadi. Iltimos, qayta urinib ko'ring.")
             return
 
-        conn = create_db_connection()
-        c = conn.cursor()
-
         if state == 'editing_product_name':
-            c.execute("UPDATE products SET product_name=? WHERE product_id=?", (new_value, selected_product_id))
-            conn.commit()
-            bot.send_message(message.chat.id, f"Mahsulot nomi muvaffaqiyatli o'zgartirildi: {new_value}")
+            db.execute("UPDATE products SET product_name=? WHERE product_id=?", (new_value, selected_product_id))
+            product_catalogue.invalidate()
+            outbox.send_message(message.chat.id, f"Mahsulot nomi muvaffaqiyatli o'zgartirildi: {new_value}")
         elif state == 'editing_product_price':
             try:
                 new_price = int(new_value)
-                c.execute("UPDATE products SET product_price=? WHERE product_id=?", (new_price, selected_product_id))
-                conn.commit()
-                bot.send_message(message.chat.id, f"Mahsulot narxi muvaffaqiyatli o'zgartirildi: {new_price:,}")
+                db.execute("UPDATE products SET product_price=? WHERE product_id=?", (new_price, selected_product_id))
+                product_catalogue.invalidate()
+                outbox.send_message(message.chat.id, f"Mahsulot narxi muvaffaqiyatli o'zgartirildi: {new_price:,}")
             except ValueError:
-                bot.send_message(message.chat.id, "Narx noto'g'ri formatda. Iltimos, raqam kiriting.")
+                outbox.send_message(message.chat.id, "Narx noto'g'ri formatda. Iltimos, raqam kiriting.")
 
-        conn.close()
         user_states[user_id] = None
         cur_product[user_id] = None
         back_to_menu(message)
@@ -559,178 +568,118 @@ def handle_edit_field(message):
     elif state.startswith('editing_'):
         selected_client_id = admin_selected_clients.get(user_id)
         if not selected_client_id:
-            bot.send_message(message.chat.id, "Mijoz tanlanmangan. Iltimos, qaytadan urinib ko`ring.")
+            outbox.send_message(message.chat.id, "Mijoz tanlanmangan. Iltimos, qaytadan urinib ko`ring.")
             return
 
-        conn = create_db_connection()
-        c = conn.cursor()
-
         if state == 'editing_username':
-            c.execute("UPDATE users SET username=? WHERE user_id=?", (new_value, selected_client_id))
-            bot.send_message(message.chat.id, f"Username o`zgartirildi '{new_value}'.")
+            db.execute("UPDATE users SET username=? WHERE user_id=?", (new_value, selected_client_id))
+            outbox.send_message(message.chat.id, f"Username o`zgartirildi '{new_value}'.")
         elif state == 'editing_ism':
-            c.execute("UPDATE users SET first_name=? WHERE user_id=?", (new_value, selected_client_id))
-            bot.send_message(message.chat.id, f"Ism o`zgartirildi '{new_value}'.")
+            db.execute("UPDATE users SET first_name=? WHERE user_id=?", (new_value, selected_client_id))
+            outbox.send_message(message.chat.id, f"Ism o`zgartirildi '{new_value}'.")
         elif state == 'editing_familiya':
-            c.execute("UPDATE users SET last_name=? WHERE user_id=?", (new_value, selected_client_id))
-            bot.send_message(message.chat.id, f"Familiya o`zgartirildi '{new_value}'.")
+            db.execute("UPDATE users SET last_name=? WHERE user_id=?", (new_value, selected_client_id))
+            outbox.send_message(message.chat.id, f"Familiya o`zgartirildi '{new_value}'.")
         elif state == 'editing_sistemadagi_ism':
-            c.execute("UPDATE users SET saved_name=? WHERE user_id=?", (new_value, selected_client_id))
-            bot.send_message(message.chat.id, f"Sistemadagi ism o`zgartirildi '{new_value}'.")
+            db.execute("UPDATE users SET saved_name=? WHERE user_id=?", (new_value, selected_client_id))
+            outbox.send_message(message.chat.id, f"Sistemadagi ism o`zgartirildi '{new_value}'.")
         elif state == 'editing_qarzi':
             try:
                 new_value = int(new_value)
-                c.execute("UPDATE users SET debt=?, discount=0 WHERE user_id=?", (new_value, selected_client_id))
-                bot.send_message(message.chat.id, f"Qarz o`zgartirildi {new_value:,} so'm va chegirma 0 ga qayta tiklandi.")
-                c.execute("SELECT telegram_id FROM users WHERE user_id=?", (selected_client_id,))
-                client_telegram_id = c.fetchone()
+                with db.transaction() as c:
+                    ledger.set_balance(c, selected_client_id, new_value, comment="Qarz qo'lda o'zgartirildi")
+                    c.execute("UPDATE users SET discount=0 WHERE user_id=?", (selected_client_id,))
+                outbox.send_message(message.chat.id, f"Qarz o`zgartirildi {new_value:,} so'm va chegirma 0 ga qayta tiklandi.")
+                client_telegram_id = db.query_one("SELECT telegram_id FROM users WHERE user_id=?", (selected_client_id,))
                 if client_telegram_id and client_telegram_id[0]:
-                    bot.send_message(client_telegram_id[0], f"Sizning qarzingiz o'zgartirildi. Hozirgi qarzingiz: {new_value:,} so'm.")
+                    outbox.send_message(client_telegram_id[0], f"Sizning qarzingiz o'zgartirildi. Hozirgi qarzingiz: {new_value:,} so'm.")
             except ValueError:
-                bot.send_message(message.chat.id, "Qarzni noto`g`ri kiritdingiz. Iltimos, qaytadan kiriting.")
+                outbox.send_message(message.chat.id, "Qarzni noto`g`ri kiritdingiz. Iltimos, qaytadan kiriting.")
         elif state == 'editing_type':
             if new_value in ['Admin', 'Client']:
-                c.execute("UPDATE users SET type=? WHERE user_id=?", (new_value.lower(), selected_client_id))
-                bot.send_message(message.chat.id, f"User type o`zgartirildi '{new_value.lower()}'.")
+                db.execute("UPDATE users SET type=? WHERE user_id=?", (new_value.lower(), selected_client_id))
+                invalidate_identity(selected_client_id)
+                outbox.send_message(message.chat.id, f"User type o`zgartirildi '{new_value.lower()}'.")
             else:
-                bot.send_message(message.chat.id, "Typeni noto`g`ri kiritdingiz. Iltimos, qaytadan kiriting.")
-
-        conn.commit()
-        conn.close()
+                outbox.send_message(message.chat.id, "Typeni noto`g`ri kiritdingiz. Iltimos, qaytadan kiriting.")
 
         user_states[user_id] = None
         admin_selected_clients[user_id] = None
         back_to_menu(message)
 
     else:
-        bot.send_message(message.chat.id, "Amalni qayta aniqlab bo'lmadi. Iltimos, qayta urinib ko'ring.")
+        outbox.send_message(message.chat.id, "Amalni qayta aniqlab bo'lmadi. Iltimos, qayta urinib ko'ring.")
 
 
 def user_exists(telegram_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE telegram_id=?", (telegram_id,))
-    user = c.fetchone()
-    conn.close()
-    return user is not None
+    return get_identity(telegram_id) is not None
 
 
 def create_user(telegram_id, username, first_name, last_name, user_type):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("INSERT INTO users (telegram_id, username, first_name, last_name, type) VALUES (?, ?, ?, ?, ?)",
-              (telegram_id, username, first_name, last_name, user_type))
-    conn.commit()
-    conn.close()
+    db.execute("INSERT INTO users (telegram_id, username, first_name, last_name, type) VALUES (?, ?, ?, ?, ?)",
+               (telegram_id, username, first_name, last_name, user_type))
+    identity_cache.invalidate(str(telegram_id))
 
 
 # Функция, которая выполняется при команде /start
-@bot.message_handler(commands=['start'])
+@router.command('start')
 def start(message):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users")
-    data = {row[0]: row for row in c.fetchall()}  # Convert rows to a dictionary if needed
-    conn.close()
-    create_db_tables()
-    create_payments_table()  # Add this line to create the 'payments' table
     user_id = str(message.from_user.id)
 
     if not user_exists(user_id):
         create_user(user_id, message.from_user.username, message.from_user.first_name, message.from_user.last_name,
                     'client')
-        bot.send_message(message.chat.id, f"Salom, {message.from_user.first_name}! Sizning ma`lumotlarinigiz saqlandi.")
+        outbox.send_message(message.chat.id, f"Salom, {message.from_user.first_name}! Sizning ma`lumotlarinigiz saqlandi.")
     else:
-        bot.send_message(message.chat.id, f"Qaytadan salom, {message.from_user.first_name}!")
+        outbox.send_message(message.chat.id, f"Qaytadan salom, {message.from_user.first_name}!")
     back_to_menu(message)
 
 
 # Function to parse user input and create an order
 def parse_order_input(message_text):
-    lines = message_text.strip().split("\n")
-    print(lines)
-
-    # Extract saved name, debt, and order date from the first line
-    first_line = lines[0].split("  ")
-    saved_name = first_line[0]
-    before_order_debt = int("".join(first_line[2].split()[:-1]))
-    print(before_order_debt)
-
-    debt = "".join(((lines[-2].split("  "))[-1]).split()[:-1])
-    debt = int(debt)
-
-    # Format the order date by replacing commas with slashes
-    order_date = first_line[-1].replace(",", "/")
-
-    # Skip header line "Наименование товара  Цена  Количество(кб)  Оплата  Перечисление  Остаток долга"
-    product_lines = lines[2:-2]
-
-    products = []
-
-    for line in product_lines:
-        parts = line.split("  ")
-        if len(parts) < 3:
-            continue  # Skip lines that don't have enough information
-
-        product_name = parts[0]
-        price_str = "".join(parts[1].split()[:-1])
-        product_price = int(price_str) if price_str else 0
-
-        product_quantity = int(parts[2]) if parts[2] != "" else 0
-
-        if product_name != "" and product_price != "" and product_quantity != "":
-            products.append({
-                'product_name': product_name,
-                'product_price': product_price,
-                'product_quantity': product_quantity
-            })
-
-    # Extract the final summary line (Jami summa)
-    summary_line = lines[-1].split("  ")
-    second_last = lines[-2].split("  ")
-    total_sum = "".join(second_last[1].split()[:-1])
-    total_sum = int(total_sum)
-    total_quantity = summary_line[2]
-    total_quantity = int(total_quantity)
-    total_debt = int("".join(summary_line[-1].split()[:-1]))
-
-    return saved_name, debt, order_date, products, total_sum, total_quantity, total_debt, before_order_debt
+    """
+    Parse one order in the accounting sheet's two-space format (see importer.py).
+    """
+    rows = list(importer.text_rows(message_text.strip().split("\n")))
+    order = importer.parse_block(rows)
+    debt = importer.parse_amount(rows[-2][-1])
+    products = [{'product_name': name, 'product_price': price, 'product_quantity': quantity}
+                for name, price, quantity in order.products]
+    return (order.saved_name, debt, order.order_date, products, order.total_sum, order.total_quantity,
+            order.total_debt, order.before_order_debt)
 
 
 # Function to add an order from parsed input
-def add_order(user_id, saved_name, debt, order_date, products, total_sum, total_quantity, total_debt, before_order_debt):
-    conn = create_db_connection()
-    c = conn.cursor()
-    
-    # Add the new order to the database
-    c.execute(
-        "INSERT INTO orders (user_id, order_date, total_sum, total_quantity, total_debt, before_order_debt, is_confirmed) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (user_id, order_date, total_sum, total_quantity, total_debt, before_order_debt, 0)
-    )
-    order_id = c.lastrowid  # Get the ID of the newly inserted order
+def add_order(user_id, saved_name, order_date, products, total_sum, total_quantity):
+    """
+    Store an order on the client's current balance; the debt before and after it are read in the same transaction.
+    """
+    # Products built from a cart already carry their id, name and unit price;
+    # parsed ones only have a name, so look those up in a single query
+    product_ids = [product.get('product_id') or get_product_id_by_name(product['product_name'])
+                   for product in products]
+    stored = pricing.fetch_products(
+        product_id for product, product_id in zip(products, product_ids) if 'product_id' not in product)
+    lines = []
+    for product, product_id in zip(products, product_ids):
+        if 'product_id' in product:
+            product_name, product_price = product['product_name'], product['product_price']
+        elif product_id in stored:
+            product_name, product_price = stored[product_id]
+        else:
+            continue
+        lines.append((product_id, product_name, product_price, product['product_quantity'], product['product_price']))
 
-    # Add each product to the itemInOrder table
-    for product in products:
-        product_id = get_product_id_by_name(product['product_name'])
-        c.execute(
-            "SELECT product_name, product_price FROM products WHERE product_id = ?", (product_id,)
-        )
-        product_data = c.fetchone()
-        if product_data:
-            product_name, product_price = product_data
-            c.execute(
-                "INSERT INTO itemInOrder (order_id, product_id, product_name, product_price, quantity, price) "
-                "VALUES (?, ?, ?, ?, ?, ?)",
-                (order_id, product_id, product_name, product_price, product['product_quantity'], product['product_price'])
-            )
-    
-    # Update the user's debt in the database
-    c.execute("UPDATE users SET debt = ? WHERE user_id = ?", (total_debt, user_id))
-    conn.commit()
-    conn.close()
+    with db.transaction() as c:
+        order_id = pricing.insert_order(c, user_id, order_date, lines, total_sum, total_quantity)
+        before_order_debt, total_debt = c.execute(
+            "SELECT before_order_debt, total_debt FROM orders WHERE order_id = ?", (order_id,)).fetchone()
 
-    print(f"Order added for user {user_id}: Order ID {order_id}")
+    receipt_cache.put(order_id, receipts.render(
+        order_id, order_date, total_sum, total_quantity, before_order_debt, total_debt,
+        [(product_name, quantity, price) for _, product_name, _, quantity, price in lines]))
+
+    logger.info("Order added for user %s: order ID %s", user_id, order_id)
     return order_id
 
 
@@ -750,11 +699,7 @@ def print_orders(orders):
 
 # Function to list all orders for a user
 def list_orders(user_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users")
-    data = {row[0]: row for row in c.fetchall()}  # Convert rows to a dictionary if needed
-    conn.close()
+    data = {row[0]: row for row in db.query_all("SELECT * FROM users")}  # Convert rows to a dictionary if needed
     user_data = data.get(user_id, None)
 
     if is_admin(user_id):
@@ -803,54 +748,8 @@ def list_orders(user_id):
     return "Mijoz topilmadi."   
 
 
-def list_orders_db(telegram_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-
-    # Fetch user_id from the telegram_id
-    c.execute("SELECT user_id FROM users WHERE telegram_id = ?", (telegram_id,))
-    user = c.fetchone()
-
-    if not user:
-        print(f"Debug: Telegram ID {telegram_id} not linked to any user.")
-        return []  # Return an empty list if no user is found
-
-    user_id = user[0]
-    print(f"Debug: Matched Telegram ID {telegram_id} to User ID {user_id}")
-
-    # Fetch orders for the user_id
-    c.execute("SELECT * FROM orders WHERE user_id = ?", (user_id,))
-    orders = c.fetchall()
-    conn.close()
-    print(f"Debug: Orders for User ID {user_id}: {orders}")
-    return orders
-
-
-
-def get_user_debt(user_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT debt FROM users WHERE user_id=?", (user_id,))
-    debt = c.fetchone()
-    conn.close()
-    return debt[0] if debt else 0
-
-
-def list_orders_db_admin():
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM orders")
-    orders = c.fetchall()
-    conn.close()
-    return orders
-
-
 def get_debt(user_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users")
-    data = {row[0]: row for row in c.fetchall()}  # Convert rows to a dictionary if needed
-    conn.close()
+    data = {row[0]: row for row in db.query_all("SELECT * FROM users")}  # Convert rows to a dictionary if needed
     user_data = data.get(user_id, None)
     if user_data:
         return user_data.get('total_debt', 0)
@@ -859,17 +758,7 @@ def get_debt(user_id):
 
 # Function to list all products in a specific order
 def list_products(user_id, order_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM orders")
-    orders = c.fetchall()
-    conn.close()
-    
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE user_id=?", (user_id,))
-    user_data = c.fetchone()
-    conn.close()
+    user_data = db.query_one("SELECT * FROM users WHERE user_id=?", (user_id,))
 
     if user_data:
         orders = user_data.get('orders', [])
@@ -890,36 +779,17 @@ def list_products(user_id, order_id):
 
 
 # Step 1: Handle the /add_order command or the "Buyurtma qo'shish" button
-@bot.message_handler(func=lambda message: message.text == "Buyurtma qo'shish" or message.text == "/add_order")
+@router.text("Buyurtma qo'shish", "/add_order")
 def handle_add_order(message):
     user_id = str(message.from_user.id)
 
     if is_admin(user_id):
-        clients = list_clients()
-
-        if clients:
-            markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-            for client_id, client_data in clients.items():
-                if client_data['last_name'] == '' or client_data['last_name'] is None:
-                    markup.add(KeyboardButton(f"{client_data['first_name']} ({client_id})"))
-                else:
-                    markup.add(KeyboardButton(f"{client_data['first_name']} {client_data['last_name']} ({client_id})"))
-            markup.add(KeyboardButton("Bosh menyu"))
-
-            user_states[user_id] = 'selecting_client'
-            bot.send_message(message.chat.id, "Mijozni tanlang:", reply_markup=markup)
-        else:
-            bot.send_message(message.chat.id, "Mijozlar topilmadi.")
+        ask_for_client(message, 'selecting_client', "Mijozni tanlang:")
     else:
-        bot.send_message(message.chat.id, "Sizda buyurtma qo`shishga ruxsat yo`q.")
+        outbox.send_message(message.chat.id, "Sizda buyurtma qo`shishga ruxsat yo`q.")
 
 
-def products_list_keyboard():
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM products")
-    products = c.fetchall()
-    conn.close()
+def build_products_keyboard(products):
     markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
     for product in products:
         markup.add(KeyboardButton(product[1]))
@@ -929,6 +799,11 @@ def products_list_keyboard():
     markup.add(KeyboardButton("Bosh menyu"))
     return markup
 
+
+def products_list_keyboard():
+    # Serialized once per catalogue version; send_message accepts the JSON string as reply_markup
+    return product_catalogue.keyboard(build_products_keyboard)
+
 #--------------------------------------------------------------------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------------------------------------------------------------------
@@ -936,21 +811,16 @@ def products_list_keyboard():
 #-------------------------------------------------------------------------------------------------------------------------------------------- 
 #--------------------------------------------------------------------------------------------------------------------------------------------
 
-@bot.message_handler(func=lambda message: message.text == "Mahsulotni tahrirlash")
+@router.text("Mahsulotni tahrirlash")
 @user_command_wrapper
 def handle_edit_product_menu(message):
     user_id = str(message.from_user.id)
     
-    # Fetch products from the database
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT product_id, product_name, product_price FROM products")
-    products = c.fetchall()
-    conn.close()
+    products = product_catalogue.products()
     
     # Check if there are products to edit
     if not products:
-        bot.send_message(message.chat.id, "Hech qanday mahsulot topilmadi.")
+        outbox.send_message(message.chat.id, "Hech qanday mahsulot topilmadi.")
         back_to_menu(message)
         return
 
@@ -962,10 +832,10 @@ def handle_edit_product_menu(message):
     markup.add(KeyboardButton("Bosh menyu"))
     
     user_states[user_id] = 'selecting_product'
-    bot.send_message(message.chat.id, "Tahrir uchun mahsulotni tanlang:", reply_markup=markup)
+    outbox.send_message(message.chat.id, "Tahrir uchun mahsulotni tanlang:", reply_markup=markup)
 
 
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'selecting_product')
+@router.state('selecting_product')
 @user_command_wrapper
 def handle_product_selection(message):
     user_id = str(message.from_user.id)
@@ -986,12 +856,12 @@ def handle_product_selection(message):
         markup.add(KeyboardButton("Mahsulotni o'chirish"))
         markup.add(KeyboardButton("Bosh menyu"))
         user_states[user_id] = 'choosing_product_action'
-        bot.send_message(message.chat.id, "Qanday amalni bajarmoqchisiz?", reply_markup=markup)
+        outbox.send_message(message.chat.id, "Qanday amalni bajarmoqchisiz?", reply_markup=markup)
     except Exception as e:
-        bot.send_message(message.chat.id, f"Noto'g'ri mahsulot tanlandi: {e}")
+        outbox.send_message(message.chat.id, f"Noto'g'ri mahsulot tanlandi: {e}")
 
 
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'choosing_product_action')
+@router.state('choosing_product_action')
 @user_command_wrapper
 def handle_product_action(message):
     user_id = str(message.from_user.id)
@@ -1004,77 +874,26 @@ def handle_product_action(message):
 
     if action_choice == "Nomi o'zgartirish":
         user_states[user_id] = 'editing_product_name'
-        bot.send_message(message.chat.id, "Yangi nomni kiriting:")
+        outbox.send_message(message.chat.id, "Yangi nomni kiriting:")
     elif action_choice == "Narxi o'zgartirish":
         user_states[user_id] = 'editing_product_price'
-        bot.send_message(message.chat.id, "Yangi narxni kiriting:")
+        outbox.send_message(message.chat.id, "Yangi narxni kiriting:")
     elif action_choice == "Mahsulotni o'chirish":
         if selected_product_id:
             delete_product(selected_product_id)
-            bot.send_message(message.chat.id, f"Mahsulot (ID: {selected_product_id}) muvaffaqiyatli o'chirildi.")
+            outbox.send_message(message.chat.id, f"Mahsulot (ID: {selected_product_id}) muvaffaqiyatli o'chirildi.")
             user_states[user_id] = None
             cur_product[user_id] = None
             back_to_menu(message)
         else:
-            bot.send_message(message.chat.id, "Mahsulot tanlanmadi. Iltimos, qayta urinib ko'ring.")
-    else:
-        bot.send_message(message.chat.id, "Noto'g'ri tanlov. Iltimos, qayta urinib ko'ring.")
-
-
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'editing_product_name')
-@user_command_wrapper
-def handle_edit_product_name(message):
-    user_id = str(message.from_user.id)
-    new_name = message.text.strip()
-    selected_product_id = cur_product.get(user_id)  # Focus only on the product, not the client
-
-    if selected_product_id:
-        conn = create_db_connection()
-        c = conn.cursor()
-        c.execute("UPDATE products SET product_name=? WHERE product_id=?", (new_name, selected_product_id))
-        conn.commit()
-        conn.close()
-
-        bot.send_message(message.chat.id, f"Mahsulot nomi muvaffaqiyatli o'zgartirildi: {new_name}")
-        user_states[user_id] = None
-        cur_product[user_id] = None
-        back_to_menu(message)
+            outbox.send_message(message.chat.id, "Mahsulot tanlanmadi. Iltimos, qayta urinib ko'ring.")
     else:
-        bot.send_message(message.chat.id, "Mahsulot tanlanmadi. Iltimos, qayta urinib ko'ring.")
-
-
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'editing_product_price')
-@user_command_wrapper
-def handle_edit_product_price(message):
-    user_id = str(message.from_user.id)
-    new_price = message.text.strip()
-    selected_product_id = cur_product.get(user_id)
-
-    try:
-        new_price = int(new_price)
-        if selected_product_id:
-            conn = create_db_connection()
-            c = conn.cursor()
-            c.execute("UPDATE products SET product_price=? WHERE product_id=?", (new_price, selected_product_id))
-            conn.commit()
-            conn.close()
-
-            bot.send_message(message.chat.id, f"Mahsulot narxi muvaffaqiyatli o'zgartirildi: {new_price:,}")
-            user_states[user_id] = None
-            cur_product[user_id] = None
-            back_to_menu(message)
-        else:
-            bot.send_message(message.chat.id, "Mahsulot tanlanmadi. Iltimos, qayta urinib ko'ring.")
-    except ValueError:
-        bot.send_message(message.chat.id, "Narx noto'g'ri formatda. Iltimos, raqam kiriting.")
+        outbox.send_message(message.chat.id, "Noto'g'ri tanlov. Iltimos, qayta urinib ko'ring.")
 
 
 def delete_product(product_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("DELETE FROM products WHERE product_id=?", (product_id,))
-    conn.commit()
-    conn.close()
+    db.execute("DELETE FROM products WHERE product_id=?", (product_id,))
+    product_catalogue.invalidate()
 
 
 #--------------------------------------------------------------------------------------------------------------------------------------------
@@ -1085,7 +904,7 @@ def delete_product(product_id):
 #--------------------------------------------------------------------------------------------------------------------------------------------
 
 # Step 2: Handle the selection of a client or creating a new client
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'selecting_client')
+@router.state('selecting_client')
 @user_command_wrapper
 def handle_select_client(message):
     user_id = str(message.from_user.id)
@@ -1099,6 +918,10 @@ def handle_select_client(message):
         redirect_to_command(message)
         return
 
+    if not CLIENT_CHOICE.search(client_choice):
+        send_client_results(message.chat.id, user_id, client_choice)
+        return
+
     # Extract client ID from the selected text (the ID is in parentheses)
     try:
         selected_client_id = client_choice.split('(')[-1].strip(')')
@@ -1107,30 +930,25 @@ def handle_select_client(message):
         user_cart[selected_client_id] = {}
         cur_product[selected_client_id] = None
         markup = products_list_keyboard()
-        bot.send_message(message.chat.id, "Buyurtma maxsulotlarini tanlang:", reply_markup=markup)
+        outbox.send_message(message.chat.id, "Buyurtma maxsulotlarini tanlang yoki butun ro'yxatni bitta xabarda "
+                                             "yuboring, har qatorda nomi va miqdori:\nPomidor 5\nKartoshka 10",
+                            reply_markup=markup)
     except:
-        bot.send_message(message.chat.id, "Noto`g`ri mijoz tanlandi. Iltimos, qaytadan urinib ko`ring.")
+        outbox.send_message(message.chat.id, "Noto`g`ri mijoz tanlandi. Iltimos, qaytadan urinib ko`ring.")
 
 
 def get_product_id_by_name(product_name):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT product_id FROM products WHERE product_name=?", (product_name,))
-    product_id = c.fetchone()
-    conn.close()
-    return product_id[0] if product_id else None
+    return product_catalogue.id_by_name(product_name)
 
 
 # Step 3: Handle the user's input data for orders
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'awaiting_order_data')
+@router.state('awaiting_order_data')
 @user_command_wrapper
 def receive_order_data(message):
     user_id = str(message.from_user.id)
     user_input = message.text.strip()
     selected_client_id = admin_selected_clients.get(user_id)
 
-    keyboard = products_list_keyboard()
-
     if message.text == "Bosh menyu":
         back_to_menu(message)
         return
@@ -1140,8 +958,8 @@ def receive_order_data(message):
         return
 
     if message.text == "Mahsulot qo'shish":
-        bot.send_message(message.chat.id, "Yangi mahsulot nomini va narxini ko'rsatilgan tartibda kiriting.")
-        bot.send_message(message.chat.id, "Masalan: Pomidor, 5000")
+        outbox.send_message(message.chat.id, "Yangi mahsulot nomini va narxini ko'rsatilgan tartibda kiriting.")
+        outbox.send_message(message.chat.id, "Masalan: Pomidor, 5000")
         user_states[user_id] = 'adding_new_product'
         return
 
@@ -1152,21 +970,54 @@ def receive_order_data(message):
             mes, total_sum = confirm_cart(cart)
             markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
             markup.add(KeyboardButton("Ha"), KeyboardButton("Yo'q"))
-            bot.send_message(message.chat.id, mes, reply_markup=markup)
+            outbox.send_message(message.chat.id, mes, reply_markup=markup)
             user_states[user_id] = 'confirming_order'
         else:
             # add product to the cart and ask quantity
             product_id = get_product_id_by_name(user_input)
-            user_cart[selected_client_id][product_id] = 0
+            if product_id is None:
+                # Not a keyboard button, so read the message as a pasted "name quantity" list
+                receive_bulk_order(message, selected_client_id)
+                return
+            cart = user_cart.get(selected_client_id, {})
+            cart[product_id] = 0
+            user_cart[selected_client_id] = cart  # reassign so the change is persisted
             cur_product[selected_client_id] = product_id
-            bot.send_message(message.chat.id, "Mahsulot miqdorini kiriting:")
+            outbox.send_message(message.chat.id, "Mahsulot miqdorini kiriting:")
             user_states[user_id] = 'awaiting_product_quantity'
     else:
-        bot.send_message(message.chat.id, "Mijoz tanlanmagan. Iltimos, qaytadan urinib ko`ring.")
+        outbox.send_message(message.chat.id, "Mijoz tanlanmagan. Iltimos, qaytadan urinib ko`ring.")
+
+
+def receive_bulk_order(message, selected_client_id):
+    user_id = str(message.from_user.id)
+    parsed, problems = bulk_entry.parse(message.text, product_catalogue.lookup)
+    if not parsed:
+        outbox.send_message(message.chat.id, "Mahsulot topilmadi. Har bir qatorga mahsulot nomi va miqdorini yozing, "
+                                             "masalan:\nPomidor 5\nKartoshka 10")
+        return
+
+    cart = user_cart.get(selected_client_id, {})
+    cart.update(parsed)
+    user_cart[selected_client_id] = cart  # reassign so the change is persisted
+    mes, total_sum = confirm_cart(cart)
+
+    if problems:
+        # Let the admin add the missing lines before confirming
+        outbox.send_message(message.chat.id, "Quyidagi qatorlar tushunilmadi:\n" + "\n".join(problems))
+        outbox.send_message(message.chat.id, mes)
+        outbox.send_message(message.chat.id, "Qolgan mahsulotlarni qo'shing yoki \"Buyurtma yig'ildi\" ni bosing.",
+                            reply_markup=products_list_keyboard())
+        return
+
+    markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
+    markup.add(KeyboardButton("Ha"), KeyboardButton("Yo'q"))
+    outbox.send_message(message.chat.id, mes, reply_markup=markup)
+    user_states[user_id] = 'confirming_order'
 
 
 # Step 4: Handle the addition of a new product
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'adding_new_product')
+@router.state('adding_new_product')
 @user_command_wrapper
 def add_new_product(message):
     user_id = str(message.from_user.id)
@@ -1181,41 +1032,34 @@ def add_new_product(message):
         return
 
     try:
-        conn = create_db_connection()
-        c = conn.cursor()
         product_name, product_price = user_input.split(", ")
-        c.execute("INSERT INTO products (product_name, product_price) VALUES (?, ?)", (product_name.strip(), product_price))
-        conn.commit()
-        conn.close()
+        db.execute("INSERT INTO products (product_name, product_price) VALUES (?, ?)", (product_name.strip(), product_price))
+        product_catalogue.invalidate()
         keyboard = products_list_keyboard()
-        bot.send_message(message.chat.id, "Yangi mahsulot muvaffaqiyatli qo`shildi.", reply_markup=keyboard)
+        outbox.send_message(message.chat.id, "Yangi mahsulot muvaffaqiyatli qo`shildi.", reply_markup=keyboard)
         user_states[user_id] = 'awaiting_order_data'
     except ValueError:
         # Handle specific unpacking errors
-        bot.send_message(
+        outbox.send_message(
             message.chat.id, 
             "Mahsulotni qo`shishda xatolik yuz berdi: Yangi mahsulot nomini va narxini ko'rsatilgan tartibda kiriting. Masalan: Pomidor, 5000"
         )
     except Exception as e:
         # Handle other exceptions
-        bot.send_message(message.chat.id, f"Mahsulotni qo`shishda xatolik yuz berdi: {e}")
+        outbox.send_message(message.chat.id, f"Mahsulotni qo`shishda xatolik yuz berdi: {e}")
         user_states[user_id] = None
 
 
 def user_cart_to_str(cart):
     message = ""
     for product_id, quantity in cart.items():
-        conn = create_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT product_name FROM products WHERE product_id=?", (product_id,))
-        product_name = c.fetchone()
-        conn.close()
+        product_name = product_catalogue.get(product_id)
         message += f"{product_name[0]}: {quantity}\n"
     return message
 
 
 # Step 5: Handle the user's input for product quantity
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'awaiting_product_quantity')
+@router.state('awaiting_product_quantity')
 @user_command_wrapper
 def receive_product_quantity(message):
     user_id = str(message.from_user.id)
@@ -1233,100 +1077,37 @@ def receive_product_quantity(message):
     if selected_client_id:
         if user_input.isdigit():
             product_id = cur_product[selected_client_id]
-            user_cart[selected_client_id][product_id] = int(user_input)
-            bot.send_message(message.chat.id, "Mahsulot qo'shildi.")
-            bot.send_message(message.chat.id, user_cart_to_str(user_cart[selected_client_id]))
-            print(user_cart)
+            cart = user_cart.get(selected_client_id, {})
+            cart[product_id] = int(user_input)
+            user_cart[selected_client_id] = cart  # reassign so the change is persisted
+            outbox.send_message(message.chat.id, "Mahsulot qo'shildi.")
+            outbox.send_message(message.chat.id, user_cart_to_str(user_cart[selected_client_id]))
+            logger.debug("Cart of client %s: %s", selected_client_id, user_cart.get(selected_client_id))
             user_states[user_id] = 'awaiting_order_data'
             markup = products_list_keyboard()  # Display the product selection menu again
-            bot.send_message(message.chat.id, "Iltimos, mahsulotni tanlang yoki menyudan birini tanlang:", reply_markup=markup)
+            outbox.send_message(message.chat.id, "Iltimos, mahsulotni tanlang yoki menyudan birini tanlang:", reply_markup=markup)
         else:
-            bot.send_message(message.chat.id, "Miqdor raqam bo'lishi kerak.")
+            outbox.send_message(message.chat.id, "Miqdor raqam bo'lishi kerak.")
     else:
-        bot.send_message(message.chat.id, "Mijoz tanlanmagan. Iltimos, qaytadan urinib ko`ring.")
+        outbox.send_message(message.chat.id, "Mijoz tanlanmagan. Iltimos, qaytadan urinib ko`ring.")
 
 
 def confirm_cart(cart):
+    lines, total_sum = pricing.price_cart(cart)
     message = "Sizning buyurtmangiz:\n"
-    total_sum = 0
-    for product_id, quantity in cart.items():
-        conn = create_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT product_name, product_price FROM products WHERE product_id=?", (product_id,))
-        product = c.fetchone()
-        conn.close()
-        product_name = product[0]
-        product_price = product[1]
-        total_sum += product_price * quantity
-        message += f"{product_name}: {quantity} x {product_price:,} = {(quantity * product_price):,}\n"
+    for line in lines:
+        message += f"{line.product_name}: {line.quantity} x {line.product_price:,} = {(line.quantity * line.product_price):,}\n"
     message += f"Jami summa: {total_sum:,}"
     return message, total_sum
 
 
-def add_order_to_db(cart, total_sum, user_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT debt FROM users WHERE user_id=?", (user_id,))
-    before_debt = c.fetchone()[0]
-    print(before_debt)
-    if before_debt is None:
-        before_debt = 0
-    total_debt = before_debt + total_sum
-    date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    total_quantity = sum(cart.values())
-    c.execute("INSERT INTO orders (user_id, total_sum, total_quantity, total_debt, order_date, before_order_debt) "
-              "VALUES (?, ?, ?, ?, ?, ?)", (user_id, total_sum, total_quantity, total_debt, date, before_debt))
-    order_id = c.lastrowid
-    for product_id, quantity in cart.items():
-        price = c.execute("SELECT product_price FROM products WHERE product_id=?", (product_id,)).fetchone()[0]
-        c.execute("INSERT INTO itemInOrder (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
-                  (order_id, product_id, quantity, price))
-    c.execute("UPDATE users SET debt=? WHERE user_id=?", (total_debt, user_id))
-    conn.commit()
-    conn.close()
-
-
 def get_user_telegram_id(user_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT telegram_id FROM users WHERE user_id=?", (user_id,))
-    telegram_id = c.fetchone()
-    conn.close()
+    telegram_id = db.query_one("SELECT telegram_id FROM users WHERE user_id=?", (user_id,))
     return telegram_id[0] if telegram_id else None
 
 
-def order_receipt_str(order_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    
-    # Fetch the order details
-    c.execute("SELECT * FROM orders WHERE order_id=?", (order_id,))
-    order = c.fetchone()
-
-    # Fetch the product details from itemInOrder (use itemInOrder.product_name to avoid ambiguity)
-    c.execute("""
-        SELECT itemInOrder.product_name, itemInOrder.quantity, itemInOrder.price 
-        FROM itemInOrder
-        WHERE itemInOrder.order_id=?
-    """, (order_id,))
-    products = c.fetchall()
-    conn.close()
-
-    # Format the receipt
-    message = f"Buyurtma ID: {order[0]}\n"
-    message += f"Sana: {order[2]}\n\n"
-    message += "Mahsulotlar:\n"
-    for product in products:
-        message += f"{product[0]}: {product[1]} x {product[2]:,} = {(product[1] * product[2]):,}\n"
-    message += f"\nJami summa: {order[3]:,}\n"
-    message += f"Jami miqdor: {order[4]:,}\n"
-    message += f"Oldindan bor qarz: {order[6]:,}\n"
-    message += f"Jami qarz: {order[5]:,}\n"
-    return message
-
-
 # Step 6: Handle the confirmation of the order
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'confirming_order')
+@router.state('confirming_order')
 def handle_confirm_order(message):
     user_id = str(message.from_user.id)
     selected_user_id = admin_selected_clients.get(user_id)
@@ -1335,57 +1116,45 @@ def handle_confirm_order(message):
         cart = user_cart[selected_user_id]
 
         # Convert cart to product list
-        products = []
-        for product_id, quantity in cart.items():
-            conn = create_db_connection()
-            c = conn.cursor()
-            c.execute("SELECT product_name, product_price FROM products WHERE product_id=?", (product_id,))
-            product_data = c.fetchone()
-            conn.close()
-            if product_data:
-                product_name, product_price = product_data
-                products.append({
-                    'product_name': product_name,
-                    'product_price': product_price,
-                    'product_quantity': quantity
-                })
+        lines, _ = pricing.price_cart(cart)
+        products = [
+            {
+                'product_id': line.product_id,
+                'product_name': line.product_name,
+                'product_price': line.product_price,
+                'product_quantity': line.quantity
+            }
+            for line in lines
+        ]
 
         total_sum = sum(p['product_price'] * p['product_quantity'] for p in products)
         total_quantity = sum(p['product_quantity'] for p in products)
-        before_order_debt = get_user_debt(selected_user_id)
-        print(before_order_debt, selected_user_id)
-        if before_order_debt is None:
-            before_order_debt = 0
-        total_debt = before_order_debt + total_sum
 
-        # Add order
+        # Add order; its debt figures come from the ledger inside the insert's transaction
         new_order_id = add_order(
             user_id=selected_user_id,
             saved_name="",
-            debt=total_debt,
             order_date=datetime.now().strftime("%Y-%m-%d"),
             products=products,
             total_sum=total_sum,
-            total_quantity=total_quantity,
-            total_debt=total_debt,
-            before_order_debt=before_order_debt
+            total_quantity=total_quantity
         )
 
         # Notify admin about pending confirmation
-        bot.send_message(message.chat.id, "Buyurtma muvaffaqiyatli qo`shildi. Tasdiqlash uchun mijozga yuborildi.")
+        outbox.send_message(message.chat.id, "Buyurtma muvaffaqiyatli qo`shildi. Tasdiqlash uchun mijozga yuborildi.")
 
         client_telegram_id = get_user_telegram_id(selected_user_id)
         if client_telegram_id:
             order_receipt = order_receipt_str(new_order_id)
             confirm_buttons = InlineKeyboardMarkup()
             confirm_buttons.add(InlineKeyboardButton("Tasdiqlash", callback_data=f"confirm_order_{new_order_id}"))
-            bot.send_message(client_telegram_id, order_receipt, reply_markup=confirm_buttons)
+            outbox.send_message(client_telegram_id, order_receipt, reply_markup=confirm_buttons)
             user_states[client_telegram_id] = 'confirming_order'
         user_states[user_id] = "awaiting_order_confirmation"
         back_to_menu(message)
 
     elif message.text == "Yo'q":
-        bot.send_message(message.chat.id, "Buyurtma bekor qilindi.")
+        outbox.send_message(message.chat.id, "Buyurtma bekor qilindi.")
         user_states[user_id] = None
         back_to_menu(message)
 
@@ -1395,22 +1164,12 @@ def handle_confirm_order(message):
 def handle_confirm_order_callback(call):
     order_id = int(call.data.split("_")[-1])
 
-    conn = create_db_connection()
-    c = conn.cursor()
-
-    # Check if already confirmed
-    c.execute("SELECT is_confirmed FROM orders WHERE order_id=?", (order_id,))
-    is_confirmed = c.fetchone()[0]
-
-    if is_confirmed:
+    # Confirm the order; no row changes if it was already confirmed
+    if db.execute("UPDATE orders SET is_confirmed=1 WHERE order_id=? AND COALESCE(is_confirmed, 0)=0", (order_id,)).rowcount == 0:
         bot.answer_callback_query(call.id, "Bu buyurtma allaqachon tasdiqlangan.")
         return
 
-    # Confirm the order
-    c.execute("UPDATE orders SET is_confirmed=1 WHERE order_id=?", (order_id,))
-    conn.commit()
-
-    # Get order details for confirmation message
+    # Rendered when the order was added, so this is a cache hit
     order_summary = order_receipt_str(order_id)
 
     # Notify the client with the order details
@@ -1422,60 +1181,22 @@ def handle_confirm_order_callback(call):
     )
 
     # Notify the admin(s)
-    c.execute("SELECT telegram_id FROM users WHERE type='admin'")
-    admins = c.fetchall()
-    conn.close()
+    admins = db.query_all("SELECT telegram_id FROM users WHERE type='admin'")
 
     if admins:
         for admin in admins:
-            bot.send_message(admin[0], f"📢 *Buyurtma tasdiqlandi!*\n\n{order_summary}", parse_mode="Markdown")
+            outbox.send_message(admin[0], f"📢 *Buyurtma tasdiqlandi!*\n\n{order_summary}", parse_mode="Markdown")
 
     bot.answer_callback_query(call.id, "Buyurtma tasdiqlandi.")
 
 
 def order_receipt_str(order_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-
-    # Fetch order details
-    c.execute("SELECT * FROM orders WHERE order_id=?", (order_id,))
-    order = c.fetchone()
-
-    if not order:
-        conn.close()
-        return "Buyurtma topilmadi."
-
-    order_id, user_id, order_date, total_sum, total_quantity, total_debt, before_order_debt, is_confirmed = order
-
-    # Fetch products in the order
-    c.execute("""
-        SELECT itemInOrder.product_name, itemInOrder.quantity, itemInOrder.price 
-        FROM itemInOrder
-        WHERE itemInOrder.order_id=?
-    """, (order_id,))
-    products = c.fetchall()
-    conn.close()
-
-    # Format the receipt message
-    message = f"📦 Buyurtma ID: {order_id}\n📅 Sana: {order_date}\n\n"
-    message += "🛍 Mahsulotlar:\n"
-    for product in products:
-        product_name, quantity, price = product
-        total_price = quantity * price
-        message += f"- {product_name}: {quantity} x {price:,} = {total_price:,} so'm\n"
-
-    message += f"\n💰 Jami summa: {total_sum:,} so'm\n"
-    message += f"📦 Jami miqdor: {total_quantity}\n"
-    message += f"📉 Oldindan bor qarz: {before_order_debt:,} so'm\n"
-    message += f"💳 Jami qarz: {total_debt:,} so'm\n"
-
-    return message
-
-
+    receipt = receipt_cache.get(order_id)
+    return receipt if receipt is not None else "Buyurtma topilmadi."
 
 
 # Example of using delete_order function
-@bot.message_handler(func=lambda message: message.text == "/delete_order" or message.text == "Buyurtmani o'chirish")
+@router.text("/delete_order", "Buyurtmani o'chirish")
 @user_command_wrapper
 def handle_delete_order(message):
     user_id = str(message.from_user.id)
@@ -1484,7 +1205,7 @@ def handle_delete_order(message):
     if client_choice == "Bosh menyu":
         # Clear the state and navigate back to the main menu
         user_states[user_id] = None
-        print(f"Debug: User {user_id} selected 'Bosh menyu', resetting state and returning to menu.")
+        logger.debug("User %s selected 'Bosh menyu', resetting state and returning to menu.", user_id)
         back_to_menu(message)
         return
 
@@ -1493,44 +1214,23 @@ def handle_delete_order(message):
         return
 
     if is_admin(user_id):
-        clients = list_clients()
-
-        if clients:
-            markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-            for client_id, client_data in clients.items():
-                if client_data['last_name'] == '' or client_data['last_name'] is None:
-                    markup.add(KeyboardButton(f"{client_data['first_name']} ({client_id})"))
-                else:
-                    markup.add(KeyboardButton(f"{client_data['first_name']} {client_data['last_name']} ({client_id})"))
-            markup.add(KeyboardButton("Bosh menyu"))
-
-            user_states[user_id] = 'selecting_client_for_order_deletion'
-            bot.send_message(message.chat.id, "Mijozni tanlang", reply_markup=markup)
-        else:
-            markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-            markup.add(KeyboardButton("Bosh menyu"))
-
-            # Reset the state and notify the user
-            user_states[user_id] = None
-            print(f"Debug: No clients found for user {user_id}.")
-            bot.send_message(message.chat.id, "Bunday mijozlar topilmadi.", reply_markup=markup)
+        ask_for_client(message, 'selecting_client_for_order_deletion', "Mijozni tanlang:")
     else:
-        bot.send_message(message.chat.id, "Sizda buyurtmani o`chirishga ruxsat yo`q.")
+        outbox.send_message(message.chat.id, "Sizda buyurtmani o`chirishga ruxsat yo`q.")
 
 
 # Catch-all handler for "Bosh menyu" in case of state inconsistencies
-@bot.message_handler(func=lambda message: message.text == "Bosh menyu")
+@router.text("Bosh menyu")
 def handle_main_menu_navigation(message):
     user_id = str(message.from_user.id)
-    print(f"Debug: User {user_id} pressed 'Bosh menyu'. Returning to main menu.")
+    logger.debug("User %s pressed 'Bosh menyu'. Returning to main menu.", user_id)
     user_states[user_id] = None  # Reset the state
     back_to_menu(message)
 
 
 
 # Handle the selection of a client for deleting an order
-@bot.message_handler(
-    func=lambda message: user_states.get(str(message.from_user.id)) == 'selecting_client_for_order_deletion')
+@router.state('selecting_client_for_order_deletion')
 @user_command_wrapper
 def handle_select_client_for_order_deletion(message):
     user_id = str(message.from_user.id)
@@ -1538,7 +1238,7 @@ def handle_select_client_for_order_deletion(message):
 
     if client_choice == "Bosh menyu":
         # Go to the main menu from the client list
-        print(f"Debug: User {user_id} selected 'Bosh menyu' - returning to main menu")
+        logger.debug("User %s selected 'Bosh menyu' - returning to main menu", user_id)
         user_states[user_id] = None
         back_to_menu(message)
         return
@@ -1548,19 +1248,19 @@ def handle_select_client_for_order_deletion(message):
         return
 
     try:
-        # Ensure the client choice contains a valid client ID
-        if "(" not in client_choice or ")" not in client_choice:
-            bot.send_message(message.chat.id, "Mijoz tanlash noto'g'ri. Qayta urinib ko'ring.")
+        # Anything but a picked client is a search
+        if not CLIENT_CHOICE.search(client_choice):
+            send_client_results(message.chat.id, user_id, client_choice)
             return
 
         # Extract client ID from the selected text (the ID is in parentheses)
         selected_client_id = client_choice.split('(')[-1].strip(')')
-        print(f"Debug: Extracted Selected Client ID: {selected_client_id}")
+        logger.debug("Extracted selected client ID: %s", selected_client_id)
         admin_selected_clients[user_id] = selected_client_id
 
         # Fetch orders by user_id (client ID in this case)
         orders = fetch_orders_by_user_id(selected_client_id)
-        print(f"Debug: Fetched Orders for Client ID {selected_client_id}: {orders}")
+        logger.debug("Fetched %d orders for client ID %s", len(orders), selected_client_id)
 
         if orders:
             # Create a ReplyKeyboardMarkup for the orders
@@ -1572,53 +1272,31 @@ def handle_select_client_for_order_deletion(message):
                     order_total = order[3]
                     markup.add(KeyboardButton(f"Buyurtma ID: {order_id}, Miqdor: {order_total:,}, Sana: {order_date}"))
                 except Exception as e:
-                    print(f"Error processing order {order}: {e}")
+                    logger.warning("Error processing order %s: %s", order, e)
 
             # Add the "Bosh menyu" button
             markup.add(KeyboardButton("Bosh menyu"))
 
             # Update user state and send the menu
             user_states[user_id] = 'selecting_order_for_deletion'
-            bot.send_message(message.chat.id, "O'chirish uchun buyurtmani tanlang:", reply_markup=markup)
+            outbox.send_message(message.chat.id, "O'chirish uchun buyurtmani tanlang:", reply_markup=markup)
         else:
             # No orders found, provide a fallback menu
-            print(f"Debug: No orders found for Client ID {selected_client_id}")
+            logger.debug("No orders found for client ID %s", selected_client_id)
             markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
             markup.add(KeyboardButton("Bosh menyu"))
-            bot.send_message(message.chat.id, "Mijozda buyurtmalar topilmadi.", reply_markup=markup)
+            outbox.send_message(message.chat.id, "Mijozda buyurtmalar topilmadi.", reply_markup=markup)
 
     except Exception as e:
-        print(f"Error while selecting client for order deletion: {e}")
-        bot.send_message(message.chat.id, f"Mijoz noto'g'ri tanlangan: {e}")
+        logger.error("Error while selecting client for order deletion: %s", e, exc_info=True)
+        outbox.send_message(message.chat.id, f"Mijoz noto'g'ri tanlangan: {e}")
 
 
 def show_clients_list(message):
     """
     Show the list of clients to the admin for selection.
     """
-    user_id = str(message.from_user.id)
-
-    try:
-        # Fetch the list of clients
-        conn = create_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT user_id, first_name, last_name FROM users WHERE type='client'")
-        clients = c.fetchall()
-        conn.close()
-
-        if clients:
-            markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-            for client in clients:
-                client_id, first_name, last_name = client
-                markup.add(KeyboardButton(f"{first_name} {last_name} ({client_id})"))
-            markup.add(KeyboardButton("Bosh menyu"))
-            user_states[user_id] = 'selecting_client_for_order_deletion'
-            bot.send_message(message.chat.id, "Mijozni tanlang:", reply_markup=markup)
-        else:
-            bot.send_message(message.chat.id, "Mijozlar topilmadi.")
-    except Exception as e:
-        print(f"Error fetching clients: {e}")
-        bot.send_message(message.chat.id, f"Mijozlar ro'yxatini yuklashda xatolik: {e}")
+    ask_for_client(message, 'selecting_client_for_order_deletion', "Mijozni tanlang:")
 
 
 def parse_date_safe(date_str):
@@ -1633,53 +1311,44 @@ def parse_date_safe(date_str):
             return "Noma'lum sana"  # Fallback if both fail
 
 def fetch_orders_by_user_id(user_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM orders WHERE user_id = ?", (user_id,))
-    orders = c.fetchall()
-    conn.close()
-    return orders
+    return db.query_all("SELECT * FROM orders WHERE user_id = ?", (user_id,))
 
 
 
 def get_order_by_id(order_id):
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("""
+    return db.query_one("""
         SELECT orders.order_id, orders.user_id, orders.order_date, 
                orders.total_sum, orders.total_quantity, 
                orders.total_debt, orders.before_order_debt, orders.is_confirmed
         FROM orders 
         WHERE orders.order_id=?
     """, (order_id,))
-    order = c.fetchone()
-    conn.close()
-    return order
 
 
 def delete_order_by_id(order_id):
-    conn = create_db_connection()
-    c = conn.cursor()
+    with db.transaction() as c:
+        # Fetch user_id and order_total_sum for updating user's debt
+        c.execute("SELECT user_id, total_sum FROM orders WHERE order_id=?", (order_id,))
+        user_id, order_total_sum = c.fetchone()
 
-    # Fetch user_id and order_total_sum for updating user's debt
-    c.execute("SELECT user_id, total_sum FROM orders WHERE order_id=?", (order_id,))
-    user_id, order_total_sum = c.fetchone()
+        # Take the order out of the sales aggregates while its lines still exist
+        sales.record_order(c, order_id, sign=-1)
 
-    # Delete items in the order
-    c.execute("DELETE FROM itemInOrder WHERE order_id=?", (order_id,))
+        # Delete items in the order
+        c.execute("DELETE FROM itemInOrder WHERE order_id=?", (order_id,))
 
-    # Delete the order itself
-    c.execute("DELETE FROM orders WHERE order_id=?", (order_id,))
+        # Delete the order itself
+        c.execute("DELETE FROM orders WHERE order_id=?", (order_id,))
 
-    # Update the user's debt
-    c.execute("UPDATE users SET debt=debt-? WHERE user_id=?", (order_total_sum, user_id))
-    conn.commit()
-    conn.close()
+        # Reverse the order's debt
+        ledger.post(c, user_id, ledger.ADJUSTMENT, -order_total_sum, order_id=order_id,
+                    comment="Buyurtma o'chirildi")
+
+    receipt_cache.invalidate(order_id)
 
 
 # Handle the selection of an order for deletion
-@bot.message_handler(
-    func=lambda message: user_states.get(str(message.from_user.id)) == 'selecting_order_for_deletion')
+@router.state('selecting_order_for_deletion')
 @user_command_wrapper
 def handle_select_order_for_deletion(message):
     user_id = str(message.from_user.id)
@@ -1687,7 +1356,7 @@ def handle_select_order_for_deletion(message):
 
     if order_choice == "Bosh menyu":
         # Go back to the client list from the order list
-        print(f"Debug: User {user_id} selected 'Bosh menyu' - returning to client list")
+        logger.debug("User %s selected 'Bosh menyu' - returning to client list", user_id)
         user_states[user_id] = 'selecting_client_for_order_deletion'
         show_clients_list(message)  # Function to show the list of clients
         return
@@ -1699,21 +1368,21 @@ def handle_select_order_for_deletion(message):
     try:
         # Ensure the order choice contains a valid order ID
         if "Buyurtma ID:" not in order_choice:
-            bot.send_message(message.chat.id, "Buyurtma tanlash noto'g'ri. Qayta urinib ko'ring.")
+            outbox.send_message(message.chat.id, "Buyurtma tanlash noto'g'ri. Qayta urinib ko'ring.")
             return
 
         # Extract order ID from the selected text
         selected_order_id = int(order_choice.split(':')[1].split(',')[0].strip())
-        print(f"Debug: Extracted Selected Order ID: {selected_order_id}")
+        logger.debug("Extracted selected order ID: %s", selected_order_id)
 
         # Confirm deletion
         delete_order_by_id(selected_order_id)  # Function to delete the order
-        bot.send_message(message.chat.id, f"Buyurtma ID: {selected_order_id} muvaffaqiyatli o'chirildi.")
+        outbox.send_message(message.chat.id, f"Buyurtma ID: {selected_order_id} muvaffaqiyatli o'chirildi.")
         back_to_menu(message)
 
     except Exception as e:
-        print(f"Error while selecting order for deletion: {e}")
-        bot.send_message(message.chat.id, f"Buyurtma noto'g'ri tanlangan: {e}")
+        logger.error("Error while selecting order for deletion: %s", e, exc_info=True)
+        outbox.send_message(message.chat.id, f"Buyurtma noto'g'ri tanlangan: {e}")
 
 
 def get_client_full_name(user_id):
@@ -1721,11 +1390,7 @@ def get_client_full_name(user_id):
     Retrieve the full name of a client from the database.
     Handles cases where first_name or last_name may be NULL.
     """
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT first_name, last_name FROM users WHERE user_id=?", (user_id,))
-    result = c.fetchone()
-    conn.close()
+    result = db.query_one("SELECT first_name, last_name FROM users WHERE user_id=?", (user_id,))
 
     if result:
         first_name, last_name = result
@@ -1735,128 +1400,109 @@ def get_client_full_name(user_id):
     return "Noma'lum"
 
 
+def order_history_str(order, show_client=False):
+    """
+    Format one order_reports.Order for the /list_orders history.
+    """
+    product_details = "\n".join([
+        f"{product[0]} ({product[1]} x {product[2]:,})"
+        for product in order.products
+    ])
+    message_text = f"Mijoz: {order.client_name or 'Nomalum'}\n" if show_client else ""
+    message_text += (
+        f"Buyurtma ID: {order.order_id}\n"
+        f"Sana: {parse_date_safe(order.order_date)}\n"
+        f"Mahsulotlar:\n{product_details}\n"
+        f"\nBuyurtmadan oldingi qarz: {order.before_order_debt:,} so'm\n"
+        f"Jami buyurtma summasi: {order.total_sum:,} so'm\n"
+        f"Buyurtmadan keyengi qarz: {order.total_debt:,} so'm\n"
+        f"Tasdiqlangan: {'Ha' if order.is_confirmed else 'Yoq'}\n\n\n"
+    )
+    return message_text
+
+
+def send_orders_page(chat_id, telegram_id, before=None, after=None):
+    """
+    Send one page of order history with inline buttons to move between pages.
+
+    Admins page through every order, clients through their own.
+    """
+    identity = get_identity(telegram_id)
+    if identity and identity[1] == 'client':
+        client_id, show_client, header = identity[0], False, "Sizning buyurtmalaringiz:\n\n"
+        not_found = "Sizning buyurtmalaringiz topilmadi."
+    elif identity and identity[1] == 'admin':
+        client_id, show_client, header = None, True, "Barcha buyurtmalar:\n\n"
+        not_found = "Buyurtmalar topilmadi."
+    else:
+        outbox.send_message(chat_id, "Sizda buyurtmalarni ko'rish uchun ruxsat yo'q.")
+        return
+
+    orders, newer_cursor, older_cursor = order_reports.fetch_page(client_id, before=before, after=after)
+    if not orders:
+        outbox.send_message(chat_id, not_found)
+        return
+
+    builder = order_reports.MessageBuilder()
+    builder.add(header)
+    for order in orders:
+        builder.add(order_history_str(order, show_client))
+
+    markup = None
+    if newer_cursor or older_cursor:
+        markup = InlineKeyboardMarkup()
+        buttons = []
+        if newer_cursor:
+            buttons.append(InlineKeyboardButton("⬅️ Yangiroq", callback_data=f"orders_after_{newer_cursor}"))
+        if older_cursor:
+            buttons.append(InlineKeyboardButton("Eskiroq ➡️", callback_data=f"orders_before_{older_cursor}"))
+        markup.add(*buttons)
+
+    messages = builder.messages()
+    for i, text in enumerate(messages):
+        outbox.send_message(chat_id, text, reply_markup=markup if i == len(messages) - 1 else None)
+
+
 # Handle the /list_orders command
-@bot.message_handler(func=lambda message: message.text == "/list_orders" or message.text == "Buyurtmalarni ko'rish")
+@router.text("/list_orders", "Buyurtmalarni ko'rish")
 @user_command_wrapper
 def handle_list_orders(message):
-    user_id = str(message.from_user.id)
+    send_orders_page(message.chat.id, message.from_user.id)
+    back_to_menu(message)
 
-    # Check if the user is a client
-    if is_client(user_id):
-        orders_list = list_orders_db(message.from_user.id)
-        if orders_list:
-            message_text = "Sizning buyurtmalaringiz:\n\n"
-            for order in orders_list:
-                order_id, user_id, order_date, total_sum, total_quantity, total_debt, before_order_debt, is_confirmed = order
-                order_date = parse_date_safe(order_date)
-
-                # Fetch products for the order
-                conn = create_db_connection()
-                c = conn.cursor()
-                c.execute("""
-                    SELECT product_name, quantity, product_price 
-                    FROM itemInOrder 
-                    WHERE order_id = ?
-                """, (order_id,))
-                products = c.fetchall()
-                conn.close()
-
-                # Format product list
-                product_details = "\n".join([
-                    f"{product[0]} ({product[1]} x {product[2]:,})"
-                    for product in products
-                ])
 
-                # Append order details to message
-                message_text += (
-                    f"Buyurtma ID: {order_id}\n"
-                    f"Sana: {order_date}\n"
-                    f"Mahsulotlar:\n{product_details}\n"
-                    f"\nBuyurtmadan oldingi qarz: {before_order_debt:,} so'm\n"
-                    f"Jami buyurtma summasi: {total_sum:,} so'm\n"
-                    f"Buyurtmadan keyengi qarz: {total_debt:,} so'm\n"
-                    f"Tasdiqlangan: {'Ha' if is_confirmed else 'Yoq'}\n\n\n"
-                )
-            bot.send_message(message.chat.id, message_text)
-        else:
-            bot.send_message(message.chat.id, "Sizning buyurtmalaringiz topilmadi.")
-
-    elif is_admin(user_id):
-        orders_list = list_orders_db_admin()
-        if orders_list:
-            message_text = "Barcha buyurtmalar:\n\n"
-            for order in orders_list:
-                order_id, user_id, order_date, total_sum, total_quantity, total_debt, before_order_debt, is_confirmed = order
-                order_date = parse_date_safe(order_date)
-
-                # Fetch products for the order
-                conn = create_db_connection()
-                c = conn.cursor()
-                c.execute("""
-                    SELECT product_name, quantity, product_price 
-                    FROM itemInOrder 
-                    WHERE order_id = ?
-                """, (order_id,))
-                products = c.fetchall()
-                conn.close()
-
-                # Format product list
-                product_details = "\n".join([
-                    f"{product[0]} ({product[1]} x {product[2]:,})"
-                    for product in products
-                ])
-                full_name = get_client_full_name(user_id)
-
-                # Append order details to message
-                message_text += (
-                    f"Mijoz: {full_name or 'Nomalum'}\n"
-                    f"Buyurtma ID: {order_id}\n"
-                    f"Sana: {order_date}\n"
-                    f"Mahsulotlar:\n{product_details}\n"
-                    f"\nBuyurtmadan oldingi qarz: {before_order_debt:,} so'm\n"
-                    f"Jami buyurtma summasi: {total_sum:,} so'm\n"
-                    f"Buyurtmadan keyengi qarz: {total_debt:,} so'm\n"
-                    f"Tasdiqlangan: {'Ha' if is_confirmed else 'Yoq'}\n\n\n"
-                )
-            bot.send_message(message.chat.id, message_text)
-        else:
-            bot.send_message(message.chat.id, "Buyurtmalar topilmadi.")
+# Handle the order history page buttons
+@bot.callback_query_handler(func=lambda call: call.data.startswith("orders_before_") or call.data.startswith("orders_after_"))
+def handle_orders_page_callback(call):
+    cursor = int(call.data.split("_")[-1])
+    if call.data.startswith("orders_before_"):
+        send_orders_page(call.message.chat.id, call.from_user.id, before=cursor)
     else:
-        bot.send_message(message.chat.id, "Sizda buyurtmalarni ko'rish uchun ruxsat yo'q.")
-
-    back_to_menu(message)
+        send_orders_page(call.message.chat.id, call.from_user.id, after=cursor)
+    bot.answer_callback_query(call.id)
 
 
 
 # Handle the /list_products command
-@bot.message_handler(commands=['list_products'])
+@router.command('list_products')
 @user_command_wrapper
 def handle_list_products(message):
     user_id = str(message.from_user.id)
     command_parts = message.text.split()
 
     if len(command_parts) < 2:
-        bot.send_message(message.chat.id, "Buyurtma ID ni kiritish kerak. Masalan: /list_products 1")
+        outbox.send_message(message.chat.id, "Buyurtma ID ni kiritish kerak. Masalan: /list_products 1")
         return
 
     order_id = command_parts[1]  # Extract order ID from the message
 
     if is_admin(user_id):
-        conn = create_db_connection()
-        c = conn.cursor()
-
         # Fetch all clients for admin
-        c.execute("SELECT user_id, first_name, last_name FROM users WHERE type='client'")
-        clients = c.fetchall()
-        conn.close()
+        clients = db.query_all("SELECT user_id, first_name, last_name FROM users WHERE type='client'")
 
         # Iterate through clients and their orders
         for client_id, first_name, last_name in clients:
-            conn = create_db_connection()
-            c = conn.cursor()
-            c.execute("SELECT * FROM orders WHERE user_id=?", (client_id,))
-            orders = c.fetchall()
-            conn.close()
+            orders = db.query_all("SELECT * FROM orders WHERE user_id=?", (client_id,))
 
             # Check if the order ID matches
             for order in orders:
@@ -1865,16 +1511,12 @@ def handle_list_products(message):
                     total_sum = order[3]  # Assuming order[3] is the total_sum column
 
                     # Fetch products associated with this order
-                    conn = create_db_connection()
-                    c = conn.cursor()
-                    c.execute("""
+                    products = db.query_all("""
                         SELECT p.product_name, io.quantity, io.price 
                         FROM itemInOrder io 
                         INNER JOIN products p ON io.product_id = p.product_id 
                         WHERE io.order_id=?
                     """, (order_id,))
-                    products = c.fetchall()
-                    conn.close()
 
                     # Prepare the product list
                     if products:
@@ -1892,34 +1534,27 @@ def handle_list_products(message):
                         + products_list
                         + f"\n\nJami summa: {total_sum} сўм"
                     )
-                    bot.send_message(message.chat.id, products_list)
+                    outbox.send_message(message.chat.id, products_list)
                     return
 
         # If no matching order is found
-        bot.send_message(message.chat.id, f"Buyurtma ID {order_id} topilmadi.")
+        outbox.send_message(message.chat.id, f"Buyurtma ID {order_id} topilmadi.")
 
     elif is_client(user_id):
         # Clients can only list their own products
-        conn = create_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT * FROM orders WHERE user_id=? AND order_id=?", (user_id, order_id))
-        order = c.fetchone()
+        order = db.query_one("SELECT * FROM orders WHERE user_id=? AND order_id=?", (user_id, order_id))
 
         if order:
             before_order_debt = order[6]  # Assuming order[6] is the before_order_debt column
             total_sum = order[3]  # Assuming order[3] is the total_sum column
 
             # Fetch products associated with this order
-            conn = create_db_connection()
-            c = conn.cursor()
-            c.execute("""
+            products = db.query_all("""
                 SELECT p.product_name, io.quantity, io.price 
                 FROM itemInOrder io 
                 INNER JOIN products p ON io.product_id = p.product_id 
                 WHERE io.order_id=?
             """, (order_id,))
-            products = c.fetchall()
-            conn.close()
 
             # Prepare the product list
             if products:
@@ -1936,85 +1571,70 @@ def handle_list_products(message):
                 + products_list
                 + f"\n\nJami summa: {total_sum} сўм"
             )
-            bot.send_message(message.chat.id, products_list)
+            outbox.send_message(message.chat.id, products_list)
         else:
-            bot.send_message(message.chat.id, f"Buyurtma ID {order_id} topilmadi.")
+            outbox.send_message(message.chat.id, f"Buyurtma ID {order_id} topilmadi.")
     else:
-        bot.send_message(message.chat.id, "Sizda buyurtmalarni ko'rishga ruxsat yo'q.")
+        outbox.send_message(message.chat.id, "Sizda buyurtmalarni ko'rishga ruxsat yo'q.")
 
 
-@bot.message_handler(func=lambda message: message.text == "To'lovni amalga oshirish")
+@router.text("To'lovni amalga oshirish")
 def handle_payment_button(message):
     handle_pay_debt(message)  # Reuse the /pay_debt logic
             
 
 def list_admins():
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT telegram_id FROM users WHERE type='admin'")
-    admins = c.fetchall()
-    conn.close()
+    admins = db.query_all("SELECT telegram_id FROM users WHERE type='admin'")
     
     if not admins:
-        print("No admins found in the database.")
+        logger.warning("No admins found in the database.")
         return []
     
     # Debug: Log the admin IDs
     admin_ids = [admin[0] for admin in admins]
-    print(f"Admin IDs: {admin_ids}")
+    logger.debug("Admin IDs: %s", admin_ids)
     return admin_ids
 
 
-# Add a table for payments
-def create_payments_table():
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS payments
-                 (payment_id INTEGER PRIMARY KEY, user_id INTEGER, amount INTEGER, is_confirmed INTEGER DEFAULT 0,
-                  FOREIGN KEY(user_id) REFERENCES users(user_id))''')
-    conn.commit()
-    conn.close()
-
-
 # Handle the /pay_debt command
-@bot.message_handler(commands=['pay_debt'])
+@router.command('pay_debt')
 def handle_pay_debt(message):
     user_id = str(message.from_user.id)
     if is_client(user_id):
-        bot.send_message(message.chat.id, "To'lagan summangizni kiriting:")
+        outbox.send_message(message.chat.id, "To'lagan summangizni kiriting:")
         user_states[user_id] = 'awaiting_payment_amount'
     else:
-        bot.send_message(message.chat.id, "Siz mijoz emassiz. Ushbu buyruq faqat mijozlar uchun mavjud.")
+        outbox.send_message(message.chat.id, "Siz mijoz emassiz. Ushbu buyruq faqat mijozlar uchun mavjud.")
 
 
 # Receive payment amount
-@bot.message_handler(func=lambda message: user_states.get(str(message.from_user.id)) == 'awaiting_payment_amount')
+@router.state('awaiting_payment_amount')
 def receive_payment_amount(message):
     user_id = str(message.from_user.id)
     try:
         amount = int(message.text.strip())
 
         if amount <= 0:
-            bot.send_message(message.chat.id, "❌ To'lov miqdori noto'g'ri. Iltimos, qaytadan kiriting.")
+            outbox.send_message(message.chat.id, "❌ To'lov miqdori noto'g'ri. Iltimos, qaytadan kiriting.")
             return
 
         # Store the amount and move to asking for comment
         user_states[user_id] = {'state': 'awaiting_payment_comment', 'amount': amount}
-        bot.send_message(message.chat.id, "📝 To'lov uchun izoh kiriting (Majburiy emas). Agar izoh yo'q bo'lsa, 'Yoq' deb yozing.")
+        outbox.send_message(message.chat.id, "📝 To'lov uchun izoh kiriting (Majburiy emas). Agar izoh yo'q bo'lsa, 'Yoq' deb yozing.")
 
     except ValueError:
-        bot.send_message(message.chat.id, "❌ Iltimos, to'lov miqdorini raqam sifatida kiriting.")
+        outbox.send_message(message.chat.id, "❌ Iltimos, to'lov miqdorini raqam sifatida kiriting.")
 
 
-@bot.message_handler(func=lambda message: isinstance(user_states.get(str(message.from_user.id)), dict) and user_states[str(message.from_user.id)]['state'] == 'awaiting_payment_comment')
+@router.state('awaiting_payment_comment')
 def receive_payment_comment(message):
     user_id = str(message.from_user.id)
     payment_data = user_states.get(user_id)
 
     if not payment_data or 'amount' not in payment_data:
-        bot.send_message(message.chat.id, "❌ Xatolik yuz berdi. Iltimos, to'lovni qaytadan kiriting.")
+        outbox.send_message(message.chat.id, "❌ Xatolik yuz berdi. Iltimos, to'lovni qaytadan kiriting.")
         user_states[user_id] = None
-        logging.warning(f"User {user_id} encountered an error: Missing payment data.")
+        logger.warning(f"User {user_id} encountered an error: Missing payment data.")
         return
 
     amount = payment_data['amount']
@@ -2024,17 +1644,13 @@ def receive_payment_comment(message):
 
     try:
         # Store payment in database
-        conn = create_db_connection()
-        c = conn.cursor()
-        c.execute("INSERT INTO payments (user_id, amount, is_confirmed, comment) VALUES (?, ?, ?, ?)", (user_id, amount, 0, comment))
-        conn.commit()
+        c = db.execute("INSERT INTO payments (user_id, amount, is_confirmed, comment) VALUES (?, ?, ?, ?)", (user_id, amount, 0, comment))
         payment_id = c.lastrowid
-        conn.close()
 
-        logging.info(f"Payment received: User {user_id}, Amount: {amount}, Comment: {comment}")
+        logger.info(f"Payment received: User {user_id}, Amount: {amount}, Comment: {comment}")
 
         # Notify client
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             f"✅ *To'lov qabul qilindi!* \n\n"
             f"💰 *Miqdor:* {amount:,} so'm \n"
@@ -2050,149 +1666,177 @@ def receive_payment_comment(message):
                 InlineKeyboardButton("Tasdiqlash", callback_data=f"confirm_payment_{payment_id}"),
                 InlineKeyboardButton("Rad etish", callback_data=f"reject_payment_{payment_id}")
             )
-            bot.send_message(admin, f"📢 *Yangi to'lov!* \n\n"
+            outbox.send_message(admin, f"📢 *Yangi to'lov!* \n\n"
                                     f"👤 *Mijoz:* {get_client_full_name(user_id)}\n"
                                     f"💰 *Miqdor:* {amount:,} so'm \n"
                                     f"📝 *Izoh:* {comment} \n\n"
                                     f"✅ Tasdiqlash yoki rad etish uchun tugmalardan foydalaning.", reply_markup=confirm_buttons)
         
-        logging.info(f"Payment notification sent to admins for User {user_id}, Payment ID: {payment_id}")
+        logger.info(f"Payment notification sent to admins for User {user_id}, Payment ID: {payment_id}")
 
         # Reset state
         user_states[user_id] = None
         back_to_menu(message)
 
     except Exception as e:
-        logging.error(f"Error processing payment for User {user_id}: {e}", exc_info=True)
-        bot.send_message(message.chat.id, "❌ Xatolik yuz berdi. Iltimos, keyinroq urinib ko'ring.")
+        logger.error(f"Error processing payment for User {user_id}: {e}", exc_info=True)
+        outbox.send_message(message.chat.id, "❌ Xatolik yuz berdi. Iltimos, keyinroq urinib ko'ring.")
 
 
 
-@bot.message_handler(func=lambda message: True)
+@router.fallback
 def log_user_message(message):
-    logging.info(f"User {message.from_user.id} sent: {message.text}")
+    message_log.debug("User %s sent: %s", message.from_user.id, message.text)
+
+
+def notify_payment_clients(claimed, confirmed):
+    """
+    One message per client for the payments an admin just confirmed or rejected.
+    """
+    for telegram_id, count, total in payments.by_client(claimed):
+        if not telegram_id:
+            continue
+        if count == 1:
+            text = f"Sizning {total:,} so'm to'lovingiz {'tasdiqlandi. Rahmat!' if confirmed else 'rad etildi.'}"
+        else:
+            text = (f"Sizning {count} ta to'lovingiz (jami {total:,} so'm) "
+                    f"{'tasdiqlandi. Rahmat!' if confirmed else 'rad etildi.'}")
+        outbox.send_message(telegram_id, text)
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("confirm_payment_") or call.data.startswith("reject_payment_"))
 def handle_payment_confirmation(call):
     payment_id = int(call.data.split("_")[-1])
-    conn = create_db_connection()
-    c = conn.cursor()
-
-    # Check if already confirmed
-    c.execute("SELECT is_confirmed FROM payments WHERE payment_id=?", (payment_id,))
-    is_confirmed = c.fetchone()[0]
+    confirmed = call.data.startswith("confirm_payment_")
 
-    if is_confirmed:
-        bot.answer_callback_query(call.id, "Bu to'lov allaqachon tasdiqlangan.")
-        return
-    
     try:
-        # Get user_id (telegram_id) and amount from the payments table
-        c.execute("SELECT user_id, amount FROM payments WHERE payment_id=?", (payment_id,))
-        payment = c.fetchone()
-
-        if payment:
-            telegram_id, amount = payment
-
-            # Get the internal user_id and type from the users table using telegram_id
-            c.execute("SELECT user_id, debt, type FROM users WHERE telegram_id=?", (telegram_id,))
-            user_record = c.fetchone()
-
-            if user_record:
-                internal_user_id, current_debt, user_type = user_record
-
-                if call.data.startswith("confirm_payment_"):
-                    # Confirm payment
-                    c.execute("UPDATE payments SET is_confirmed=1 WHERE payment_id=?", (payment_id,))
-
-                    # Calculate the new debt
-                    new_debt = current_debt - amount
-                    if new_debt < 0:
-                        new_debt = 0  # Ensure debt doesn't go negative
-
-                    # Update the debt in the `users` table
-                    c.execute("UPDATE users SET debt=? WHERE user_id=?", (new_debt, internal_user_id))
-
-                    # Update total_debt in the orders table
-                    c.execute("""
-                        UPDATE orders
-                        SET total_debt = ?
-                        WHERE user_id=? AND is_confirmed=1
-                    """, (new_debt, internal_user_id))
-                    
-                    conn.commit()  # Commit all changes
-
-                    # Notify admin and the user
-                    bot.edit_message_text(
-                        text="✅ To'lov tasdiqlandi!",
-                        chat_id=call.message.chat.id,
-                        message_id=call.message.message_id
-                    )
-
-                    admins = list_admins()
-                    print(f"Admins: {admins}")
-                    for admin in admins:
-                        try:
-                            bot.edit_message_text(
-                                text="✅ To'lov tasdiqlandi!",
-                                chat_id=admin[0],
-                                message_id=call.message.message_id
-                            )
-                        except Exception as e:
-                            print(f"Error updating message for admin {admin[0]}: {e}")
-
-                    bot.answer_callback_query(call.id, "To'lov tasdiqlandi.")
-
-                    if telegram_id:
-                        bot.send_message(telegram_id, f"Sizning {amount:,} so'm to'lovingiz tasdiqlandi. Rahmat!")
-                elif call.data.startswith("reject_payment_"):
-                    # Reject payment
-                    c.execute("DELETE FROM payments WHERE payment_id=?", (payment_id,))
-                    conn.commit()
-
-                    bot.send_message(call.message.chat.id, "To'lov rad etildi.")
-                    if telegram_id:
-                        bot.send_message(telegram_id, f"Sizning {amount:,} so'm to'lovingiz rad etildi.")
-            else:
-                bot.send_message(call.message.chat.id, "Foydalanuvchi topilmadi. To'lovni qayta tekshiring.")
-        else:
-            bot.send_message(call.message.chat.id, "To'lov topilmadi.")
+        # Claims the payment only if it is still pending, so a second tap (or a second admin) does nothing
+        claimed = payments.confirm([payment_id]) if confirmed else payments.reject([payment_id])
     except Exception as e:
-        conn.rollback()  # Rollback if any error occurs
-        bot.send_message(call.message.chat.id, f"Xatolik yuz berdi: {str(e)}")
-    finally:
-        conn.close()  # Ensure the connection is always closed
+        # db.transaction() has already rolled back any partial update
+        logger.error("Error while processing payment %s: %s", payment_id, e, exc_info=True)
+        outbox.send_message(call.message.chat.id, f"Xatolik yuz berdi: {str(e)}")
+        claimed = None
+
+    if claimed:
+        status = "✅ To'lov tasdiqlandi!" if confirmed else "❌ To'lov rad etildi."
+        bot.edit_message_text(text=status, chat_id=call.message.chat.id, message_id=call.message.message_id)
+        bot.answer_callback_query(call.id, "To'lov tasdiqlandi." if confirmed else "To'lov rad etildi.")
+        notify_payment_clients(claimed, confirmed)
+    elif claimed is not None:
+        bot.answer_callback_query(call.id, "Bu to'lov allaqachon ko'rib chiqilgan.")
+        bot.edit_message_text(text="Bu to'lov allaqachon ko'rib chiqilgan.", chat_id=call.message.chat.id,
+                              message_id=call.message.message_id)
 
     # Force correct menu based on user role
-    conn = create_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT type FROM users WHERE telegram_id=?", (call.from_user.id,))
-    user_type = c.fetchone()
-    conn.close()
+    user_type = get_identity(call.from_user.id)
 
     if user_type:
-        if user_type[0] == "admin":
+        if user_type[1] == "admin":
             # Admin menu
             markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
             markup.add(KeyboardButton("Buyurtma qo'shish"), KeyboardButton("Buyurtmani o'chirish"))
             markup.add(KeyboardButton("Mijoz ma'lumotlarini o'zgartirish"), KeyboardButton("Mahsulotni tahrirlash"))
             markup.add(KeyboardButton("Buyurtmalarni ko'rish"))
-            bot.send_message(call.message.chat.id, "Menyu", reply_markup=markup)
+            outbox.send_message(call.message.chat.id, "Menyu", reply_markup=markup)
         else:
             # Client menu
             markup = ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
             markup.add(KeyboardButton("Buyurtmalarni ko'rish"))  # View orders
             markup.add(KeyboardButton("To'lovni amalga oshirish"))  # New payment button
-            bot.send_message(call.message.chat.id, "Menyu", reply_markup=markup)
+            outbox.send_message(call.message.chat.id, "Menyu", reply_markup=markup)
+    else:
+        outbox.send_message(call.message.chat.id, "Foydalanuvchi turi aniqlanmadi.")
+
+
+def pending_payments_view(selected):
+    """
+    Text and inline keyboard for the oldest pending payments, with those in selected ticked; also their ids.
+    """
+    pending = payments.pending()
+    if not pending:
+        return "Tasdiqlanmagan to'lovlar yo'q.", None, []
+
+    text = "⏳ Tasdiqlanmagan to'lovlar:\n\n"
+    markup = InlineKeyboardMarkup()
+    for payment in pending:
+        name = f"{payment.first_name or ''} {payment.last_name or ''}".strip() or "Noma'lum"
+        text += f"#{payment.payment_id} {name}: {payment.amount:,} so'm"
+        text += f" - {payment.comment[:40]}\n" if payment.comment else "\n"
+        mark = "☑️" if payment.payment_id in selected else "⬜️"
+        markup.add(InlineKeyboardButton(f"{mark} #{payment.payment_id} {name}: {payment.amount:,} so'm",
+                                        callback_data=f"payments_toggle_{payment.payment_id}"))
+    markup.add(InlineKeyboardButton("✅ Tanlanganlarni tasdiqlash", callback_data="payments_confirm"),
+               InlineKeyboardButton("❌ Tanlanganlarni rad etish", callback_data="payments_reject"))
+    markup.add(InlineKeyboardButton("✅ Hammasini tasdiqlash", callback_data="payments_confirm_all"))
+    return text, markup, [payment.payment_id for payment in pending]
+
+
+# Pending payments for admins: tick several and confirm or reject them in one go
+@router.command('pending_payments')
+@user_command_wrapper
+def handle_pending_payments(message):
+    user_id = str(message.from_user.id)
+    if not is_admin(user_id):
+        outbox.send_message(message.chat.id, "Bu buyruq faqat adminlar uchun.")
+        return
+
+    text, markup, shown = pending_payments_view(set())
+    payment_selections[user_id] = {'shown': shown, 'selected': []}
+    outbox.send_message(message.chat.id, text, reply_markup=markup)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("payments_"))
+def handle_pending_payments_callback(call):
+    user_id = str(call.from_user.id)
+    if not is_admin(user_id):
+        bot.answer_callback_query(call.id, "Bu amal faqat adminlar uchun.")
+        return
+
+    selection = payment_selections.get(user_id) or {'shown': [], 'selected': []}
+    action = call.data[len("payments_"):]
+
+    if action.startswith("toggle_"):
+        selected = set(selection['selected']) ^ {int(action[len("toggle_"):])}
+        text, markup, shown = pending_payments_view(selected)
+        payment_selections[user_id] = {'shown': shown, 'selected': sorted(selected & set(shown))}
+        bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+        bot.answer_callback_query(call.id)
+        return
+
+    # "All" means the payments the admin was shown, not ones that arrived since
+    if action == "confirm_all":
+        payment_ids = selection['shown']
     else:
-        bot.send_message(call.message.chat.id, "Foydalanuvchi turi aniqlanmadi.")
+        payment_ids = [payment_id for payment_id in selection['shown'] if payment_id in selection['selected']]
+    if not payment_ids:
+        bot.answer_callback_query(call.id, "Hech qanday to'lov tanlanmagan.")
+        return
 
+    confirmed = action != "reject"
+    try:
+        claimed = payments.confirm(payment_ids) if confirmed else payments.reject(payment_ids)
+    except Exception as e:
+        # db.transaction() has already rolled back the whole batch
+        logger.error("Error while processing payments %s: %s", payment_ids, e, exc_info=True)
+        bot.answer_callback_query(call.id, f"Xatolik yuz berdi: {e}")
+        return
+    notify_payment_clients(claimed, confirmed)
+
+    summary = (f"{'✅ Tasdiqlandi' if confirmed else '❌ Rad etildi'}: {len(claimed)} ta to'lov, "
+               f"jami {sum(payment.amount for payment in claimed):,} so'm.")
+    if len(claimed) < len(payment_ids):
+        summary += f"\n{len(payment_ids) - len(claimed)} ta to'lov allaqachon ko'rib chiqilgan edi."
+    text, markup, shown = pending_payments_view(set())
+    payment_selections[user_id] = {'shown': shown, 'selected': []}
+    bot.edit_message_text(f"{summary}\n\n{text}", call.message.chat.id, call.message.message_id, reply_markup=markup)
+    bot.answer_callback_query(call.id)
 
 
 
 
-@bot.message_handler(func=lambda message: message.text == "/help")
+
+@router.text("/help")
 @user_command_wrapper
 def help(message):
     user_id = str(message.from_user.id)
@@ -2205,11 +1849,258 @@ def help(message):
         help_text += "/add_order - Buyurtma qo'shish (faqat adminlar uchun)\n"
         help_text += "/delete_order <order_id> - Buyurtmani ID bo'yicha o'chirish (faqat adminlar uchun)\n"
         help_text += "/edit_client - Mijoz ma'lumotlarini o'zgartirish (faqat adminlar uchun)\n"
+        help_text += "/report - Savdo hisoboti (faqat adminlar uchun)\n"
+        help_text += "/pending_payments - Tasdiqlanmagan to'lovlar (faqat adminlar uchun)\n"
+        help_text += "/stats - Bot statistikasi (faqat adminlar uchun)\n"
+        help_text += "/import_orders - Buyurtmalarni fayldan import qilish (faqat adminlar uchun)\n"
 
     help_text += "/list_orders - Barcha buyurtmalarni ro'yxatini ko'rsatish\n"
+    help_text += "/statement - Hisob varag'ini CSV fayl sifatida olish\n"
     help_text += "/list_products <order_id> - Belgilangan buyurtma ID bo'yicha barcha mahsulotlarni ko'rsatish\n"
 
-    bot.send_message(message.chat.id, help_text)
+    outbox.send_message(message.chat.id, help_text)
+
+
+def send_statement(chat_id, client_id):
+    """
+    Send a client's statement as a CSV document, re-sending the uploaded file while their ledger is unchanged.
+    """
+    version = statement.version(client_id)
+    if version is None:
+        outbox.send_message(chat_id, "Hisob-kitoblar topilmadi.")
+        return
+
+    caption = f"{get_client_full_name(client_id)}: hisob varag'i"
+    key = (client_id, version)
+    file_id = statement_files.get(key)
+    if file_id is not MISSING:
+        try:
+            bot.send_document(chat_id, file_id, caption=caption)
+            return
+        except telebot.apihelper.ApiTelegramException as e:
+            logger.warning("Cached statement file for client %s was rejected: %s", client_id, e)
+            statement_files.invalidate(key)
+
+    with statement.export(client_id, version) as document:
+        sent = bot.send_document(chat_id, document, caption=caption,
+                                 visible_file_name=statement.file_name(client_id, version))
+    statement_files.set(key, sent.document.file_id)
+
+
+# Account statement: clients get their own, admins pick a client
+@router.command('statement')
+@user_command_wrapper
+def handle_statement(message):
+    user_id = str(message.from_user.id)
+    if is_admin(user_id):
+        ask_for_client(message, 'selecting_client_for_statement', "Hisob varag'i uchun mijozni tanlang:")
+    else:
+        send_statement(message.chat.id, get_identity(user_id)[0])
+
+
+@router.state('selecting_client_for_statement')
+@user_command_wrapper
+def handle_select_client_for_statement(message):
+    user_id = str(message.from_user.id)
+    client_choice = message.text.strip()
+
+    if client_choice == "Bosh menyu":
+        user_states[user_id] = None
+        back_to_menu(message)
+        return
+
+    if client_choice in commands_list:
+        redirect_to_command(message)
+        return
+
+    # Anything but a picked client is a search
+    match = CLIENT_CHOICE.search(client_choice)
+    if not match:
+        send_client_results(message.chat.id, user_id, client_choice)
+        return
+
+    user_states[user_id] = None
+    send_statement(message.chat.id, int(match.group(1)))
+    back_to_menu(message)
+
+
+# Client search results: picking a client and paging through the matches
+client_pickers = {
+    'selecting_client': handle_select_client,
+    'selecting_client_for_edit': handle_select_client_for_edit,
+    'selecting_client_for_order_deletion': handle_select_client_for_order_deletion,
+    'selecting_client_for_statement': handle_select_client_for_statement,
+}
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("pick_client_"))
+def handle_pick_client_callback(call):
+    user_id = str(call.from_user.id)
+    handler = client_pickers.get(user_states.get(user_id))
+    bot.answer_callback_query(call.id)
+    if handler is None:
+        outbox.send_message(call.message.chat.id, "Bu ro'yxat eskirgan. Iltimos, qaytadan boshlang.")
+        return
+    # Hand the pick to the state's handler as if the "<name> (<id>)" button had been typed
+    message = call.message
+    message.from_user = call.from_user
+    message.text = f"({call.data[len('pick_client_'):]})"
+    handler(message)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("clients_page_"))
+def handle_clients_page_callback(call):
+    page = int(call.data[len("clients_page_"):])
+    clients, markup = client_results_markup(client_search_queries.get(str(call.from_user.id)) or "", page)
+    if clients:
+        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=markup)
+    bot.answer_callback_query(call.id)
+
+
+# Inline mode: "@bot <name>" finds products for everyone and clients for admins.
+# Sending a result posts the product name or "<name> (<id>)", which the order
+# and client-picking steps accept as if it had been picked from a keyboard
+@bot.inline_handler(func=lambda inline_query: True)
+def handle_inline_query(inline_query):
+    identity = get_identity(inline_query.from_user.id)
+    if identity is None:
+        bot.answer_inline_query(inline_query.id, [], cache_time=inline_search.CACHE_TIME, is_personal=True)
+        return
+
+    query = inline_query.query or ""
+    results = []
+    if identity[1] == 'admin':
+        for client_id, first_name, last_name in inline_lookup.clients(query):
+            label = client_label(client_id, first_name, last_name)
+            results.append(InlineQueryResultArticle(
+                id=f"c{client_id}", title=f"👤 {label}", description="Mijoz",
+                input_message_content=InputTextMessageContent(label)))
+    for product_id, product_name, product_price in inline_lookup.products(query):
+        results.append(InlineQueryResultArticle(
+            id=f"p{product_id}", title=product_name, description=f"{product_price:,} so'm",
+            input_message_content=InputTextMessageContent(product_name)))
+
+    # Client results depend on who is asking, so Telegram must not share them between users
+    bot.answer_inline_query(inline_query.id, results[:inline_search.MAX_RESULTS],
+                            cache_time=inline_search.CACHE_TIME, is_personal=identity[1] == 'admin')
+
+
+# Sales report for admins, read from the sales_daily* aggregates
+@router.command('report')
+@user_command_wrapper
+def handle_report(message):
+    user_id = str(message.from_user.id)
+    if not is_admin(user_id):
+        outbox.send_message(message.chat.id, "Bu buyruq faqat adminlar uchun.")
+        return
+
+    today = datetime.now().date()
+    text = "📊 Savdo hisoboti\n\n"
+    for period, title in (('day', "Bugun"), ('week', "Shu hafta"), ('month', "Shu oy")):
+        totals = sales.totals(sales.period_start(period, today), today)
+        text += (f"{title}: {totals.orders} ta buyurtma, {totals.quantity} dona, "
+                 f"{totals.revenue:,} so'm\n")
+
+    month_start = sales.period_start('month', today)
+    text += "\n🏆 Shu oyning eng ko'p sotilgan mahsulotlari:\n"
+    top_products = sales.top_products(month_start, today)
+    if top_products:
+        for place, (product_name, quantity, revenue) in enumerate(top_products, 1):
+            text += f"{place}. {product_name}: {quantity} dona, {revenue:,} so'm\n"
+    else:
+        text += "Sotuvlar yo'q\n"
+
+    text += "\n💳 Eng katta qarzdorlar:\n"
+    debtors = sales.top_debtors()
+    if debtors:
+        for place, (client_id, first_name, last_name, debt) in enumerate(debtors, 1):
+            name = f"{first_name} {last_name}" if last_name else first_name
+            text += f"{place}. {name} ({client_id}): {debt:,} so'm\n"
+    else:
+        text += "Qarzdorlar yo'q\n"
+
+    outbox.send_message(message.chat.id, text)
+
+
+# Runtime metrics for admins: the same figures the /metrics endpoint exports
+@router.command('stats')
+@user_command_wrapper
+def handle_stats(message):
+    user_id = str(message.from_user.id)
+    if not is_admin(user_id):
+        outbox.send_message(message.chat.id, "Bu buyruq faqat adminlar uchun.")
+        return
+
+    summary = bot_metrics.summary()
+    text = (f"📈 Bot statistikasi\n\n"
+            f"Yangilanishlar: {summary['updates']:,}, xatolar: {summary['errors']:,}\n"
+            f"DB so'rovlari: {summary['db_queries']:,} ({summary['queries_per_update']:.1f} / yangilanish)\n"
+            f"API chaqiruvlari: {summary['api_requests']:,} ({summary['api_calls_per_update']:.1f} / yangilanish)\n"
+            f"\nEng sekin handlerlar (p50 / p99):\n")
+    for handler, count, p50_ms, p99_ms, errors in summary['handlers']:
+        text += f"{handler}: {count} ta, ≤{p50_ms:g} / ≤{p99_ms:g} ms"
+        text += f", {errors} xato\n" if errors else "\n"
+    text += "\n"
+    for name, stats in summary['stats'].items():
+        figures = ", ".join(f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                            for key, value in stats.items())
+        text += f"{name}: {figures}\n"
+    outbox.send_message(message.chat.id, text[:order_reports.TELEGRAM_MESSAGE_LIMIT])
+
+
+# Importing orders from an accounting sheet export
+@router.command('import_orders')
+@user_command_wrapper
+def handle_import_orders(message):
+    user_id = str(message.from_user.id)
+    if not is_admin(user_id):
+        outbox.send_message(message.chat.id, "Bu buyruq faqat adminlar uchun.")
+        return
+    user_states[user_id] = 'awaiting_import'
+    outbox.send_message(
+        message.chat.id,
+        "Buyurtmalar eksport faylini (.txt yoki .csv) yuboring yoki matnini shu yerga joylang.\n"
+        "Buyurtmalar orasida bo'sh qator bo'lishi kerak.")
+
+
+def run_import(message, rows):
+    user_id = str(message.from_user.id)
+    user_states[user_id] = None
+    try:
+        report = importer.import_orders(rows, product_catalogue)
+    except Exception as e:
+        logger.exception("Order import failed")
+        outbox.send_message(message.chat.id, f"❌ Import to'xtatildi: {e}")
+        return
+    logger.info(f"Imported {report.orders} orders, {report.lines} lines, {len(report.rejected)} rejected, "
+                 f"{report.rows_per_second:.0f} rows/s")
+    outbox.send_message(message.chat.id, report.summary())
+
+
+@router.state('awaiting_import')
+def receive_import_text(message):
+    if message.text.strip() in commands_list:
+        user_states[str(message.from_user.id)] = None
+        redirect_to_command(message)
+        return
+    run_import(message, importer.text_rows(message.text.splitlines()))
+
+
+# Documents bypass the text router; only an admin waiting for an import gets here
+@bot.message_handler(content_types=['document'],
+                     func=lambda message: user_states.get(str(message.from_user.id)) == 'awaiting_import')
+def receive_import_document(message):
+    file_name = (message.document.file_name or "").lower()
+    content = bot.download_file(bot.get_file(message.document.file_id).file_path)
+    lines = content.decode('utf-8-sig', errors='replace').splitlines()
+    rows = importer.csv_rows(lines) if file_name.endswith(".csv") else importer.text_rows(lines)
+    run_import(message, rows)
+
+
+# Every text message goes through the router: one dict lookup instead of a filter per handler
+@bot.message_handler(func=lambda message: True)
+def dispatch_message(message):
+    router.dispatch(message)
 
 
 # Menu commands
@@ -2220,12 +2111,50 @@ def set_bot_commands(bot):
         BotCommand("add_order", "Buyurtma qo'shish (faqat adminlar uchun)"),
         BotCommand("delete_order", "Buyurtmani ID bo'yicha o'chirish (faqat adminlar uchun)"),
         BotCommand("edit_client", "Mijoz ma'lumotlarini o'zgartirish (faqat adminlar uchun)"),
+        BotCommand("report", "Savdo hisoboti (faqat adminlar uchun)"),
+        BotCommand("pending_payments", "Tasdiqlanmagan to'lovlar (faqat adminlar uchun)"),
+        BotCommand("import_orders", "Buyurtmalarni fayldan import qilish (faqat adminlar uchun)"),
         BotCommand("list_orders", "Barcha buyurtmalarni ro'yxatini ko'rsatish"),
+        BotCommand("statement", "Hisob varag'ini CSV fayl sifatida olish"),
         BotCommand("list_products", "Belgilangan buyurtma ID bo'yicha barcha mahsulotlarni ko'rsatish")
     ]
     bot.set_my_commands(commands)
 
 
+# Time every handler registered above and count its DB queries and Bot API calls
+bot_metrics = metrics.Metrics()
+bot_metrics.instrument(bot, router=router, outbox=outbox, dispatch=dispatch_message)
+bot_metrics.register_stats('outbox', outbox.stats)
+bot_metrics.register_stats('identity_cache', identity_cache.stats)
+bot_metrics.register_stats('receipt_cache', receipt_cache.stats)
+bot_metrics.register_stats('statement_files', statement_files.stats)
+bot_metrics.register_stats('inline_cache', inline_lookup.stats)
+
+
 if __name__ == "__main__":
+    migrations.migrate()
+    conversation_state.start()
     set_bot_commands(bot)
-    bot.polling(none_stop=True)
\ No newline at end of file
+    # Prometheus text on http://127.0.0.1:METRICS_PORT/metrics; an empty METRICS_PORT turns it off
+    metrics_port = os.getenv("METRICS_PORT", "9108")
+    if metrics_port:
+        metrics.serve(bot_metrics, host=os.getenv("METRICS_HOST", "127.0.0.1"), port=int(metrics_port))
+    # BOT_MODE=webhook receives updates on a local HTTP endpoint registered as WEBHOOK_URL;
+    # the default (and the fallback when set_webhook fails) is long polling
+    ingestion = dict(
+        mode=os.getenv("BOT_MODE", "polling"),
+        url=os.getenv("WEBHOOK_URL"),
+        secret_token=os.getenv("WEBHOOK_SECRET"),
+        host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+        port=int(os.getenv("WEBHOOK_PORT", "8443")),
+        path=os.getenv("WEBHOOK_PATH", "/webhook"),
+        certfile=os.getenv("WEBHOOK_CERT"),
+        keyfile=os.getenv("WEBHOOK_KEY"),
+    )
+    if BOT_RUNTIME == "async":
+        import async_runtime  # needs aiohttp, which the default runtime does not
+
+        async_runtime.run(bot, outbox, **ingestion)
+    else:
+        outbox.start()
+        webhook.run(bot, **ingestion)
\ No newline at end of file
@@ -0,0 +1,40 @@
+"""
+Bulk order entry: the whole order pasted as one message, a product and its
+quantity per line.
+
+    Pomidor 5
+    Kartoshka: 10
+    Piyoz - 3
+
+Picking products from the keyboard costs two messages and a keyboard per
+product; a pasted list is parsed in one pass and ends in a single cart
+summary. Names are resolved through the catalogue's normalized name index,
+so case, spacing and apostrophe variants do not matter.
+"""
+import re
+
+# "<name> <quantity>", optionally separated by ':', '=', ',', '-' or ' x '
+_LINE = re.compile(r"^(?P<name>.*?\S)(?:\s+[xх×*]|\s*[:=,\-])?\s*(?P<quantity>\d+)$", re.IGNORECASE)
+
+
+def parse(text, lookup):
+    """
+    Parse pasted lines into ({product_id: quantity}, problems).
+
+    lookup(name) returns a product_id or None. A product listed twice gets the
+    sum of its quantities; problems are the lines that could not be used, in order.
+    """
+    cart = {}
+    problems = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = _LINE.match(line)
+        product_id = lookup(match.group('name')) if match else None
+        quantity = int(match.group('quantity')) if match else 0
+        if product_id is None or quantity <= 0:
+            problems.append(line)
+            continue
+        cart[product_id] = cart.get(product_id, 0) + quantity
+    return cart, problems
@@ -0,0 +1,140 @@
+"""
+In-process product catalogue.
+
+Products change rarely but are read on every step of building a cart, so the
+table is loaded once into name -> id and id -> (name, price) indexes together
+with the serialized product keyboard and a sorted word index for prefix
+search. Any code that writes to the products table calls invalidate(), which
+bumps the version counter; the next read reloads everything in one query.
+"""
+import difflib
+import threading
+from bisect import bisect_left
+
+import db
+
+# Apostrophe variants people type for o' and g'
+_APOSTROPHES = str.maketrans({c: "'" for c in "`‘’ʻʼ´"})
+
+
+def normalize_name(name):
+    """
+    Case-, whitespace- and apostrophe-insensitive form of a product name.
+    """
+    return " ".join(name.translate(_APOSTROPHES).casefold().split())
+
+
+class ProductCatalogue:
+    def __init__(self):
+        self.version = 0
+        self._loaded_version = None
+        self._lock = threading.Lock()
+        self._products = []
+        self._by_name = {}
+        self._by_key = {}
+        self._by_id = {}
+        self._words = []  # sorted (word, product_id) over every word of every normalized name
+        self._keyboard = None
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def _ensure_loaded(self):
+        if self._loaded_version == self.version:
+            return
+        with self._lock:
+            version = self.version
+            if self._loaded_version == version:
+                return
+            products = db.query_all("SELECT product_id, product_name, product_price FROM products ORDER BY product_id")
+            by_name = {}
+            by_key = {}
+            words = []
+            for product_id, name, _ in products:
+                by_name.setdefault(name, product_id)
+                key = normalize_name(name)
+                by_key.setdefault(key, product_id)
+                words.extend((word, product_id) for word in key.split())
+            words.sort()
+            self._products = products
+            self._by_id = {product_id: (name, price) for product_id, name, price in products}
+            self._by_name = by_name
+            self._by_key = by_key
+            self._words = words
+            self._keyboard = None
+            self._loaded_version = version
+
+    def products(self):
+        """
+        All products as (product_id, product_name, product_price) rows.
+        """
+        self._ensure_loaded()
+        return self._products
+
+    def id_by_name(self, product_name):
+        self._ensure_loaded()
+        return self._by_name.get(product_name)
+
+    def lookup(self, product_name):
+        """
+        Resolve a typed product name: exact match first, then ignoring case, spacing and apostrophes.
+        """
+        self._ensure_loaded()
+        product_id = self._by_name.get(product_name)
+        if product_id is None:
+            product_id = self._by_key.get(normalize_name(product_name))
+        return product_id
+
+    def _with_prefix(self, prefix):
+        words = self._words
+        ids = set()
+        i = bisect_left(words, (prefix,))
+        while i < len(words) and words[i][0].startswith(prefix):
+            ids.add(words[i][1])
+            i += 1
+        return ids
+
+    def search(self, query, limit=20):
+        """
+        Product ids whose name has a word starting with each word of query, in catalogue order.
+
+        Falls back to close spellings of the whole name when nothing matches.
+        """
+        self._ensure_loaded()
+        words = normalize_name(query).split()
+        if not words:
+            return [product_id for product_id, _, _ in self._products[:limit]]
+        ids = None
+        for word in words:
+            ids = self._with_prefix(word) if ids is None else ids & self._with_prefix(word)
+            if not ids:
+                break
+        if ids:
+            return sorted(ids)[:limit]
+        close = difflib.get_close_matches(" ".join(words), self._by_key, n=limit, cutoff=0.6)
+        return [self._by_key[key] for key in close]
+
+    def get(self, product_id):
+        """
+        Return (product_name, product_price) or None.
+        """
+        self._ensure_loaded()
+        return self._by_id.get(product_id)
+
+    def keyboard(self, build):
+        """
+        Return the product keyboard as serialized JSON, built at most once per version.
+
+        build(products) must return a telebot markup object.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            keyboard, version, products = self._keyboard, self._loaded_version, self._products
+        if keyboard is None:
+            keyboard = build(products).to_json()
+            with self._lock:
+                # A reload during the build has already reset the keyboard for the new products
+                if self._loaded_version == version:
+                    self._keyboard = keyboard
+        return keyboard
@@ -0,0 +1,61 @@
+"""
+Client search.
+
+Picking a client used to mean a reply keyboard with one button per client,
+built from SELECT * FROM users WHERE type='client'. Admins now type the start
+of a name instead: the typed words are matched as prefixes against an FTS5
+index over first_name, last_name, saved_name and username (migration 6, kept
+in sync by triggers on users), and results come back one page at a time, so a
+lookup is a bounded query and the reply stays small however many clients
+there are.
+"""
+import re
+
+import db
+
+PAGE_SIZE = 8
+
+_WORD = re.compile(r"\w+")
+
+_SEARCH_SQL = """
+    SELECT u.user_id, u.first_name, u.last_name
+    FROM client_search s
+    JOIN users u ON u.user_id = s.rowid
+    WHERE client_search MATCH ? AND u.type = 'client'
+    ORDER BY s.rank, u.user_id
+    LIMIT ? OFFSET ?
+"""
+
+_ALL_SQL = """
+    SELECT user_id, first_name, last_name FROM users
+    WHERE type = 'client'
+    ORDER BY user_id
+    LIMIT ? OFFSET ?
+"""
+
+
+def match_expression(text):
+    """
+    Turn typed text into an FTS5 query: every word must match the start of a name word.
+
+    Returns None if the text has no words.
+    """
+    words = _WORD.findall(text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search(text, page=0, page_size=PAGE_SIZE):
+    """
+    Return ([(user_id, first_name, last_name)], has_more) for one page of matches.
+
+    Empty text pages through all clients.
+    """
+    expression = match_expression(text or "")
+    limit, offset = page_size + 1, page * page_size
+    if expression is None:
+        rows = db.query_all(_ALL_SQL, (limit, offset))
+    else:
+        rows = db.query_all(_SEARCH_SQL, (expression, limit, offset))
+    return rows[:page_size], len(rows) > page_size
@@ -0,0 +1,147 @@
+"""
+SQLite access layer shared by every handler in bot.py.
+
+Each telebot worker thread keeps one long-lived connection to the database
+instead of opening (and logging) a fresh one per helper call. Connections run
+in WAL mode so readers never block the single writer, and sqlite3's statement
+cache is sized so the handful of hot queries stay prepared for the lifetime of
+the connection.
+"""
+import os
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("DB_PATH", "data.db")
+
+# Number of prepared statements kept per connection (sqlite3 default is 128)
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_connect_hooks = []
+# Bumped by close_all(); a thread whose connection is from an older generation reopens it
+_generation = 0
+
+
+def _open_connection(path):
+    # Autocommit mode: transactions are opened explicitly by transaction()
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None,
+                           check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    with _connections_lock:
+        _connections.append(conn)
+        hooks = list(_connect_hooks)
+    for hook in hooks:
+        hook(conn)
+    logger.debug(f"Database connection opened for thread {threading.current_thread().name}.")
+    return conn
+
+
+def add_connect_hook(hook):
+    """
+    Call hook(conn) for every connection, both the open ones and those opened later.
+    """
+    with _connections_lock:
+        _connect_hooks.append(hook)
+        connections = list(_connections)
+    for conn in connections:
+        hook(conn)
+
+
+def get_connection():
+    """
+    Return the calling thread's connection, opening it on first use.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != DB_PATH or _local.generation != _generation:
+        generation = _generation
+        conn = _open_connection(DB_PATH)
+        _local.conn = conn
+        _local.path = DB_PATH
+        _local.generation = generation
+        _local.depth = 0
+    return conn
+
+
+def configure(path):
+    """
+    Point the pool at another database file (used by benchmarks and tools).
+    """
+    global DB_PATH
+    close_all()
+    DB_PATH = path
+
+
+def close_all():
+    """
+    Close every thread's connection; each thread opens a new one on its next query.
+    """
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+    _local.__dict__.clear()
+
+
+@contextmanager
+def transaction():
+    """
+    Run a block of statements atomically on the thread's connection.
+
+    Yields a cursor. Nested calls join the outermost transaction, which commits
+    on a clean exit and rolls back if anything inside raises.
+    """
+    conn = get_connection()
+    if _local.depth:
+        _local.depth += 1
+        try:
+            yield conn.cursor()
+        finally:
+            _local.depth -= 1
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    _local.depth = 1
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+    finally:
+        _local.depth = 0
+
+
+def execute(sql, params=()):
+    """
+    Run a single statement and return its cursor (for lastrowid / rowcount).
+    """
+    return get_connection().execute(sql, params)
+
+
+def query_one(sql, params=()):
+    return get_connection().execute(sql, params).fetchone()
+
+
+def query_all(sql, params=()):
+    return get_connection().execute(sql, params).fetchall()
+
+
+def query_iter(sql, params=()):
+    """
+    Stream result rows without materialising the whole result set.
+    """
+    return get_connection().execute(sql, params)
@@ -0,0 +1,232 @@
+"""
+Bulk import of orders exported from the accounting sheet.
+
+An export holds any number of orders, separated by blank lines, each in the
+format parse_order_input() reads:
+
+    <saved name>  <...>  <debt before the order> so'm  <...>  <dd,mm,yyyy>
+    Наименование товара  Цена  Количество(кб)  Оплата  Перечисление  Остаток долга
+    <product>  <price> so'm  <quantity>  ...
+    ...
+    <...>  <total sum> so'm  ...  <debt> so'm
+    <...>  <...>  <total quantity>  ...  <total debt> so'm
+
+Cells are separated by two or more spaces (or a tab) in text exports and by
+the CSV delimiter in .csv exports. The file is processed as a pipeline of
+generators (rows -> blocks -> parsed orders), so memory stays flat however
+large the file is. Clients and products are resolved from in-memory indexes,
+each order's lines must add up to its totals, and valid orders are written
+batch_size at a time, one transaction per batch.
+"""
+import csv
+import re
+import time
+from collections import namedtuple
+from itertools import islice
+
+import db
+import pricing
+
+ParsedOrder = namedtuple('ParsedOrder', ['saved_name', 'order_date', 'before_order_debt', 'products',
+                                         'total_sum', 'total_quantity', 'total_debt', 'line_no'])
+
+_CELL_SEPARATOR = re.compile(r" {2,}|\t")
+_NOT_AMOUNT = re.compile(r"[^\d-]")
+
+SNIFF_LINES = 5
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.orders = 0
+        self.lines = 0
+        self.rejected = []  # (line_no, reason)
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self, max_errors=20):
+        text = (f"Import yakunlandi: {self.orders} ta buyurtma, {self.lines} ta mahsulot qatori.\n"
+                f"{self.rows} qator {self.elapsed:.2f} soniyada ({self.rows_per_second:,.0f} qator/soniya).")
+        if self.rejected:
+            text += f"\n\nQabul qilinmadi: {len(self.rejected)} ta buyurtma\n"
+            text += "\n".join(f"{line_no}-qator: {reason}" for line_no, reason in self.rejected[:max_errors])
+            if len(self.rejected) > max_errors:
+                text += f"\n... va yana {len(self.rejected) - max_errors} ta"
+        return text
+
+
+def text_rows(lines):
+    """
+    Split text export lines into cells.
+    """
+    for line in lines:
+        line = line.strip()
+        yield [cell.strip() for cell in _CELL_SEPARATOR.split(line)] if line else []
+
+
+def csv_rows(lines):
+    """
+    Split CSV export lines into cells; the delimiter is sniffed from the first SNIFF_LINES lines.
+
+    One line is not enough: the first row ends in a dd,mm,yyyy date, so a
+    ';'-delimited export would look comma-separated.
+    """
+    lines = iter(lines)
+    head = list(islice(lines, SNIFF_LINES))
+    try:
+        dialect = csv.Sniffer().sniff("\n".join(line.rstrip("\r\n") for line in head), delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+
+    def all_lines():
+        yield from head
+        yield from lines
+
+    for row in csv.reader(all_lines(), dialect):
+        cells = [cell.strip() for cell in row]
+        # Sheets pad rows with empty cells; a row of nothing but padding separates orders
+        while cells and not cells[-1]:
+            cells.pop()
+        yield cells
+
+
+def blocks(rows):
+    """
+    Group rows into orders; yield (line_no of the first row, rows).
+    """
+    block = []
+    start = 0
+    for line_no, cells in enumerate(rows, 1):
+        if any(cells):
+            if not block:
+                start = line_no
+            block.append(cells)
+        elif block:
+            yield start, block
+            block = []
+    if block:
+        yield start, block
+
+
+def parse_amount(cell):
+    """
+    Parse "12 500 so'm" (or a bare number) into 12500.
+    """
+    digits = _NOT_AMOUNT.sub("", cell)
+    if not digits or digits == "-":
+        raise ValueError(f"son emas: {cell!r}")
+    return int(digits)
+
+
+def parse_block(rows, line_no=0):
+    """
+    Parse one order's rows into a ParsedOrder. Raises ValueError with the reason.
+
+    products are (product_name, product_price, quantity) tuples.
+    """
+    if len(rows) < 4:
+        raise ValueError("buyurtma to'liq emas")
+    first = rows[0]
+    if len(first) < 3:
+        raise ValueError("birinchi qatorda ism, qarz va sana bo'lishi kerak")
+    saved_name = first[0]
+    before_order_debt = parse_amount(first[2])
+    order_date = first[-1].replace(",", "/")
+
+    # rows[1] is the header: "Наименование товара  Цена  Количество(кб)  ..."
+    products = []
+    for cells in rows[2:-2]:
+        if len(cells) < 3 or not cells[0]:
+            continue
+        price = parse_amount(cells[1]) if cells[1] else 0
+        quantity = parse_amount(cells[2]) if cells[2] else 0
+        products.append((cells[0], price, quantity))
+
+    second_last, summary = rows[-2], rows[-1]
+    if len(second_last) < 2 or len(summary) < 3:
+        raise ValueError("jami qatorlari topilmadi")
+    total_sum = parse_amount(second_last[1])
+    total_quantity = parse_amount(summary[2])
+    total_debt = parse_amount(summary[-1])
+    return ParsedOrder(saved_name, order_date, before_order_debt, products, total_sum, total_quantity,
+                       total_debt, line_no)
+
+
+def check_totals(order):
+    """
+    Raise ValueError if the product lines do not add up to the order's totals.
+    """
+    lines_sum = sum(price * quantity for _, price, quantity in order.products)
+    if lines_sum != order.total_sum:
+        raise ValueError(f"mahsulotlar summasi {lines_sum:,} jami summa {order.total_sum:,} bilan mos emas")
+    lines_quantity = sum(quantity for _, _, quantity in order.products)
+    if lines_quantity != order.total_quantity:
+        raise ValueError(f"mahsulotlar soni {lines_quantity} jami miqdor {order.total_quantity} bilan mos emas")
+
+
+def load_clients():
+    """
+    Return {saved_name: user_id} for every client with a saved name.
+    """
+    return {saved_name: user_id
+            for user_id, saved_name in db.query_all(
+                "SELECT user_id, saved_name FROM users WHERE saved_name IS NOT NULL AND saved_name != '' "
+                "ORDER BY user_id DESC")}
+
+
+def import_orders(rows, catalogue, clients=None, batch_size=500, report=None):
+    """
+    Parse, check and store every order in rows; return an ImportReport.
+
+    rows comes from text_rows() or csv_rows(). Orders that fail to parse, do
+    not add up, or name an unknown client or product are skipped and listed in
+    the report; the rest are committed batch_size orders per transaction.
+    """
+    report = report or ImportReport()
+    clients = load_clients() if clients is None else clients
+    started = time.perf_counter()
+
+    def counted(rows):
+        for cells in rows:
+            report.rows += 1
+            yield cells
+
+    batch = []
+    for line_no, block in blocks(counted(rows)):
+        try:
+            order = parse_block(block, line_no)
+            check_totals(order)
+            user_id = clients.get(order.saved_name)
+            if user_id is None:
+                raise ValueError(f"mijoz topilmadi: {order.saved_name}")
+            lines = []
+            for name, price, quantity in order.products:
+                product_id = catalogue.lookup(name)
+                if product_id is None:
+                    raise ValueError(f"mahsulot topilmadi: {name}")
+                lines.append((product_id, *catalogue.get(product_id), quantity, price))
+        except ValueError as e:
+            report.rejected.append((line_no, str(e)))
+            continue
+        batch.append((user_id, order, lines))
+        if len(batch) >= batch_size:
+            _write_batch(batch, report)
+            batch = []
+    if batch:
+        _write_batch(batch, report)
+
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def _write_batch(batch, report):
+    with db.transaction() as c:
+        for user_id, order, lines in batch:
+            pricing.insert_order(c, user_id, order.order_date, lines, order.total_sum, order.total_quantity,
+                                 order.total_debt, order.before_order_debt)
+    report.orders += len(batch)
+    report.lines += sum(len(lines) for _, _, lines in batch)
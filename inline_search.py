@@ -0,0 +1,51 @@
+"""
+Lookups behind inline mode (@bot <query>).
+
+Telegram sends an inline query on every keystroke, so each typed prefix is
+answered from a TTLCache: products come from the catalogue's in-memory word
+index (rebuilt whenever the catalogue version changes, which is also part of
+the cache key) and clients, for admins only, from the client_search FTS
+index. A repeated prefix costs one dict lookup, and Telegram's own cache_time
+hint keeps most repeats from reaching the bot at all. Client results may lag
+a rename by up to ttl seconds.
+"""
+import client_search
+from cache import TTLCache, MISSING
+from catalogue import normalize_name
+
+# Seconds Telegram may serve an answer from its own cache
+CACHE_TIME = 30
+
+MAX_RESULTS = 20
+
+
+class InlineSearch:
+    def __init__(self, catalogue, maxsize=2000, ttl=60):
+        self.catalogue = catalogue
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def products(self, query):
+        """
+        [(product_id, product_name, product_price)] matching query.
+        """
+        key = ('products', self.catalogue.version, normalize_name(query))
+        results = self._cache.get(key)
+        if results is MISSING:
+            results = [(product_id, *self.catalogue.get(product_id))
+                       for product_id in self.catalogue.search(query, MAX_RESULTS)]
+            self._cache.set(key, results)
+        return results
+
+    def clients(self, query):
+        """
+        [(user_id, first_name, last_name)] matching query.
+        """
+        key = ('clients', normalize_name(query))
+        results = self._cache.get(key)
+        if results is MISSING:
+            results, _ = client_search.search(query, page_size=MAX_RESULTS)
+            self._cache.set(key, results)
+        return results
+
+    def stats(self):
+        return self._cache.stats()
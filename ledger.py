@@ -0,0 +1,115 @@
+"""
+Append-only debt ledger.
+
+Every change to a client's debt is one ledger row: an order (+), a payment
+(-), a discount (-) or a manual adjustment (either sign). Each row also stores
+the running balance after it. users.debt is the materialized balance: post()
+updates it in the same transaction as the insert, so reading a balance is a
+single-row lookup and a payment writes a constant number of rows no matter
+how many orders the client has.
+
+Statements over a date range use the (user_id, created_at) index.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+import db
+
+ORDER = 'order'
+PAYMENT = 'payment'
+DISCOUNT = 'discount'
+ADJUSTMENT = 'adjustment'
+
+KINDS = (ORDER, PAYMENT, DISCOUNT, ADJUSTMENT)
+
+Entry = namedtuple('Entry', ['entry_id', 'user_id', 'kind', 'amount', 'balance', 'created_at',
+                             'order_id', 'payment_id', 'comment'])
+
+
+def post(c, user_id, kind, amount, order_id=None, payment_id=None, comment=None):
+    """
+    Record a debt change and return the client's new balance.
+
+    Runs on the caller's transaction cursor.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown ledger entry kind: {kind}")
+    amount = int(round(amount))
+    c.execute("UPDATE users SET debt = COALESCE(debt, 0) + ? WHERE user_id = ?", (amount, user_id))
+    if c.rowcount != 1:
+        raise ValueError(f"Unknown user: {user_id}")
+    balance = c.execute("SELECT debt FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+    c.execute(
+        "INSERT INTO ledger (user_id, kind, amount, balance, created_at, order_id, payment_id, comment) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (user_id, kind, amount, balance, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), order_id, payment_id, comment)
+    )
+    return balance
+
+
+def post_many(c, user_id, postings):
+    """
+    Record several debt changes of one client with a single balance update; return the new balance.
+
+    postings are (kind, amount, order_id, payment_id, comment) tuples, applied in
+    order, and every ledger row gets its running balance. Runs on the caller's
+    transaction cursor.
+    """
+    current = c.execute("SELECT COALESCE(debt, 0) FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if current is None:
+        raise ValueError(f"Unknown user: {user_id}")
+    balance = current[0]
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = []
+    for kind, amount, order_id, payment_id, comment in postings:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown ledger entry kind: {kind}")
+        amount = int(round(amount))
+        balance += amount
+        rows.append((user_id, kind, amount, balance, created_at, order_id, payment_id, comment))
+    c.execute("UPDATE users SET debt = ? WHERE user_id = ?", (balance, user_id))
+    c.executemany(
+        "INSERT INTO ledger (user_id, kind, amount, balance, created_at, order_id, payment_id, comment) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    return balance
+
+
+def set_balance(c, user_id, new_balance, comment=None):
+    """
+    Bring the balance to new_balance with one adjustment entry (none if it already matches).
+    """
+    current = c.execute("SELECT COALESCE(debt, 0) FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if current is None:
+        raise ValueError(f"Unknown user: {user_id}")
+    delta = int(round(new_balance)) - current[0]
+    if delta == 0:
+        return current[0]
+    return post(c, user_id, ADJUSTMENT, delta, comment=comment)
+
+
+def balance(user_id, c=None):
+    """
+    The client's current balance, read on the caller's transaction cursor c if given.
+    """
+    sql = "SELECT COALESCE(debt, 0) FROM users WHERE user_id = ?"
+    row = c.execute(sql, (user_id,)).fetchone() if c is not None else db.query_one(sql, (user_id,))
+    return row[0] if row else 0
+
+
+def entries(user_id, start=None, end=None):
+    """
+    Stream a client's entries, oldest first, optionally limited to start <= created_at < end.
+
+    start and end are "YYYY-MM-DD[ HH:MM:SS]" strings.
+    """
+    sql = "SELECT * FROM ledger WHERE user_id = ?"
+    params = [user_id]
+    if start is not None:
+        sql += " AND created_at >= ?"
+        params.append(start)
+    if end is not None:
+        sql += " AND created_at < ?"
+        params.append(end)
+    sql += " ORDER BY created_at, entry_id"
+    for row in db.query_iter(sql, params):
+        yield Entry(*row)
@@ -0,0 +1,180 @@
+"""
+Logging pipeline for the bot.
+
+Handlers never touch the disk themselves: the root logger has a single
+QueueHandler, and a QueueListener thread formats records as JSON lines and
+writes them to a rotating file (and optionally stdout). A handler that logs
+only pays for building the record and putting it on the queue, and a
+SampledLogger skips even that for the DEBUG calls LOG_SAMPLE drops.
+
+Configured from the environment by configure_from_env():
+
+    LOG_FILE           bot.log
+    LOG_LEVEL          root level, INFO
+    LOG_LEVELS         per-logger levels, "db=WARNING,bot.messages=DEBUG"
+    LOG_MAX_BYTES      rotate when the file reaches this size (10 MB)
+    LOG_ROTATE_WHEN    rotate on time instead ("midnight", "H", ...)
+    LOG_BACKUPS        rotated files to keep, 7
+    LOG_SAMPLE         keep 1 in N DEBUG calls per SampledLogger, "bot.messages=100"
+    LOG_CONSOLE        also write to stdout, 0
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime
+
+# LogRecord attributes that are not extra fields
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+
+# LOG_SAMPLE rates by logger name, applied by SampledLogger
+_sample_rates = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message, thread, any extra= fields and the traceback.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Merge the arguments now (they may change later) but leave formatting, including
+        # the traceback, to the listener thread. The queue handler is the only handler and
+        # the record never leaves the process, so it is updated in place rather than copied
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _sample_rate(name):
+    while name:
+        rate = _sample_rates.get(name)
+        if rate is not None:
+            return rate
+        name = name.rpartition('.')[0]
+    return 1
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """
+    Logger that keeps 1 in N of its DEBUG calls, N being the LOG_SAMPLE rate of its name or a parent's.
+
+    The rate is applied in isEnabledFor, before a record is built, so a
+    dropped call costs a counter increment. Calls at INFO and above always go
+    through.
+    """
+
+    def __init__(self, name):
+        super().__init__(logging.getLogger(name), {})
+        self._calls = itertools.count()
+
+    def isEnabledFor(self, level):
+        if not self.logger.isEnabledFor(level):
+            return False
+        if level > logging.DEBUG:
+            return True
+        rate = _sample_rate(self.logger.name)
+        return rate <= 1 or next(self._calls) % rate == 0
+
+    def process(self, msg, kwargs):
+        # Keep the caller's extra= fields; the adapter has none of its own
+        return msg, kwargs
+
+
+def _parse_pairs(text, convert):
+    pairs = {}
+    for item in (text or "").split(','):
+        name, _, value = item.partition('=')
+        if name.strip() and value.strip():
+            pairs[name.strip()] = convert(value.strip())
+    return pairs
+
+
+def configure(log_file="bot.log", level="INFO", levels=None, max_bytes=10 * 1024 * 1024, when=None,
+              backup_count=7, sample_rates=None, console=False):
+    """
+    Route all logging through a queue to a JSON-lines file with rotation; return the listener.
+
+    Calling it again replaces the previous pipeline.
+    """
+    global _listener, _sample_rates
+    shutdown()
+
+    if when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(log_file, when=when, backupCount=backup_count,
+                                                                 encoding='utf-8')
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                                            encoding='utf-8')
+    handlers = [file_handler]
+    if console:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    formatter = JsonFormatter()
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    queue_handler = _QueueHandler(records)
+    _sample_rates = dict(sample_rates or {})
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def configure_from_env():
+    return configure(
+        log_file=os.getenv("LOG_FILE", "bot.log"),
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        levels=_parse_pairs(os.getenv("LOG_LEVELS"), str.upper),
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        when=os.getenv("LOG_ROTATE_WHEN") or None,
+        backup_count=int(os.getenv("LOG_BACKUPS", "7")),
+        sample_rates=_parse_pairs(os.getenv("LOG_SAMPLE"), int),
+        console=os.getenv("LOG_CONSOLE", "0") not in ("0", "false", "no"),
+    )
+
+
+def shutdown():
+    """
+    Flush queued records and stop the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown)
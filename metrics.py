@@ -0,0 +1,334 @@
+"""
+Handler, database and Bot API instrumentation.
+
+Metrics.instrument() wraps every handler registered on the TeleBot and
+records, per update:
+
+    latency          histogram per handler; router-dispatched messages are
+                     labelled with their route ("command:start", "state:...")
+    DB queries       every statement the handler thread runs, counted by an
+                     sqlite3 trace callback installed on each connection
+    Bot API calls    replies queued on the outbox plus direct API requests
+    errors           per handler
+
+Totals of actual Bot API requests per method (counted through telebot's
+apihelper.CUSTOM_REQUEST_SENDER hook) and of DB statements are kept as
+counters, and any stats() provider (outbox, caches) can be registered as
+gauges. render() produces the Prometheus text format served by serve() on a
+local port; summary() feeds the admin /stats command.
+
+Recording an observation is a bisect and a few integer updates under a lock.
+Per-statement and per-update counts are kept per thread without a lock and
+summed when read.
+"""
+import functools
+import math
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from telebot import apihelper
+
+import db
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, math.inf)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.total, self.count
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-quantile (0 if nothing was observed).
+        """
+        counts, _, count = self.snapshot()
+        if not count:
+            return 0
+        rank = q * count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == math.inf else repr(float(bound))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_sessions = threading.local()
+
+
+def _send_request(method, url, **kwargs):
+    # What apihelper does without a custom sender: one requests.Session per thread
+    session = apihelper.session or getattr(_sessions, 'session', None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    return session.request(method, url, **kwargs)
+
+
+class _ThreadCounters:
+    """
+    One thread's counts; only that thread writes them, so they need no lock.
+    """
+
+    def __init__(self):
+        self.active = False  # inside a tracked handler
+        self.queries = 0  # of the current update
+        self.api_calls = 0  # of the current update
+        self.db_queries = 0
+        self.updates = 0
+
+
+class Metrics:
+    def __init__(self):
+        self.latency = {}  # handler -> Histogram
+        self.errors = {}  # handler -> count
+        self.queries_per_update = Histogram(COUNT_BUCKETS)
+        self.api_calls_per_update = Histogram(COUNT_BUCKETS)
+        self.api_requests = {}  # method -> count
+        self._stats = {}
+        self._threads = []  # every thread's _ThreadCounters
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def db_queries(self):
+        return sum(counters.db_queries for counters in list(self._threads))
+
+    @property
+    def updates(self):
+        return sum(counters.updates for counters in list(self._threads))
+
+    # Recording
+
+    def _counters(self):
+        try:
+            return self._local.counters
+        except AttributeError:
+            counters = self._local.counters = _ThreadCounters()
+            with self._lock:
+                self._threads.append(counters)
+            return counters
+
+    def _histogram(self, handler):
+        histogram = self.latency.get(handler)
+        if histogram is None:
+            with self._lock:
+                histogram = self.latency.setdefault(handler, Histogram(LATENCY_BUCKETS))
+        return histogram
+
+    def observe_handler(self, handler, elapsed, failed=False):
+        self._histogram(handler).observe(elapsed)
+        if failed:
+            with self._lock:
+                self.errors[handler] = self.errors.get(handler, 0) + 1
+
+    def count_query(self, statement=None):
+        counters = self._counters()
+        counters.db_queries += 1
+        if counters.active:
+            counters.queries += 1
+
+    def count_api_request(self, method):
+        counters = self._counters()
+        if counters.active:
+            counters.api_calls += 1
+        with self._lock:
+            self.api_requests[method] = self.api_requests.get(method, 0) + 1
+
+    def count_queued_reply(self):
+        counters = self._counters()
+        if counters.active:
+            counters.api_calls += 1
+
+    def track(self, name, func, time_it=True):
+        """
+        Wrap a handler: per-update query and API counts, and its latency unless time_it is False.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            counters = self._counters()
+            if counters.active:
+                # Called from inside another tracked handler: the outer one counts the update
+                return func(*args, **kwargs)
+            counters.active = True
+            counters.queries = 0
+            counters.api_calls = 0
+            start = time.perf_counter()
+            failed = False
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                counters.active = False
+                if time_it:
+                    self.observe_handler(name, elapsed, failed)
+                self.queries_per_update.observe(counters.queries)
+                self.api_calls_per_update.observe(counters.api_calls)
+                counters.updates += 1
+        return wrapper
+
+    # Wiring
+
+    def instrument(self, bot, router=None, outbox=None, dispatch=None):
+        """
+        Wrap every handler registered on bot, count DB statements and Bot API requests.
+
+        dispatch is the message handler that hands messages to router; its
+        latency is recorded per route by the router instead.
+        """
+        for attribute, handlers in vars(bot).items():
+            if not attribute.endswith('_handlers') or not isinstance(handlers, list):
+                continue
+            for handler in handlers:
+                if not isinstance(handler, dict) or 'function' not in handler:
+                    continue
+                func = handler['function']
+                handler['function'] = self.track(func.__name__, func, time_it=func is not dispatch)
+        if router is not None:
+            router.add_observer(self.observe_handler)
+        if outbox is not None:
+            send_message = outbox.send_message
+
+            @functools.wraps(send_message)
+            def counted_send_message(*args, **kwargs):
+                self.count_queued_reply()
+                return send_message(*args, **kwargs)
+
+            outbox.send_message = counted_send_message
+
+        send_request = apihelper.CUSTOM_REQUEST_SENDER or _send_request
+
+        def counted_send_request(method, url, **kwargs):
+            # Bot API URLs end in the method name, ".../bot<token>/sendMessage"
+            self.count_api_request(url.rpartition('/')[2])
+            return send_request(method, url, **kwargs)
+
+        apihelper.CUSTOM_REQUEST_SENDER = counted_send_request
+        db.add_connect_hook(lambda conn: conn.set_trace_callback(self.count_query))
+
+    def register_stats(self, name, stats):
+        """
+        Export the numeric values of stats() as gauges named bot_<name>_<key>.
+        """
+        self._stats[name] = stats
+
+    # Reading
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = ["# TYPE bot_handler_seconds histogram"]
+        for handler, histogram in sorted(self.latency.items()):
+            lines.extend(self._histogram_lines("bot_handler_seconds", histogram, f'handler="{_escape(handler)}"'))
+        lines.append("# TYPE bot_handler_errors_total counter")
+        for handler, count in sorted(self.errors.items()):
+            lines.append(f'bot_handler_errors_total{{handler="{_escape(handler)}"}} {count}')
+        for name, histogram in (("bot_db_queries_per_update", self.queries_per_update),
+                                ("bot_api_calls_per_update", self.api_calls_per_update)):
+            lines.append(f"# TYPE {name} histogram")
+            lines.extend(self._histogram_lines(name, histogram))
+        lines.append("# TYPE bot_updates_total counter")
+        lines.append(f"bot_updates_total {self.updates}")
+        lines.append("# TYPE bot_db_queries_total counter")
+        lines.append(f"bot_db_queries_total {self.db_queries}")
+        lines.append("# TYPE bot_api_requests_total counter")
+        for method, count in sorted(self.api_requests.items()):
+            lines.append(f'bot_api_requests_total{{method="{_escape(method)}"}} {count}')
+        for name, stats in sorted(self._stats.items()):
+            for key, value in sorted(stats().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE bot_{name}_{key} gauge")
+                    lines.append(f"bot_{name}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _histogram_lines(name, histogram, labels=""):
+        counts, total, count = histogram.snapshot()
+        separator = "," if labels else ""
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.buckets, counts):
+            cumulative += bucket_count
+            yield f'{name}_bucket{{{labels}{separator}le="{_format_bound(bound)}"}} {cumulative}'
+        suffix = f"{{{labels}}}" if labels else ""
+        yield f"{name}_sum{suffix} {total}"
+        yield f"{name}_count{suffix} {count}"
+
+    def summary(self, top=10):
+        """
+        Figures for /stats: totals and the slowest handlers as (handler, count, p50_ms, p99_ms, errors).
+        """
+        handlers = []
+        for handler, histogram in list(self.latency.items()):
+            handlers.append((handler, histogram.count, histogram.quantile(0.5) * 1e3,
+                             histogram.quantile(0.99) * 1e3, self.errors.get(handler, 0)))
+        handlers.sort(key=lambda row: (row[3], row[1]), reverse=True)
+        updates = self.queries_per_update.count
+        return {
+            'updates': self.updates,
+            'errors': sum(self.errors.values()),
+            'db_queries': self.db_queries,
+            'queries_per_update': self.queries_per_update.total / updates if updates else 0,
+            'api_calls_per_update': self.api_calls_per_update.total / updates if updates else 0,
+            'api_requests': sum(self.api_requests.values()),
+            'handlers': handlers[:top],
+            'stats': {name: stats() for name, stats in self._stats.items()},
+        }
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(metrics, host="127.0.0.1", port=9108):
+    """
+    Serve GET /metrics on a daemon thread; return the server.
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {'metrics': metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
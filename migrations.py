@@ -0,0 +1,173 @@
+"""
+Versioned schema migrations for data.db.
+
+The schema version lives in SQLite's PRAGMA user_version. migrate() is called
+once at startup and applies every migration newer than that version, each in
+its own transaction, so any data.db - fresh, the drifted production file, or
+one that is already current - ends up with the same schema.
+"""
+import logging
+
+import db
+import sales
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(c, table):
+    return {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_missing_columns(c, table, columns):
+    existing = _columns(c, table)
+    for name, definition in columns:
+        if name not in existing:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+def _base_schema(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                 (user_id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, first_name TEXT, last_name TEXT,
+                  type TEXT DEFAULT 'client', saved_name TEXT, debt INTEGER DEFAULT 0, telegram_id TEXT,
+                  discount INTEGER DEFAULT 0)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS products
+                 (product_id INTEGER PRIMARY KEY, product_name TEXT, product_price INTEGER)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS orders
+                 (order_id INTEGER PRIMARY KEY, user_id INTEGER, order_date TEXT, total_sum INTEGER,
+                  total_quantity INTEGER, total_debt INTEGER DEFAULT 0, before_order_debt INTEGER,
+                  is_confirmed INTEGER DEFAULT 0)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS itemInOrder
+                 (order_id INTEGER, product_id INTEGER, quantity INTEGER, price INTEGER, product_name TEXT,
+                  product_price INTEGER,
+                  FOREIGN KEY(order_id) REFERENCES orders(order_id),
+                  FOREIGN KEY(product_id) REFERENCES products(product_id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS payments
+                 (payment_id INTEGER PRIMARY KEY, user_id INTEGER, amount INTEGER, is_confirmed INTEGER DEFAULT 0,
+                  comment TEXT,
+                  FOREIGN KEY(user_id) REFERENCES users(user_id))''')
+
+    # Older databases were created before these columns existed
+    _add_missing_columns(c, 'users', [('discount', 'INTEGER DEFAULT 0')])
+    _add_missing_columns(c, 'itemInOrder', [('product_name', 'TEXT'), ('product_price', 'INTEGER')])
+    _add_missing_columns(c, 'payments', [('comment', 'TEXT')])
+
+
+def _lookup_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_type ON users(type)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_item_in_order_order_id ON itemInOrder(order_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_payments_user_id ON payments(user_id)")
+    c.execute("ANALYZE")
+
+
+def _conversation_state(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS conversation_state
+                 (namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB, updated_at REAL,
+                  PRIMARY KEY(namespace, key))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_conversation_state_updated_at ON conversation_state(updated_at)")
+
+
+def _debt_ledger(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS ledger
+                 (entry_id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, kind TEXT NOT NULL,
+                  amount INTEGER NOT NULL, balance INTEGER NOT NULL, created_at TEXT NOT NULL,
+                  order_id INTEGER, payment_id INTEGER, comment TEXT,
+                  FOREIGN KEY(user_id) REFERENCES users(user_id))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ledger_user_created ON ledger(user_id, created_at)")
+
+    # users.debt becomes the materialized ledger balance; open the ledger with the current debts.
+    # Discounts used to store fractional debts, the ledger keeps whole so'm
+    c.execute("UPDATE users SET debt = CAST(ROUND(COALESCE(debt, 0)) AS INTEGER)")
+    c.execute('''INSERT INTO ledger (user_id, kind, amount, balance, created_at, comment)
+                 SELECT user_id, 'adjustment', debt, debt, datetime('now', 'localtime'), 'Opening balance'
+                 FROM users WHERE debt != 0''')
+
+
+def _sales_aggregates(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_daily
+                 (day TEXT PRIMARY KEY, orders INTEGER NOT NULL, quantity INTEGER NOT NULL,
+                  revenue INTEGER NOT NULL) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_daily_product
+                 (day TEXT NOT NULL, product_id INTEGER NOT NULL, quantity INTEGER NOT NULL,
+                  revenue INTEGER NOT NULL, PRIMARY KEY(day, product_id)) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_daily_client
+                 (day TEXT NOT NULL, user_id INTEGER NOT NULL, orders INTEGER NOT NULL, quantity INTEGER NOT NULL,
+                  revenue INTEGER NOT NULL, PRIMARY KEY(day, user_id)) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_type_debt ON users(type, debt)")
+
+    # Backfill from the existing history: group by the raw order_date in SQL, then merge the
+    # groups whose dates normalize to the same day
+    daily, by_client, by_product = {}, {}, {}
+    for order_date, user_id, orders, quantity, revenue in c.execute(
+            "SELECT order_date, user_id, COUNT(*), SUM(total_quantity), SUM(total_sum) FROM orders "
+            "GROUP BY order_date, user_id").fetchall():
+        day = sales.day_of(order_date)
+        for totals, key in ((daily, day), (by_client, (day, user_id))):
+            previous = totals.get(key, (0, 0, 0))
+            totals[key] = (previous[0] + orders, previous[1] + (quantity or 0), previous[2] + (revenue or 0))
+    for order_date, product_id, quantity, revenue in c.execute(
+            "SELECT o.order_date, i.product_id, SUM(i.quantity), SUM(i.quantity * i.price) "
+            "FROM itemInOrder i JOIN orders o ON o.order_id = i.order_id "
+            "GROUP BY o.order_date, i.product_id").fetchall():
+        key = (sales.day_of(order_date), product_id)
+        previous = by_product.get(key, (0, 0))
+        by_product[key] = (previous[0] + (quantity or 0), previous[1] + (revenue or 0))
+
+    c.executemany("INSERT INTO sales_daily VALUES (?, ?, ?, ?)", [(k, *v) for k, v in daily.items()])
+    c.executemany("INSERT INTO sales_daily_client VALUES (?, ?, ?, ?, ?)", [(*k, *v) for k, v in by_client.items()])
+    c.executemany("INSERT INTO sales_daily_product VALUES (?, ?, ?, ?)", [(*k, *v) for k, v in by_product.items()])
+
+
+def _client_search(c):
+    # External-content FTS5 index over the users table, kept in sync by triggers
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS client_search USING fts5
+                 (first_name, last_name, saved_name, username, content='users', content_rowid='user_id',
+                  tokenize="unicode61 remove_diacritics 2", prefix='1 2 3')''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS users_search_insert AFTER INSERT ON users BEGIN
+                     INSERT INTO client_search (rowid, first_name, last_name, saved_name, username)
+                     VALUES (new.user_id, new.first_name, new.last_name, new.saved_name, new.username);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS users_search_delete AFTER DELETE ON users BEGIN
+                     INSERT INTO client_search (client_search, rowid, first_name, last_name, saved_name, username)
+                     VALUES ('delete', old.user_id, old.first_name, old.last_name, old.saved_name, old.username);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS users_search_update
+                 AFTER UPDATE OF first_name, last_name, saved_name, username ON users BEGIN
+                     INSERT INTO client_search (client_search, rowid, first_name, last_name, saved_name, username)
+                     VALUES ('delete', old.user_id, old.first_name, old.last_name, old.saved_name, old.username);
+                     INSERT INTO client_search (rowid, first_name, last_name, saved_name, username)
+                     VALUES (new.user_id, new.first_name, new.last_name, new.saved_name, new.username);
+                 END''')
+    c.execute("INSERT INTO client_search (client_search) VALUES ('rebuild')")
+
+
+# (version, description, function) - append new migrations, never reorder
+MIGRATIONS = [
+    (1, "base schema", _base_schema),
+    (2, "indexes on hot lookup columns", _lookup_indexes),
+    (3, "conversation state table", _conversation_state),
+    (4, "debt ledger", _debt_ledger),
+    (5, "sales aggregates", _sales_aggregates),
+    (6, "client search index", _client_search),
+]
+
+
+def current_version():
+    return db.query_one("PRAGMA user_version")[0]
+
+
+def migrate():
+    """
+    Bring the configured database up to the latest schema version.
+    """
+    version = current_version()
+    for target, description, apply in MIGRATIONS:
+        if target <= version:
+            continue
+        with db.transaction() as c:
+            apply(c)
+            c.execute(f"PRAGMA user_version = {target}")
+        logger.info(f"Database migrated to version {target}: {description}")
+        version = target
+    return version
@@ -0,0 +1,130 @@
+"""
+Order history listings built from a single joined query.
+
+fetch_page() reads one keyset page of orders, newest first, together with
+their client and line items from a single orders/users/itemInOrder JOIN,
+instead of issuing one query per order for its items and another for the
+client's name. iter_orders() streams a whole history through the same JOIN. MessageBuilder packs the formatted orders into messages under
+Telegram's size limit.
+"""
+from collections import namedtuple
+from itertools import groupby
+
+import db
+
+Order = namedtuple('Order', [
+    'order_id', 'user_id', 'order_date', 'total_sum', 'total_quantity', 'total_debt', 'before_order_debt',
+    'is_confirmed', 'client_name', 'products',
+])
+
+# Telegram rejects messages longer than this many characters
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+PAGE_SIZE = 10
+
+_ORDER_ROWS_SQL = """
+    SELECT o.order_id, o.user_id, o.order_date, o.total_sum, o.total_quantity, o.total_debt,
+           o.before_order_debt, o.is_confirmed, u.first_name, u.last_name,
+           i.product_name, i.quantity, i.product_price
+    FROM orders o
+    LEFT JOIN users u ON u.user_id = o.user_id
+    LEFT JOIN itemInOrder i ON i.order_id = o.order_id
+"""
+
+
+def _full_name(first_name, last_name):
+    full_name = f"{first_name or ''} {last_name or ''}".strip()
+    return full_name if full_name else "Noma'lum"
+
+
+def _group_rows(rows):
+    for order_id, order_rows in groupby(rows, key=lambda row: row[0]):
+        first = next(order_rows)
+        products = [first[10:13]] if first[10] is not None or first[11] is not None else []
+        products.extend(row[10:13] for row in order_rows)
+        yield Order(*first[:8], _full_name(first[8], first[9]), products)
+
+
+def _exists(where, params):
+    return db.query_one(f"SELECT EXISTS(SELECT 1 FROM orders WHERE {where})", params)[0] == 1
+
+
+def fetch_page(user_id=None, before=None, after=None, page_size=PAGE_SIZE):
+    """
+    Return (orders, newer_cursor, older_cursor) for one page of history, newest first.
+
+    Pages are addressed by order_id (keyset pagination): `before` continues with
+    older orders, `after` goes back to newer ones. A cursor is None when there
+    is nothing further in that direction. Each page costs the same no matter
+    how long the history is.
+    """
+    scope, scope_params = ("user_id = ?", (user_id,)) if user_id is not None else ("1", ())
+
+    if after is not None:
+        ids = db.query_all(f"SELECT order_id FROM orders WHERE {scope} AND order_id > ? "
+                           "ORDER BY order_id ASC LIMIT ?", (*scope_params, after, page_size))
+    elif before is not None:
+        ids = db.query_all(f"SELECT order_id FROM orders WHERE {scope} AND order_id < ? "
+                           "ORDER BY order_id DESC LIMIT ?", (*scope_params, before, page_size))
+    else:
+        ids = db.query_all(f"SELECT order_id FROM orders WHERE {scope} "
+                           "ORDER BY order_id DESC LIMIT ?", (*scope_params, page_size))
+    ids = sorted((row[0] for row in ids), reverse=True)
+    if not ids:
+        return [], None, None
+
+    placeholders = ",".join("?" * len(ids))
+    rows = db.query_iter(_ORDER_ROWS_SQL + f" WHERE o.order_id IN ({placeholders}) ORDER BY o.order_id DESC", ids)
+    orders = list(_group_rows(rows))
+
+    newest, oldest = ids[0], ids[-1]
+    newer_cursor = newest if _exists(f"{scope} AND order_id > ?", (*scope_params, newest)) else None
+    older_cursor = oldest if _exists(f"{scope} AND order_id < ?", (*scope_params, oldest)) else None
+    return orders, newer_cursor, older_cursor
+
+
+def iter_orders(user_id=None):
+    """
+    Yield Order tuples oldest first, optionally for a single client, streamed from one JOIN.
+
+    Reads the whole history, so it is for exports and batch jobs; chat listings use fetch_page().
+    """
+    if user_id is None:
+        rows = db.query_iter(_ORDER_ROWS_SQL + " ORDER BY o.order_id", ())
+    else:
+        rows = db.query_iter(_ORDER_ROWS_SQL + " WHERE o.user_id = ? ORDER BY o.order_id", (user_id,))
+    return _group_rows(rows)
+
+
+class MessageBuilder:
+    """
+    Packs text blocks into as few messages as possible without splitting a block.
+
+    A block that is longer than the limit on its own is split on line boundaries.
+    """
+
+    def __init__(self, limit=TELEGRAM_MESSAGE_LIMIT):
+        self.limit = limit
+        self._messages = []
+        self._parts = []
+        self._size = 0
+
+    def _flush(self):
+        if self._parts:
+            self._messages.append("".join(self._parts))
+            self._parts = []
+            self._size = 0
+
+    def add(self, block):
+        if self._size + len(block) > self.limit:
+            self._flush()
+        while len(block) > self.limit:
+            cut = block.rfind("\n", 0, self.limit) + 1 or self.limit
+            self._messages.append(block[:cut])
+            block = block[cut:]
+        self._parts.append(block)
+        self._size += len(block)
+
+    def messages(self):
+        self._flush()
+        return self._messages
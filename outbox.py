@@ -0,0 +1,311 @@
+"""
+Outbound message queue.
+
+Handlers used to call bot.send_message directly, blocking the update worker on
+one HTTPS round trip per message. Outbox.send_message only enqueues; a few
+sender threads deliver in the background while respecting Telegram's limits:
+
+  - a global token bucket (about 30 messages per second for the whole bot),
+  - a token bucket per chat (about one message per second, short bursts allowed),
+  - 429 responses pause that chat for the returned retry_after and the message
+    is retried; network errors are retried with exponential backoff.
+
+Consecutive queued messages for the same chat are coalesced into one message
+when they fit in Telegram's size limit and use the same parse_mode. The
+reply_markup of the last message is kept, so "text, text, text + keyboard"
+becomes one message carrying the keyboard.
+
+Messages to one chat are always delivered in the order they were queued.
+
+start() delivers with sender threads. Other drivers (the asyncio runtime) can
+deliver instead by pairing take() or take_batch() with done().
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from order_reports import TELEGRAM_MESSAGE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = 30
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+MAX_RETRIES = 5
+
+_SWEEP_EVERY = 1000
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        # now may predate a bucket created after the caller read the clock
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        """
+        Seconds until a token is available, 0 if one is available now.
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Outgoing:
+    __slots__ = ('chat_id', 'text', 'kwargs', 'attempts', 'parts')
+
+    def __init__(self, chat_id, text, kwargs):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.attempts = 0
+        self.parts = 1
+
+    def can_absorb(self, other):
+        if 'reply_markup' in self.kwargs:
+            return False
+        if {k: v for k, v in other.kwargs.items() if k != 'reply_markup'} != self.kwargs:
+            return False
+        return len(self.text) + 2 + len(other.text) <= TELEGRAM_MESSAGE_LIMIT
+
+    def absorb(self, other):
+        self.text = f"{self.text}\n\n{other.text}"
+        self.kwargs = other.kwargs
+        self.parts += other.parts
+
+
+def _retry_after(error):
+    """
+    Seconds to wait for a 429 error, or None if error is not a rate-limit response.
+    """
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    result_json = getattr(error, 'result_json', None) or {}
+    return (result_json.get('parameters') or {}).get('retry_after', 1)
+
+
+class Outbox:
+    def __init__(self, send, workers=4, maxsize=10000, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE,
+                 chat_burst=CHAT_BURST, max_retries=MAX_RETRIES, coalesce=True):
+        """
+        send(chat_id, text, **kwargs) delivers one message, normally bot.send_message.
+        """
+        self._send = send
+        self.workers = workers
+        self.maxsize = maxsize
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.coalesce = coalesce
+
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._pending = OrderedDict()  # chat -> deque of _Outgoing, only chats with queued messages
+        self._size = 0
+        self._busy = set()
+        self._paused = {}  # chat -> monotonic time the chat may send again
+        self._buckets = {}
+        self._global = TokenBucket(global_rate, global_rate)
+        self._threads = []
+        self._closing = False
+        self._counters = {'queued': 0, 'sent': 0, 'coalesced': 0, 'rate_limited': 0, 'retried': 0, 'failed': 0}
+
+    def send_message(self, chat_id, text, **kwargs):
+        """
+        Queue a message and return immediately. Blocks only while the queue is full.
+        """
+        key = str(chat_id)
+        with self._not_full:
+            while self._size >= self.maxsize:
+                self._not_full.wait()
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = deque()
+            pending.append(_Outgoing(chat_id, text, kwargs))
+            self._size += 1
+            self._counters['queued'] += 1
+            self._not_empty.notify()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.close)
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued message has been delivered or dropped.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._not_full:
+            while self._size or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._not_full.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        """
+        Deliver what is still queued (up to timeout seconds) and stop the sender threads.
+        """
+        self.flush(timeout)
+        with self._lock:
+            self._closing = True
+            self._not_empty.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads = []
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=self._size, chats=len(self._pending))
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _next_chat(self, now):
+        """
+        Return (chat, None) for the first chat allowed to send, else (None, seconds to wait).
+        """
+        wait = self._global.delay(now)
+        if wait:
+            return None, wait
+        wait = None
+        for key in self._pending:
+            if key in self._busy:
+                continue
+            delay = max(self._paused.get(key, 0) - now, self._bucket(key).delay(now))
+            if delay <= 0:
+                return key, None
+            if wait is None or delay < wait:
+                wait = delay
+        return None, wait
+
+    def take(self, block=True):
+        """
+        Pop the next (possibly coalesced) message that may be sent now and mark its chat busy.
+
+        Returns None once the outbox is closing, or when block is False and nothing is ready.
+        Every message taken must be handed back with done().
+        """
+        with self._lock:
+            while True:
+                if self._closing:
+                    return None
+                now = time.monotonic()
+                key, wait = self._next_chat(now)
+                if key is not None:
+                    break
+                if not block:
+                    return None
+                self._not_empty.wait(wait)
+
+            pending = self._pending[key]
+            item = pending.popleft()
+            if self.coalesce:
+                while pending and item.can_absorb(pending[0]):
+                    item.absorb(pending.popleft())
+            if pending:
+                self._pending.move_to_end(key)  # round robin between chats
+            else:
+                del self._pending[key]
+            self._paused.pop(key, None)
+            self._busy.add(key)
+            self._bucket(key).take(now)
+            self._global.take(now)
+            self._size -= item.parts
+            self._counters['coalesced'] += item.parts - 1
+            self._not_full.notify_all()
+            return item
+
+    def take_batch(self, limit=32):
+        """
+        Block for one message, then take every other message that is ready (up to limit).
+        """
+        item = self.take()
+        if item is None:
+            return None
+        batch = [item]
+        while len(batch) < limit:
+            item = self.take(block=False)
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    def done(self, item, error=None):
+        """
+        Report the outcome of sending a taken message; failed messages are requeued if retryable.
+        """
+        retry_in = None
+        if error is not None:
+            item.attempts += 1
+            retry_in = _retry_after(error)
+            rate_limited = retry_in is not None
+            if retry_in is None and getattr(error, 'error_code', None) is None:
+                retry_in = 2 ** (item.attempts - 1)  # network error
+            if item.attempts > self.max_retries:
+                retry_in = None
+            if retry_in is None:
+                logger.error(f"Dropping message to chat {item.chat_id} after {item.attempts} attempt(s): {error}")
+
+        key = str(item.chat_id)
+        with self._lock:
+            self._busy.discard(key)
+            if error is None:
+                self._counters['sent'] += 1
+                if self._counters['sent'] % _SWEEP_EVERY == 0:
+                    now = time.monotonic()
+                    for chat in [chat for chat, bucket in self._buckets.items()
+                                 if chat not in self._pending and chat not in self._busy and bucket.is_full(now)]:
+                        del self._buckets[chat]
+            elif retry_in is None:
+                self._counters['failed'] += 1
+            else:
+                self._counters['rate_limited'] += rate_limited
+                self._counters['retried'] += 1
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = deque()
+                    self._pending.move_to_end(key, last=False)
+                pending.appendleft(item)
+                self._size += item.parts
+                self._paused[key] = time.monotonic() + retry_in
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def _run(self):
+        while True:
+            item = self.take()
+            if item is None:
+                return
+            try:
+                self._send(item.chat_id, item.text, **item.kwargs)
+            except Exception as e:
+                self.done(item, e)
+            else:
+                self.done(item)
@@ -0,0 +1,109 @@
+"""
+Payment approval.
+
+A payment reported by a client waits in payments with is_confirmed = 0 until
+an admin confirms it (is_confirmed = 1, booked in the ledger) or rejects it
+(the row is deleted). Both claim the payments with one conditional statement,
+UPDATE/DELETE ... WHERE is_confirmed = 0 RETURNING, so when two admins act on
+the same payment at once only one of them gets the row back and applies it.
+
+A batch is claimed in one transaction, and each affected client's payments are
+booked with a single ledger.post_many(), i.e. one balance update per client
+however many of their payments are in the batch.
+"""
+from collections import namedtuple
+from itertools import groupby
+
+import db
+import ledger
+
+PAGE_SIZE = 10
+
+# telegram_id is what the bot stores in payments.user_id; user_id is the client's users.user_id
+Payment = namedtuple('Payment', ['payment_id', 'telegram_id', 'user_id', 'amount', 'comment'])
+
+PendingPayment = namedtuple('PendingPayment', ['payment_id', 'user_id', 'first_name', 'last_name', 'amount',
+                                               'comment'])
+
+# Pending payments of registered users only; a payment whose user is gone is never claimed
+_PENDING = "is_confirmed = 0 AND EXISTS (SELECT 1 FROM users u WHERE u.telegram_id = payments.user_id)"
+
+_RETURNING = """
+    RETURNING payment_id, user_id,
+              (SELECT u.user_id FROM users u WHERE u.telegram_id = payments.user_id), amount, comment
+"""
+
+_PENDING_SQL = """
+    SELECT p.payment_id, u.user_id, u.first_name, u.last_name, p.amount, p.comment
+    FROM payments p
+    JOIN users u ON u.telegram_id = p.user_id
+    WHERE p.is_confirmed = 0
+    ORDER BY p.payment_id
+    LIMIT ?
+"""
+
+
+def pending(limit=PAGE_SIZE):
+    """
+    Oldest pending payments as PendingPayment tuples.
+    """
+    return [PendingPayment(*row) for row in db.query_all(_PENDING_SQL, (limit,))]
+
+
+def _placeholders(payment_ids):
+    return ", ".join("?" * len(payment_ids))
+
+
+def confirm(payment_ids):
+    """
+    Confirm the still-pending payments among payment_ids in one transaction; return the ones confirmed.
+
+    Each client's debt goes down by their payments in payment_id order; a
+    payment that takes the debt below zero is followed by an adjustment back
+    to zero, as the single-payment confirmation always did.
+    """
+    payment_ids = list(payment_ids)
+    if not payment_ids:
+        return []
+    with db.transaction() as c:
+        claimed = sorted(Payment(*row) for row in c.execute(
+            f"UPDATE payments SET is_confirmed = 1 "
+            f"WHERE payment_id IN ({_placeholders(payment_ids)}) AND {_PENDING} {_RETURNING}",
+            payment_ids).fetchall())
+        per_client = sorted(claimed, key=lambda payment: (payment.user_id, payment.payment_id))
+        for user_id, client_payments in groupby(per_client, key=lambda payment: payment.user_id):
+            balance = c.execute("SELECT COALESCE(debt, 0) FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+            postings = []
+            for payment in client_payments:
+                balance -= payment.amount
+                postings.append((ledger.PAYMENT, -payment.amount, None, payment.payment_id, None))
+                if balance < 0:
+                    # Debt doesn't go negative; book the overpayment back to zero
+                    postings.append((ledger.ADJUSTMENT, -balance, None, payment.payment_id, "Ortiqcha to'lov"))
+                    balance = 0
+            ledger.post_many(c, user_id, postings)
+    return claimed
+
+
+def reject(payment_ids):
+    """
+    Delete the still-pending payments among payment_ids in one transaction; return the ones rejected.
+    """
+    payment_ids = list(payment_ids)
+    if not payment_ids:
+        return []
+    with db.transaction() as c:
+        return sorted(Payment(*row) for row in c.execute(
+            f"DELETE FROM payments WHERE payment_id IN ({_placeholders(payment_ids)}) AND {_PENDING} {_RETURNING}",
+            payment_ids).fetchall())
+
+
+def by_client(claimed):
+    """
+    Group claimed payments per client: [(telegram_id, count, total amount)].
+    """
+    totals = {}
+    for payment in claimed:
+        count, total = totals.get(payment.telegram_id, (0, 0))
+        totals[payment.telegram_id] = (count + 1, total + payment.amount)
+    return [(telegram_id, count, total) for telegram_id, (count, total) in totals.items()]
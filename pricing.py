@@ -0,0 +1,83 @@
+"""
+Cart pricing and order line insertion in batches.
+
+A cart is a {product_id: quantity} dict. Pricing a whole cart is one
+SELECT ... WHERE product_id IN (...), and all of an order's itemInOrder lines
+are written with a single executemany.
+"""
+from collections import namedtuple
+
+import db
+import ledger
+import sales
+
+CartLine = namedtuple('CartLine', ['product_id', 'product_name', 'product_price', 'quantity'])
+
+
+def fetch_products(product_ids):
+    """
+    Return {product_id: (product_name, product_price)} for the given ids in one query.
+    """
+    product_ids = list({product_id for product_id in product_ids if product_id is not None})
+    if not product_ids:
+        return {}
+    placeholders = ",".join("?" * len(product_ids))
+    rows = db.query_all(
+        f"SELECT product_id, product_name, product_price FROM products WHERE product_id IN ({placeholders})",
+        product_ids)
+    return {product_id: (name, price) for product_id, name, price in rows}
+
+
+def price_cart(cart):
+    """
+    Return (lines, total_sum) for a cart. Products that no longer exist are skipped.
+    """
+    products = fetch_products(cart)
+    lines = [
+        CartLine(product_id, *products[product_id], quantity)
+        for product_id, quantity in cart.items()
+        if product_id in products
+    ]
+    total_sum = sum(line.product_price * line.quantity for line in lines)
+    return lines, total_sum
+
+
+def insert_order_lines(c, order_id, lines):
+    """
+    Insert (product_id, product_name, product_price, quantity, price) rows for an order.
+
+    Runs on the caller's transaction cursor.
+    """
+    c.executemany(
+        "INSERT INTO itemInOrder (order_id, product_id, product_name, product_price, quantity, price) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(order_id, *line) for line in lines])
+
+
+def insert_order(c, user_id, order_date, lines, total_sum, total_quantity, total_debt=None, before_order_debt=None):
+    """
+    Insert an unconfirmed order with its lines and book it in the debt ledger; return the order_id.
+
+    Without total_debt the order is booked on the client's balance as this
+    transaction sees it: before_order_debt and total_debt are taken from the
+    ledger. Orders parsed from the source system carry their own debt, so any
+    difference from our balance is booked as an adjustment. Runs on the
+    caller's transaction cursor.
+    """
+    reconcile = total_debt is not None
+    if not reconcile:
+        before_order_debt = ledger.balance(user_id, c)
+        total_debt = before_order_debt + total_sum
+    c.execute(
+        "INSERT INTO orders (user_id, order_date, total_sum, total_quantity, total_debt, before_order_debt, is_confirmed) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (user_id, order_date, total_sum, total_quantity, total_debt, before_order_debt, 0)
+    )
+    order_id = c.lastrowid
+    insert_order_lines(c, order_id, lines)
+    sales.record_order(c, order_id)
+    balance = ledger.post(c, user_id, ledger.ORDER, total_sum, order_id=order_id)
+    if reconcile and balance != total_debt:
+        ledger.post(c, user_id, ledger.ADJUSTMENT, total_debt - balance, order_id=order_id,
+                    comment="Buyurtmadagi qarzga moslashtirildi")
+    return order_id
@@ -0,0 +1,86 @@
+"""
+Rendered order receipts.
+
+The same receipt is shown when an order is created, again when the client
+confirms it, and then sent to every admin. ReceiptCache renders each order
+once: add_order() fills it from the data it has just written, and later
+lookups return the cached text without touching the database.
+
+invalidate() drops an order's entry when the order is deleted or its debt
+figures change, and bumps a cache-wide generation counter. A render started
+before any invalidation is not stored, so a render that was already in flight
+when the order changed is never served.
+"""
+import threading
+
+import db
+from cache import TTLCache, MISSING
+
+_RECEIPT_SQL = """
+    SELECT o.order_id, o.order_date, o.total_sum, o.total_quantity, o.before_order_debt, o.total_debt,
+           i.product_name, i.quantity, i.price
+    FROM orders o
+    LEFT JOIN itemInOrder i ON i.order_id = o.order_id
+    WHERE o.order_id = ?
+"""
+
+
+def render(order_id, order_date, total_sum, total_quantity, before_order_debt, total_debt, products):
+    """
+    Format a receipt; products are (product_name, quantity, price) rows.
+    """
+    message = f"📦 Buyurtma ID: {order_id}\n📅 Sana: {order_date}\n\n"
+    message += "🛍 Mahsulotlar:\n"
+    for product_name, quantity, price in products:
+        message += f"- {product_name}: {quantity} x {price:,} = {quantity * price:,} so'm\n"
+
+    message += f"\n💰 Jami summa: {total_sum:,} so'm\n"
+    message += f"📦 Jami miqdor: {total_quantity}\n"
+    message += f"📉 Oldindan bor qarz: {before_order_debt:,} so'm\n"
+    message += f"💳 Jami qarz: {total_debt:,} so'm\n"
+    return message
+
+
+def load(order_id):
+    """
+    Render a receipt from the database with one query; None if the order does not exist.
+    """
+    rows = db.query_all(_RECEIPT_SQL, (order_id,))
+    if not rows:
+        return None
+    products = [row[6:9] for row in rows if row[6] is not None]
+    return render(*rows[0][:6], products)
+
+
+class ReceiptCache:
+    def __init__(self, maxsize=2000, ttl=24 * 60 * 60):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def put(self, order_id, text):
+        self._cache.set(order_id, text)
+
+    def get(self, order_id):
+        """
+        Return the receipt text, rendering it on a miss; None if the order does not exist.
+        """
+        text = self._cache.get(order_id)
+        if text is MISSING:
+            with self._lock:
+                generation = self._generation
+            text = load(order_id)
+            if text is not None:
+                with self._lock:
+                    # Skip the store if any order was invalidated while this one rendered
+                    if generation == self._generation:
+                        self._cache.set(order_id, text)
+        return text
+
+    def invalidate(self, order_id):
+        with self._lock:
+            self._generation += 1
+            self._cache.invalidate(order_id)
+
+    def stats(self):
+        return self._cache.stats()
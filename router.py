@@ -0,0 +1,97 @@
+"""
+Message routing for the bot.
+
+telebot tries every registered message handler in order and evaluates its
+filter lambda, so a message for a late-registered state runs through every
+filter before it matches. Router instead keeps three dicts - /commands, exact
+button texts and conversation states - and resolves each message with at
+most three lookups. bot.py registers a single telebot handler that calls
+Router.dispatch().
+
+Resolution order: command, then button text, then the sender's current
+state, then the fallback handler.
+"""
+import time
+
+
+class Router:
+    def __init__(self, get_state):
+        """
+        get_state(message) returns the sender's current state name, or None.
+        """
+        self._get_state = get_state
+        self._commands = {}
+        self._texts = {}
+        self._states = {}
+        self._fallback = None
+        self._observers = []
+
+    def command(self, *names):
+        def decorator(func):
+            for name in names:
+                self._commands[name] = func
+            return func
+        return decorator
+
+    def text(self, *labels):
+        def decorator(func):
+            for label in labels:
+                self._texts[label] = func
+            return func
+        return decorator
+
+    def state(self, *names):
+        def decorator(func):
+            for name in names:
+                self._states[name] = func
+            return func
+        return decorator
+
+    def add_observer(self, observer):
+        """
+        Call observer(route, seconds, failed) after every dispatched message.
+        """
+        self._observers.append(observer)
+
+    def fallback(self, func):
+        self._fallback = func
+        return func
+
+    def resolve(self, message):
+        """
+        Return (route_name, handler) for a message; handler is None if nothing matches.
+        """
+        text = message.text or ""
+        if text.startswith("/"):
+            name = text.split(maxsplit=1)[0][1:].split("@", 1)[0]
+            handler = self._commands.get(name)
+            if handler is not None:
+                return f"command:{name}", handler
+
+        handler = self._texts.get(text)
+        if handler is not None:
+            return f"text:{text}", handler
+
+        state = self._get_state(message)
+        if state is not None:
+            handler = self._states.get(state)
+            if handler is not None:
+                return f"state:{state}", handler
+
+        return "fallback", self._fallback
+
+    def dispatch(self, message):
+        route, handler = self.resolve(message)
+        if handler is None:
+            return
+        start = time.perf_counter()
+        failed = False
+        try:
+            handler(message)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            for observer in self._observers:
+                observer(route, elapsed, failed)
@@ -0,0 +1,122 @@
+"""
+Incrementally maintained sales aggregates.
+
+Three summary tables hold the totals the /report command needs:
+
+    sales_daily          day -> orders, quantity, revenue
+    sales_daily_product  day x product -> quantity, revenue
+    sales_daily_client   day x client -> orders, quantity, revenue
+
+record_order() adds an order to them (or, with sign=-1, takes a deleted
+order back out) in the same transaction that writes or deletes the order, so
+a report reads at most one row per day in the period and never touches
+orders or itemInOrder. Top debtors come from users.debt, the ledger balance,
+through the (type, debt) index.
+"""
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import db
+
+Totals = namedtuple('Totals', ['orders', 'quantity', 'revenue'])
+
+# order_date is "YYYY-MM-DD[ HH:MM:SS]" for orders entered in the bot and "dd/mm/yyyy" for parsed ones
+_DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%d/%m/%Y")
+
+
+def day_of(order_date):
+    """
+    Normalize an order_date to its "YYYY-MM-DD" day.
+    """
+    order_date = (order_date or "").strip()
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(order_date, date_format).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return order_date[:10]
+
+
+def add(c, day, user_id, quantity, revenue, products, orders=1):
+    """
+    Add to the aggregates: products are (product_id, quantity, revenue) rows.
+
+    Pass negative numbers (and orders=-1) to remove an order. Runs on the
+    caller's transaction cursor.
+    """
+    c.execute('''INSERT INTO sales_daily (day, orders, quantity, revenue) VALUES (?, ?, ?, ?)
+                 ON CONFLICT(day) DO UPDATE SET orders = orders + excluded.orders,
+                     quantity = quantity + excluded.quantity, revenue = revenue + excluded.revenue''',
+              (day, orders, quantity, revenue))
+    c.execute('''INSERT INTO sales_daily_client (day, user_id, orders, quantity, revenue) VALUES (?, ?, ?, ?, ?)
+                 ON CONFLICT(day, user_id) DO UPDATE SET orders = orders + excluded.orders,
+                     quantity = quantity + excluded.quantity, revenue = revenue + excluded.revenue''',
+              (day, user_id, orders, quantity, revenue))
+    c.executemany('''INSERT INTO sales_daily_product (day, product_id, quantity, revenue) VALUES (?, ?, ?, ?)
+                     ON CONFLICT(day, product_id) DO UPDATE SET quantity = quantity + excluded.quantity,
+                         revenue = revenue + excluded.revenue''',
+                  [(day, product_id, q, r) for product_id, q, r in products])
+
+
+def record_order(c, order_id, sign=1):
+    """
+    Add a stored order to the aggregates, or take it out with sign=-1 before it is deleted.
+    """
+    row = c.execute("SELECT user_id, order_date, total_quantity, total_sum FROM orders WHERE order_id = ?",
+                    (order_id,)).fetchone()
+    if row is None:
+        return
+    user_id, order_date, quantity, revenue = row
+    products = c.execute('''SELECT product_id, SUM(quantity), SUM(quantity * price) FROM itemInOrder
+                            WHERE order_id = ? GROUP BY product_id''', (order_id,)).fetchall()
+    add(c, day_of(order_date), user_id, sign * (quantity or 0), sign * (revenue or 0),
+        [(product_id, sign * q, sign * r) for product_id, q, r in products], orders=sign)
+
+
+def period_start(period, today=None):
+    """
+    First day of 'day', 'week' (from Monday) or 'month' containing today.
+    """
+    today = today or date.today()
+    if period == 'day':
+        return today
+    if period == 'week':
+        return today - timedelta(days=today.weekday())
+    if period == 'month':
+        return today.replace(day=1)
+    raise ValueError(f"Unknown period: {period}")
+
+
+def totals(start, end):
+    """
+    Totals for start <= day <= end (date objects or "YYYY-MM-DD").
+    """
+    row = db.query_one("SELECT COALESCE(SUM(orders), 0), COALESCE(SUM(quantity), 0), COALESCE(SUM(revenue), 0) "
+                       "FROM sales_daily WHERE day BETWEEN ? AND ?", (str(start), str(end)))
+    return Totals(*row)
+
+
+def top_products(start, end, limit=10):
+    """
+    [(product_name, quantity, revenue)] for the period, best sellers by quantity first.
+    """
+    return db.query_all('''
+        SELECT COALESCE(p.product_name, '#' || s.product_id), SUM(s.quantity) AS sold, SUM(s.revenue)
+        FROM sales_daily_product s
+        LEFT JOIN products p ON p.product_id = s.product_id
+        WHERE s.day BETWEEN ? AND ?
+        GROUP BY s.product_id
+        HAVING sold > 0
+        ORDER BY sold DESC
+        LIMIT ?''', (str(start), str(end), limit))
+
+
+def top_debtors(limit=10):
+    """
+    [(user_id, first_name, last_name, debt)] for the clients owing the most.
+    """
+    return db.query_all('''
+        SELECT user_id, first_name, last_name, debt FROM users
+        WHERE type = 'client' AND debt > 0
+        ORDER BY debt DESC
+        LIMIT ?''', (limit,))
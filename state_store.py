@@ -0,0 +1,215 @@
+"""
+Conversation state for the bot's multi-step flows (order building, client
+editing, payments).
+
+State is kept per namespace ('user_states', 'user_cart', ...) behind a small
+dict-like StateMap. Storing None removes the key, and entries idle for longer
+than the TTL are evicted, so memory stays proportional to active users.
+
+Two backends are available:
+  - MemoryStateStore: process memory only, lost on restart.
+  - SQLiteStateStore: same in-memory reads, plus write-behind persistence to the
+    conversation_state table. Changed keys are flushed in batches by a
+    background thread, and the state is reloaded on start(), so a restart
+    resumes in-progress carts and payments.
+"""
+import atexit
+import logging
+import pickle
+import threading
+import time
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# Conversations untouched for this long are dropped
+DEFAULT_IDLE_TTL = 24 * 60 * 60
+
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+_EVICT_EVERY = 1000
+
+
+class StateMap:
+    """
+    Dict-like view of one namespace of a state store.
+    """
+
+    def __init__(self, store, namespace):
+        self._store = store
+        self._namespace = namespace
+
+    def get(self, key, default=None):
+        return self._store.get(self._namespace, str(key), default)
+
+    def __getitem__(self, key):
+        value = self._store.get(self._namespace, str(key))
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._store.set(self._namespace, str(key), value)
+
+    def __delitem__(self, key):
+        self._store.delete(self._namespace, str(key))
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self._store.delete(self._namespace, str(key))
+        return value
+
+    def __repr__(self):
+        return f"StateMap({self._namespace!r}, {self._store.items(self._namespace)!r})"
+
+
+class MemoryStateStore:
+    def __init__(self, idle_ttl=DEFAULT_IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self._entries = {}  # (namespace, key) -> [value, last_access]
+        self._lock = threading.RLock()
+        self._writes = 0
+
+    def namespace(self, name):
+        return StateMap(self, name)
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return default
+            entry[1] = time.time()
+            return entry[0]
+
+    def set(self, namespace, key, value):
+        if value is None:
+            self.delete(namespace, key)
+            return
+        with self._lock:
+            self._entries[(namespace, key)] = [value, time.time()]
+            self._changed((namespace, key))
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                self.evict_idle()
+
+    def delete(self, namespace, key):
+        with self._lock:
+            if self._entries.pop((namespace, key), None) is not None:
+                self._changed((namespace, key))
+
+    def items(self, namespace):
+        with self._lock:
+            return {key: entry[0] for (ns, key), entry in self._entries.items() if ns == namespace}
+
+    def evict_idle(self):
+        """
+        Drop every entry that has not been read or written within the idle TTL.
+        """
+        cutoff = time.time() - self.idle_ttl
+        with self._lock:
+            expired = [k for k, entry in self._entries.items() if entry[1] < cutoff]
+            for k in expired:
+                del self._entries[k]
+                self._changed(k)
+        return len(expired)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _changed(self, k):
+        pass
+
+    def start(self):
+        pass
+
+    def flush(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+class SQLiteStateStore(MemoryStateStore):
+    def __init__(self, idle_ttl=DEFAULT_IDLE_TTL, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        super().__init__(idle_ttl)
+        self.flush_interval = flush_interval
+        self._dirty = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _changed(self, k):
+        self._dirty.add(k)
+
+    def start(self):
+        """
+        Load persisted state and start the background flusher.
+
+        Call after migrations so the conversation_state table exists.
+        """
+        cutoff = time.time() - self.idle_ttl
+        db.execute("DELETE FROM conversation_state WHERE updated_at < ?", (cutoff,))
+        loaded = 0
+        with self._lock:
+            for namespace, key, value, updated_at in db.query_iter(
+                    "SELECT namespace, key, value, updated_at FROM conversation_state"):
+                if (namespace, key) not in self._entries:
+                    self._entries[(namespace, key)] = [pickle.loads(value), updated_at]
+                    loaded += 1
+        logger.info(f"Restored {loaded} conversation state entries.")
+
+        self._thread = threading.Thread(target=self._run, name="state-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def flush(self):
+        """
+        Write every key changed since the last flush in a single transaction.
+        """
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, set()
+
+        try:
+            with self._lock:
+                # Pickle while holding the lock: the values are live dicts that handlers keep changing
+                snapshot = [(k, self._entries.get(k)) for k in dirty]
+                upserts = [(ns, key, pickle.dumps(entry[0]), entry[1]) for (ns, key), entry in snapshot if entry]
+            deletes = [(ns, key) for (ns, key), entry in snapshot if entry is None]
+            with db.transaction() as c:
+                c.executemany("""
+                    INSERT INTO conversation_state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(namespace, key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at
+                """, upserts)
+                c.executemany("DELETE FROM conversation_state WHERE namespace=? AND key=?", deletes)
+        except Exception:
+            # Keep the keys dirty so the next flush retries them
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        return len(snapshot)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Conversation state flush failed: {e}", exc_info=True)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+
+def create_store(backend="sqlite", **kwargs):
+    if backend == "memory":
+        return MemoryStateStore(**kwargs)
+    if backend == "sqlite":
+        return SQLiteStateStore(**kwargs)
+    raise ValueError(f"Unknown state backend: {backend}")
@@ -0,0 +1,88 @@
+"""
+Client account statements as CSV documents.
+
+rows() walks a client's ledger oldest first in a single query joined to the
+order lines and payments: every entry carries the running balance the ledger
+stored with it, and an order entry is followed by its lines. export() streams
+those rows through csv.writer into a SpooledTemporaryFile that stays in memory
+up to SPOOL_SIZE and rolls over to disk beyond it, so memory use does not grow
+with the length of the history.
+
+Telegram keeps uploaded documents and returns a file_id for them; version()
+is the client's newest ledger entry, so a (user_id, version) key identifies
+one rendering of the statement and any new debt change produces a new key.
+"""
+import csv
+import io
+from itertools import chain, groupby
+from tempfile import SpooledTemporaryFile
+
+import db
+import ledger
+
+SPOOL_SIZE = 1024 * 1024
+
+HEADER = ("Sana", "Turi", "Buyurtma ID", "To'lov ID", "Mahsulot", "Miqdori", "Narxi", "Summa", "Qoldiq", "Izoh")
+
+KIND_NAMES = {
+    ledger.ORDER: "Buyurtma",
+    ledger.PAYMENT: "To'lov",
+    ledger.DISCOUNT: "Chegirma",
+    ledger.ADJUSTMENT: "Tuzatish",
+}
+
+_STATEMENT_SQL = """
+    SELECT l.entry_id, l.created_at, l.kind, l.amount, l.balance, l.order_id, l.payment_id,
+           COALESCE(l.comment, p.comment), i.product_name, i.quantity, i.price
+    FROM ledger l
+    LEFT JOIN itemInOrder i ON l.kind = 'order' AND i.order_id = l.order_id
+    LEFT JOIN payments p ON p.payment_id = l.payment_id
+    WHERE l.user_id = ? AND l.entry_id <= ?
+    ORDER BY l.created_at, l.entry_id
+"""
+
+
+def version(user_id):
+    """
+    entry_id of the client's newest ledger entry, or None if they have none.
+    """
+    row = db.query_one("SELECT entry_id FROM ledger WHERE user_id = ? ORDER BY created_at DESC, entry_id DESC LIMIT 1",
+                       (user_id,))
+    return row[0] if row else None
+
+
+def rows(user_id, upto):
+    """
+    Yield CSV rows for the client's ledger entries up to entry_id upto, each order followed by its lines.
+    """
+    for _, entry_rows in groupby(db.query_iter(_STATEMENT_SQL, (user_id, upto)), key=lambda row: row[0]):
+        first = next(entry_rows)
+        _, created_at, kind, amount, balance, order_id, payment_id, comment = first[:8]
+        yield (created_at, KIND_NAMES.get(kind, kind), order_id or "", payment_id or "", "", "", "",
+               amount, balance, comment or "")
+        for row in chain((first,), entry_rows):
+            product_name, quantity, price = row[8:11]
+            if product_name is None and quantity is None:
+                continue
+            yield ("", "", order_id, "", product_name, quantity, price, (quantity or 0) * (price or 0), "", "")
+
+
+def export(user_id, upto):
+    """
+    Write the statement CSV into a spooled temporary file and return it rewound; the caller closes it.
+
+    The file starts with a UTF-8 BOM so Excel opens the Uzbek text correctly.
+    """
+    document = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    text = io.TextIOWrapper(document, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow(HEADER)
+    writer.writerows(rows(user_id, upto))
+    text.flush()
+    text.detach()
+    document.seek(0)
+    return document
+
+
+def file_name(user_id, upto):
+    return f"hisob_{user_id}_{upto}.csv"
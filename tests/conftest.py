@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import migrations  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    A fresh, fully migrated data.db in a temporary directory.
+    """
+    db.configure(str(tmp_path / "data.db"))
+    migrations.migrate()
+    yield
+    db.close_all()
+
+
+def add_client(first_name="Ali", telegram_id=None, debt=0, discount=0):
+    """
+    Insert a client and return their user_id.
+    """
+    with db.transaction() as c:
+        c.execute("INSERT INTO users (username, first_name, last_name, type, debt, telegram_id, discount) "
+                  "VALUES (?, ?, ?, 'client', ?, ?, ?)",
+                  (first_name.lower(), first_name, None, debt, telegram_id, discount))
+        return c.execute("SELECT last_insert_rowid()").fetchone()[0]
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import threading
+import time
+
+import pytest
+
+import async_runtime
+
+
+class SlowBot:
+    token = "0:test"
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.running = 0
+        self.most_running = 0
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def process_new_updates(self, updates):
+        with self._lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        self.release.wait()
+        with self._lock:
+            self.running -= 1
+            self.done += 1
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def test_webhook_batches_in_flight_are_bounded(loop):
+    bot = SlowBot()
+    runtime = async_runtime.AsyncRuntime(bot, outbox=None, db_workers=8)
+    process_updates = runtime.webhook_processor(loop, max_batches=2)
+
+    dispatcher = threading.Thread(target=lambda: [process_updates([n]) for n in range(5)])
+    dispatcher.start()
+    time.sleep(0.2)
+    # Two batches run, the dispatcher waits to hand over the third
+    assert bot.running == 2
+    assert dispatcher.is_alive()
+
+    bot.release.set()
+    dispatcher.join(timeout=5)
+    deadline = time.monotonic() + 5
+    while bot.done < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert bot.done == 5
+    assert bot.most_running == 2
+    runtime.db_executor.shutdown()
+
+
+def test_failed_webhook_batch_is_logged_and_frees_its_slot(loop, caplog):
+    runtime = async_runtime.AsyncRuntime(SlowBot(), outbox=None)
+
+    async def broken(updates):
+        raise RuntimeError("executor gone")
+
+    runtime.process_new_updates = broken
+    process_updates = runtime.webhook_processor(loop, max_batches=1)
+    with caplog.at_level(logging.ERROR, logger="async_runtime"):
+        process_updates([1])
+        process_updates([2])  # would block forever if the failed batch kept its slot
+        deadline = time.monotonic() + 5
+        while len(caplog.records) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert [record.getMessage() for record in caplog.records] == ["Webhook batch failed"] * 2
+    runtime.db_executor.shutdown()
@@ -0,0 +1,25 @@
+import bulk_entry
+from catalogue import normalize_name
+
+PRODUCTS = {"pomidor": 1, "kartoshka": 2, "piyoz": 3, "qo'y go'shti": 4}
+
+
+def lookup(name):
+    return PRODUCTS.get(normalize_name(name))
+
+
+def test_separators_and_spelling_variants():
+    cart, problems = bulk_entry.parse("Pomidor 5\nKartoshka: 10\npiyoz - 3\nQo‘y  go’shti x 2\n", lookup)
+    assert cart == {1: 5, 2: 10, 3: 3, 4: 2}
+    assert problems == []
+
+
+def test_repeated_product_quantities_are_summed():
+    cart, _ = bulk_entry.parse("Pomidor 5\n\nPOMIDOR=2", lookup)
+    assert cart == {1: 7}
+
+
+def test_unusable_lines_are_reported_in_order():
+    cart, problems = bulk_entry.parse("Pomidor 5\nBanan 2\nPiyoz\nKartoshka 0\n  \nPiyoz, 1", lookup)
+    assert cart == {1: 5, 3: 1}
+    assert problems == ["Banan 2", "Piyoz", "Kartoshka 0"]
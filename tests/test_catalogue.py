@@ -0,0 +1,44 @@
+import db
+from catalogue import ProductCatalogue
+
+
+class Markup:
+    def __init__(self, products):
+        self.names = [name for _, name, _ in products]
+
+    def to_json(self):
+        return ",".join(self.names)
+
+
+def test_keyboard_is_built_once_per_version(database):
+    db.execute("INSERT INTO products (product_id, product_name, product_price) VALUES (1, 'Pomidor', 5000)")
+    catalogue = ProductCatalogue()
+    builds = []
+
+    def build(products):
+        builds.append(products)
+        return Markup(products)
+
+    assert catalogue.keyboard(build) == "Pomidor"
+    assert catalogue.keyboard(build) == "Pomidor"
+    assert len(builds) == 1
+
+    db.execute("INSERT INTO products (product_id, product_name, product_price) VALUES (2, 'Kartoshka', 3000)")
+    catalogue.invalidate()
+    assert catalogue.keyboard(build) == "Pomidor,Kartoshka"
+    assert len(builds) == 2
+
+
+def test_keyboard_built_before_a_reload_is_not_cached(database):
+    db.execute("INSERT INTO products (product_id, product_name, product_price) VALUES (1, 'Pomidor', 5000)")
+    catalogue = ProductCatalogue()
+
+    def stale_build(products):
+        # Another thread changes the products and reloads while this keyboard is being built
+        db.execute("INSERT INTO products (product_id, product_name, product_price) VALUES (2, 'Kartoshka', 3000)")
+        catalogue.invalidate()
+        catalogue.products()
+        return Markup(products)
+
+    assert catalogue.keyboard(stale_build) == "Pomidor"
+    assert catalogue.keyboard(Markup) == "Pomidor,Kartoshka"
@@ -0,0 +1,78 @@
+import client_search
+import db
+from conftest import add_client
+
+
+def names(text, page=0, page_size=client_search.PAGE_SIZE):
+    rows, has_more = client_search.search(text, page, page_size)
+    return [first_name for _, first_name, _ in rows], has_more
+
+
+def check_index():
+    # Compares the external-content index with the users table; raises if they disagree
+    db.execute("INSERT INTO client_search (client_search, rank) VALUES ('integrity-check', 1)")
+
+
+def test_match_expression_quotes_every_word_as_a_prefix():
+    assert client_search.match_expression("ali  Val") == '"ali"* "Val"*'
+    assert client_search.match_expression('"; DROP') == '"DROP"*'
+    assert client_search.match_expression("  -- ") is None
+
+
+def test_index_follows_inserted_renamed_and_deleted_clients(database):
+    ali = add_client("Ali")
+    add_client("Vali")
+    assert names("ali") == (["Ali"], False)
+
+    db.execute("UPDATE users SET first_name = 'Hasan', username = 'hasan' WHERE user_id = ?", (ali,))
+    assert names("ali") == ([], False)
+    assert names("has") == (["Hasan"], False)
+
+    db.execute("UPDATE users SET saved_name = 'Bozor Ali' WHERE user_id = ?", (ali,))
+    assert names("bozor") == (["Hasan"], False)
+
+    db.execute("DELETE FROM users WHERE user_id = ?", (ali,))
+    assert names("has") == ([], False)
+    assert names("val") == (["Vali"], False)
+    check_index()
+
+
+def test_every_typed_word_must_start_a_name_word(database):
+    add_client("Ali")
+    add_client("Alisher")
+    add_client("Valijon")
+    db.execute("UPDATE users SET last_name = 'Karimov' WHERE first_name = 'Alisher'")
+
+    assert names("al") == (["Ali", "Alisher"], False)
+    assert names("ALI kar") == (["Alisher"], False)
+    assert names("lij") == ([], False)
+
+
+def test_cyrillic_names_match_without_case_or_diacritics(database):
+    add_client("Алишер")
+    add_client("Ёқуб")
+    add_client("Vali")
+
+    assert names("али") == (["Алишер"], False)
+    assert names("АЛИШ") == (["Алишер"], False)
+    assert names("ёқ") == (["Ёқуб"], False)
+
+
+def test_results_come_back_one_page_at_a_time(database):
+    for i in range(5):
+        add_client(f"Ali{i}")
+    add_client("Vali")
+
+    assert names("ali", page=0, page_size=2) == (["Ali0", "Ali1"], True)
+    assert names("ali", page=1, page_size=2) == (["Ali2", "Ali3"], True)
+    assert names("ali", page=2, page_size=2) == (["Ali4"], False)
+    assert names("", page=2, page_size=2) == (["Ali4", "Vali"], False)
+
+
+def test_only_clients_are_returned(database):
+    add_client("Ali")
+    admin = add_client("Alisher")
+    db.execute("UPDATE users SET type = 'admin' WHERE user_id = ?", (admin,))
+
+    assert names("ali") == (["Ali"], False)
+    assert names("") == (["Ali"], False)
@@ -0,0 +1,66 @@
+import sqlite3
+import threading
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def table(database):
+    db.execute("CREATE TABLE t (n INTEGER)")
+
+
+def test_transaction_commits_on_clean_exit(table):
+    with db.transaction() as c:
+        c.execute("INSERT INTO t VALUES (1)")
+    assert db.query_all("SELECT n FROM t") == [(1,)]
+
+
+def test_transaction_rolls_back_on_error(table):
+    with pytest.raises(ValueError):
+        with db.transaction() as c:
+            c.execute("INSERT INTO t VALUES (1)")
+            raise ValueError
+    assert db.query_all("SELECT n FROM t") == []
+
+
+def test_nested_transaction_joins_the_outer_one(table):
+    with pytest.raises(ValueError):
+        with db.transaction() as outer:
+            outer.execute("INSERT INTO t VALUES (1)")
+            with db.transaction() as inner:
+                inner.execute("INSERT INTO t VALUES (2)")
+            raise ValueError
+    assert db.query_all("SELECT n FROM t") == []
+
+
+def test_each_thread_has_its_own_connection(database):
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(db.get_connection()))
+    thread.start()
+    thread.join()
+    assert connections[0] is not db.get_connection()
+
+
+def test_threads_reopen_their_connection_after_close_all(table):
+    opened = threading.Event()
+    closed = threading.Event()
+    results = []
+
+    def worker():
+        db.query_one("SELECT 1")
+        opened.set()
+        closed.wait()
+        try:
+            results.append(db.query_one("SELECT COUNT(*) FROM t")[0])
+        except sqlite3.Error as e:
+            results.append(e)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    opened.wait()
+    db.close_all()
+    closed.set()
+    thread.join()
+    assert results == [0]
@@ -0,0 +1,84 @@
+import csv
+import io
+
+import pytest
+
+import db
+import importer
+import ledger
+from catalogue import ProductCatalogue
+from conftest import add_client
+
+HEADER = "Наименование товара  Цена  Количество(кб)  Оплата  Перечисление  Остаток долга"
+
+
+def order_lines(saved_name, before, products, date="05,01,2026", total_sum=None, total_quantity=None):
+    total_sum = sum(price * quantity for _, price, quantity in products) if total_sum is None else total_sum
+    total_quantity = sum(quantity for _, _, quantity in products) if total_quantity is None else total_quantity
+    lines = [f"{saved_name}  Qarz  {before:,} so'm  Sana  {date}", HEADER]
+    lines += [f"{name}  {price:,} so'm  {quantity}  0  0  0" for name, price, quantity in products]
+    lines += [f"Jami  {total_sum:,} so'm  0  0  {before + total_sum:,} so'm",
+              f"Jami  -  {total_quantity}  0  0  {before + total_sum:,} so'm", ""]
+    return lines
+
+
+def setup_data():
+    client = add_client("Ali")
+    db.execute("UPDATE users SET saved_name = 'Ali aka' WHERE user_id = ?", (client,))
+    db.execute("INSERT INTO products (product_id, product_name, product_price) "
+               "VALUES (1, 'Pomidor', 5000), (2, 'Kartoshka', 3000)")
+    return client
+
+
+def test_text_export_is_imported_and_booked(database):
+    client = setup_data()
+    lines = (order_lines("Ali aka", 0, [("Pomidor", 5000, 2), ("Kartoshka", 3000, 4)])
+             + order_lines("Ali aka", 22_000, [("pomidor", 5000, 1)], date="06,01,2026"))
+
+    report = importer.import_orders(importer.text_rows(lines), ProductCatalogue(), batch_size=1)
+
+    assert (report.orders, report.lines, report.rejected) == (2, 3, [])
+    assert report.rows == len(lines)
+    assert db.query_all("SELECT order_date, total_sum, total_quantity, total_debt FROM orders ORDER BY order_id") == [
+        ("05/01/2026", 22_000, 6, 22_000), ("06/01/2026", 5_000, 1, 27_000)]
+    assert db.query_all("SELECT product_id, product_name, quantity, price FROM itemInOrder WHERE order_id = 2") == [
+        (1, "Pomidor", 1, 5000)]
+    assert ledger.balance(client) == 27_000
+
+
+def test_invalid_orders_are_rejected_with_their_line(database):
+    setup_data()
+    good = order_lines("Ali aka", 0, [("Pomidor", 5000, 1)])
+    wrong_total = order_lines("Ali aka", 5_000, [("Pomidor", 5000, 1)], total_sum=6000)
+    unknown_client = order_lines("Vali", 0, [("Pomidor", 5000, 1)])
+    unknown_product = order_lines("Ali aka", 5_000, [("Banan", 1000, 1)])
+    lines = good + wrong_total + unknown_client + unknown_product
+
+    report = importer.import_orders(importer.text_rows(lines), ProductCatalogue())
+
+    assert report.orders == 1
+    starts = [len(good) + 1, len(good + wrong_total) + 1, len(good + wrong_total + unknown_client) + 1]
+    assert [line_no for line_no, _ in report.rejected] == starts
+    assert "mijoz topilmadi: Vali" in report.rejected[1][1]
+    assert "mahsulot topilmadi: Banan" in report.rejected[2][1]
+    assert "Qabul qilinmadi: 3 ta buyurtma" in report.summary()
+    assert db.query_one("SELECT COUNT(*) FROM orders")[0] == 1
+
+
+@pytest.mark.parametrize('delimiter', [";", ",", "\t"])
+def test_csv_export(database, delimiter):
+    setup_data()
+    rows = [line.split("  ") for line in order_lines("Ali aka", 0, [("Kartoshka", 3000, 3), ("Pomidor", 5000, 1)])]
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter=delimiter).writerows(cells + [""] * (6 - len(cells)) for cells in rows)
+    buffer.seek(0)
+
+    report = importer.import_orders(importer.csv_rows(buffer), ProductCatalogue())
+
+    assert (report.orders, report.rejected) == (1, [])
+    assert db.query_one("SELECT order_date, total_sum FROM orders") == ("05/01/2026", 14_000)
+
+
+def test_parse_amount():
+    assert importer.parse_amount("12 500 so'm") == 12500
+    assert importer.parse_amount("-3,000") == -3000
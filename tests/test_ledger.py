@@ -0,0 +1,131 @@
+import threading
+
+import pytest
+
+import db
+import ledger
+import pricing
+from conftest import add_client
+
+
+def assert_consistent(user_id):
+    """
+    users.debt equals the sum of the client's entries, and every entry carries the running balance.
+    """
+    running = 0
+    for entry in sorted(ledger.entries(user_id), key=lambda entry: entry.entry_id):
+        running += entry.amount
+        assert entry.balance == running
+    assert ledger.balance(user_id) == running
+
+
+def test_post_updates_the_balance_and_records_it(database):
+    client = add_client()
+    with db.transaction() as c:
+        assert ledger.post(c, client, ledger.ORDER, 50_000, order_id=1) == 50_000
+        assert ledger.post(c, client, ledger.PAYMENT, -20_000, payment_id=1) == 30_000
+        assert ledger.post(c, client, ledger.DISCOUNT, -1_000.4) == 29_000
+    assert [(entry.kind, entry.amount, entry.balance) for entry in ledger.entries(client)] == [
+        ('order', 50_000, 50_000), ('payment', -20_000, 30_000), ('discount', -1_000, 29_000)]
+    assert_consistent(client)
+
+
+def test_post_many_matches_posting_one_by_one(database):
+    one_by_one, batched = add_client("Ali"), add_client("Vali")
+    postings = [(ledger.ORDER, 10_000, 1, None, None), (ledger.PAYMENT, -4_000, None, 1, None),
+                (ledger.ADJUSTMENT, 500, None, None, "Tuzatish")]
+    with db.transaction() as c:
+        for kind, amount, order_id, payment_id, comment in postings:
+            ledger.post(c, one_by_one, kind, amount, order_id, payment_id, comment)
+        assert ledger.post_many(c, batched, postings) == 6_500
+
+    def rows(user_id):
+        return [entry[2:5] + entry[6:] for entry in ledger.entries(user_id)]
+
+    assert rows(batched) == rows(one_by_one)
+    assert_consistent(batched)
+
+
+def test_set_balance_posts_one_adjustment(database):
+    client = add_client(debt=0)
+    with db.transaction() as c:
+        ledger.post(c, client, ledger.ORDER, 12_000)
+        assert ledger.set_balance(c, client, 12_000) == 12_000
+        assert ledger.set_balance(c, client, 5_000, comment="Qo'lda") == 5_000
+    assert [(entry.kind, entry.amount) for entry in ledger.entries(client)] == [
+        ('order', 12_000), ('adjustment', -7_000)]
+    assert_consistent(client)
+
+
+def test_invalid_postings_roll_back(database):
+    client = add_client()
+    with pytest.raises(ValueError):
+        with db.transaction() as c:
+            ledger.post(c, client, ledger.ORDER, 1_000)
+            ledger.post(c, client, 'gift', 1_000)
+    with pytest.raises(ValueError):
+        with db.transaction() as c:
+            ledger.post(c, 404, ledger.ORDER, 1_000)
+    with pytest.raises(ValueError):
+        with db.transaction() as c:
+            ledger.post_many(c, 404, [(ledger.ORDER, 1_000, None, None, None)])
+    assert ledger.balance(client) == 0
+    assert list(ledger.entries(client)) == []
+
+
+def test_entries_date_range(database):
+    client = add_client()
+    with db.transaction() as c:
+        for day in ("2026-01-01", "2026-01-15", "2026-02-01"):
+            ledger.post(c, client, ledger.ORDER, 1_000)
+            c.execute("UPDATE ledger SET created_at = ? WHERE entry_id = last_insert_rowid()", (f"{day} 10:00:00",))
+    assert [entry.created_at[:10] for entry in ledger.entries(client, "2026-01-10", "2026-02-01")] == ["2026-01-15"]
+
+
+def test_concurrent_postings_keep_the_balance_consistent(database):
+    client = add_client()
+    barrier = threading.Barrier(8)
+
+    def worker(n):
+        barrier.wait()
+        for i in range(25):
+            with db.transaction() as c:
+                if i % 2:
+                    ledger.post(c, client, ledger.PAYMENT, -100)
+                else:
+                    ledger.post_many(c, client, [(ledger.ORDER, 300, None, None, None),
+                                                 (ledger.DISCOUNT, -50, None, None, None)])
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert ledger.balance(client) == 8 * (13 * 250 - 12 * 100)
+    assert_consistent(client)
+
+
+def test_interactive_order_is_booked_on_the_current_balance(database):
+    client = add_client()
+    with db.transaction() as c:
+        ledger.post(c, client, ledger.ORDER, 10_000)
+    # A payment lands after the admin saw the old debt; the order must not cancel it
+    with db.transaction() as c:
+        ledger.post(c, client, ledger.PAYMENT, -4_000)
+    with db.transaction() as c:
+        order_id = pricing.insert_order(c, client, "2026-01-05", [(1, "Olma", 1_000, 3, 1_000)], 3_000, 3)
+
+    assert db.query_one("SELECT before_order_debt, total_debt FROM orders WHERE order_id = ?", (order_id,)) == \
+        (6_000, 9_000)
+    assert [entry.kind for entry in ledger.entries(client)] == ['order', 'payment', 'order']
+    assert_consistent(client)
+
+
+def test_imported_order_is_reconciled_to_its_stated_debt(database):
+    client = add_client()
+    with db.transaction() as c:
+        pricing.insert_order(c, client, "05/01/2026", [], 3_000, 0, total_debt=10_000, before_order_debt=7_000)
+    assert [(entry.kind, entry.amount) for entry in ledger.entries(client)] == [('order', 3_000), ('adjustment', 7_000)]
+    assert ledger.balance(client) == 10_000
+    assert_consistent(client)
@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+import telebot
+from telebot import apihelper
+
+import db
+import metrics
+from benchmarks.fake_bot_api import FakeBotApi
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    api = FakeBotApi().start()
+    monkeypatch.setattr(apihelper, 'API_URL', api.url)
+    monkeypatch.setattr(apihelper, 'CUSTOM_REQUEST_SENDER', None)
+    yield api
+    api.stop()
+
+
+def test_queries_are_counted_per_thread_and_summed(database, monkeypatch):
+    monkeypatch.setattr(db, '_connect_hooks', list(db._connect_hooks))
+    collected = metrics.Metrics()
+    collected.instrument(telebot.TeleBot("0:test", threaded=False))
+    db.close_all()
+
+    def run_queries(queries):
+        for _ in range(queries):
+            db.query_one("SELECT 1")
+
+    handler = collected.track('run_queries', run_queries)
+
+    threads = [threading.Thread(target=handler, args=(n,)) for n in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    summary = collected.summary()
+    assert summary['updates'] == 4
+    assert summary['db_queries'] >= 10
+    assert summary['queries_per_update'] == pytest.approx(2.5)
+    assert "bot_updates_total 4" in collected.render()
+
+
+def test_bot_api_requests_are_counted_through_the_request_sender(database, fake_api, monkeypatch):
+    monkeypatch.setattr(db, '_connect_hooks', list(db._connect_hooks))
+    bot = telebot.TeleBot("0:test", threaded=False)
+    collected = metrics.Metrics()
+    collected.instrument(bot)
+
+    bot.send_message(1, "salom")
+    bot.answer_callback_query("1")
+
+    assert collected.api_requests == {'sendMessage': 1, 'answerCallbackQuery': 1}
+    assert [method for _, method, _ in fake_api.calls] == ['sendMessage', 'answerCallbackQuery']
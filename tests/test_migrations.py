@@ -0,0 +1,44 @@
+import sqlite3
+
+import db
+import migrations
+from benchmarks import fixtures
+
+LATEST = migrations.MIGRATIONS[-1][0]
+
+
+def indexes():
+    return {row[0] for row in db.query_all("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_fresh_database_is_brought_to_the_latest_version(database):
+    assert migrations.current_version() == LATEST
+    assert {'idx_users_telegram_id', 'idx_orders_user_id', 'idx_ledger_user_created'} <= indexes()
+
+
+def test_migrate_is_idempotent(database):
+    assert migrations.migrate() == LATEST
+    assert migrations.current_version() == LATEST
+
+
+def test_legacy_database_is_upgraded_in_place(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    fixtures.create_legacy_schema(conn)
+    fixtures.populate(conn, users=20, products=5, orders=60, lines_per_order=2, payments=10)
+    conn.close()
+
+    db.configure(path)
+    try:
+        assert migrations.migrate() == LATEST
+
+        # Added columns, opening balances equal to the old debts, backfilled sales
+        assert 'comment' in {row[1] for row in db.query_all("PRAGMA table_info(payments)")}
+        assert db.query_all("SELECT user_id, debt FROM users WHERE debt != 0 ORDER BY user_id") == \
+            db.query_all("SELECT user_id, balance FROM ledger ORDER BY user_id")
+        assert db.query_one("SELECT SUM(orders), SUM(revenue) FROM sales_daily") == \
+            db.query_one("SELECT COUNT(*), SUM(total_sum) FROM orders")
+        # The search index covers the existing users
+        assert db.query_one("SELECT COUNT(*) FROM client_search WHERE client_search MATCH 'Ism1*'")[0] > 0
+    finally:
+        db.close_all()
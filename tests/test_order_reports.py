@@ -0,0 +1,63 @@
+import db
+import order_reports
+from conftest import add_client
+
+
+def add_orders(user_id, count):
+    with db.transaction() as c:
+        for n in range(count):
+            c.execute("INSERT INTO orders (user_id, order_date, total_sum, total_quantity, is_confirmed) "
+                      "VALUES (?, '2026-01-05', 1000, 1, 0)", (user_id,))
+            order_id = c.execute("SELECT last_insert_rowid()").fetchone()[0]
+            if n % 2 == 0:
+                c.execute("INSERT INTO itemInOrder (order_id, product_name, quantity, product_price) "
+                          "VALUES (?, 'Olma', 1, 1000)", (order_id,))
+
+
+def test_iter_orders_streams_the_whole_history_oldest_first(database):
+    client = add_client("Ali")
+    other = add_client("Vali")
+    add_orders(client, 3)
+    add_orders(other, 2)
+
+    orders = list(order_reports.iter_orders())
+    assert [order.order_id for order in orders] == [1, 2, 3, 4, 5]
+    assert [order.products for order in orders[:2]] == [[('Olma', 1, 1000)], []]
+    assert [(order.order_id, order.client_name) for order in order_reports.iter_orders(other)] == \
+        [(4, "Vali"), (5, "Vali")]
+
+
+def test_fetch_page_walks_history_newest_first(database):
+    client = add_client("Ali")
+    other = add_client("Vali")
+    add_orders(client, 5)
+    add_orders(other, 3)
+
+    orders, newer, older = order_reports.fetch_page(client, page_size=2)
+    assert [order.order_id for order in orders] == [5, 4]
+    assert newer is None and older == 4
+    assert orders[0].client_name == "Ali"
+    assert orders[0].products == [('Olma', 1, 1000)]
+    assert orders[1].products == []
+
+    orders, newer, older = order_reports.fetch_page(client, before=older, page_size=2)
+    assert [order.order_id for order in orders] == [3, 2]
+    orders, newer, older = order_reports.fetch_page(client, before=older, page_size=2)
+    assert [order.order_id for order in orders] == [1]
+    assert older is None
+
+    orders, _, _ = order_reports.fetch_page(client, after=newer, page_size=2)
+    assert [order.order_id for order in orders] == [3, 2]
+
+
+def test_fetch_page_without_orders(database):
+    assert order_reports.fetch_page(add_client()) == ([], None, None)
+
+
+def test_message_builder_packs_blocks_under_the_limit():
+    builder = order_reports.MessageBuilder(limit=10)
+    for block in ("abcd\n", "efgh\n", "ij\n", "0123456\n789\n"):
+        builder.add(block)
+    messages = builder.messages()
+    assert messages == ["abcd\nefgh\n", "ij\n", "0123456\n", "789\n"]
+    assert all(len(message) <= 10 for message in messages)
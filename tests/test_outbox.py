@@ -0,0 +1,90 @@
+import threading
+
+from outbox import Outbox
+
+
+class ApiError(Exception):
+    def __init__(self, error_code, retry_after=None):
+        super().__init__(f"error {error_code}")
+        self.error_code = error_code
+        self.result_json = {'parameters': {'retry_after': retry_after}} if retry_after is not None else {}
+
+
+def outbox(**kwargs):
+    kwargs.setdefault('global_rate', 1000)
+    kwargs.setdefault('chat_rate', 1000)
+    return Outbox(lambda chat_id, text, **kw: None, **kwargs)
+
+
+def test_consecutive_messages_to_a_chat_are_coalesced():
+    box = outbox()
+    box.send_message(1, "a")
+    box.send_message(1, "b")
+    box.send_message(1, "c", reply_markup="keyboard")
+    box.send_message(1, "d")
+    item = box.take(block=False)
+    assert (item.text, item.kwargs, item.parts) == ("a\n\nb\n\nc", {'reply_markup': "keyboard"}, 3)
+    box.done(item)
+    assert box.take(block=False).text == "d"
+
+
+def test_messages_with_different_options_are_not_coalesced():
+    box = outbox()
+    box.send_message(1, "a")
+    box.send_message(1, "*b*", parse_mode="Markdown")
+    assert box.take(block=False).text == "a"
+
+
+def test_chat_rate_limit_lets_other_chats_through():
+    box = outbox(chat_rate=0.001, chat_burst=1, coalesce=False)
+    box.send_message(1, "a")
+    box.send_message(1, "b")
+    box.send_message(2, "c")
+    first = box.take(block=False)
+    box.done(first)
+    second = box.take(block=False)
+    box.done(second)
+    assert (first.text, second.text) == ("a", "c")
+    assert box.take(block=False) is None
+
+
+def test_rate_limited_message_is_retried_first_after_retry_after():
+    box = outbox(coalesce=False)
+    box.send_message(1, "a")
+    box.send_message(1, "b")
+    item = box.take(block=False)
+    box.done(item, ApiError(429, retry_after=60))
+    assert box.take(block=False) is None  # the chat is paused
+    assert box.stats()['rate_limited'] == 1
+
+    box._paused.clear()
+    assert box.take(block=False).text == "a"
+
+
+def test_message_is_dropped_after_max_retries():
+    box = outbox(max_retries=1)
+    box.send_message(1, "a")
+    box.done(box.take(block=False), ApiError(400))
+    assert box.stats()['failed'] == 1
+    assert box.stats()['pending'] == 0
+
+
+def test_sender_threads_deliver_every_message_in_order_per_chat():
+    delivered = []
+    lock = threading.Lock()
+
+    def send(chat_id, text, **kwargs):
+        with lock:
+            delivered.append((chat_id, text))
+
+    box = Outbox(send, workers=4, global_rate=10_000, chat_rate=10_000, chat_burst=10_000, coalesce=False)
+    box.start()
+    for n in range(50):
+        for chat_id in range(5):
+            box.send_message(chat_id, str(n))
+    assert box.flush(timeout=10)
+    box.close()
+
+    assert len(delivered) == 250
+    for chat_id in range(5):
+        assert [text for chat, text in delivered if chat == chat_id] == [str(n) for n in range(50)]
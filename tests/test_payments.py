@@ -0,0 +1,107 @@
+import threading
+
+import db
+import ledger
+import payments
+from conftest import add_client
+
+
+def add_payment(telegram_id, amount, comment=None, is_confirmed=0):
+    return db.execute("INSERT INTO payments (user_id, amount, comment, is_confirmed) VALUES (?, ?, ?, ?)",
+                      (telegram_id, amount, comment, is_confirmed)).lastrowid
+
+
+def client_with_debt(name, telegram_id, debt):
+    client = add_client(name, telegram_id=telegram_id)
+    with db.transaction() as c:
+        ledger.post(c, client, ledger.ORDER, debt)
+    return client
+
+
+def test_pending_lists_registered_clients_oldest_first(database):
+    client_with_debt("Ali", "1001", 0)
+    first = add_payment("1001", 5000, "naqd")
+    add_payment("1001", 7000, is_confirmed=1)
+    add_payment("9999", 1000)  # not a registered user
+    second = add_payment("1001", 3000)
+    assert [(p.payment_id, p.first_name, p.amount, p.comment) for p in payments.pending()] == [
+        (first, "Ali", 5000, "naqd"), (second, "Ali", 3000, None)]
+
+
+def test_confirm_books_each_clients_payments_in_order(database):
+    ali = client_with_debt("Ali", "1001", 10_000)
+    vali = client_with_debt("Vali", "1002", 4_000)
+    ids = [add_payment("1001", 3_000), add_payment("1002", 1_000), add_payment("1001", 2_000)]
+
+    confirmed = payments.confirm(ids)
+
+    assert [p.payment_id for p in confirmed] == ids
+    assert (ledger.balance(ali), ledger.balance(vali)) == (5_000, 3_000)
+    assert [(e.kind, e.amount, e.balance, e.payment_id) for e in ledger.entries(ali)][1:] == [
+        ('payment', -3_000, 7_000, ids[0]), ('payment', -2_000, 5_000, ids[2])]
+    assert payments.pending() == []
+    assert sorted(payments.by_client(confirmed)) == [(1001, 2, 5_000), (1002, 1, 1_000)]
+
+
+def test_overpayment_is_adjusted_back_to_zero(database):
+    ali = client_with_debt("Ali", "1001", 5_000)
+    payment_id = add_payment("1001", 8_000)
+
+    payments.confirm([payment_id])
+
+    assert ledger.balance(ali) == 0
+    assert [(e.kind, e.amount, e.balance) for e in ledger.entries(ali)][1:] == [
+        ('payment', -8_000, -3_000), ('adjustment', 3_000, 0)]
+
+
+def test_reject_deletes_only_pending_payments(database):
+    ali = client_with_debt("Ali", "1001", 5_000)
+    pending_id = add_payment("1001", 1_000)
+    confirmed_id = add_payment("1001", 2_000, is_confirmed=1)
+
+    assert [p.payment_id for p in payments.reject([pending_id, confirmed_id])] == [pending_id]
+    assert db.query_all("SELECT payment_id FROM payments") == [(confirmed_id,)]
+    assert ledger.balance(ali) == 5_000
+    assert payments.confirm([]) == [] and payments.reject([]) == []
+
+
+def race(*actions):
+    """
+    Run every action on its own thread at the same moment; return their results.
+    """
+    barrier = threading.Barrier(len(actions))
+    results = [None] * len(actions)
+
+    def run(i, action):
+        barrier.wait()
+        results[i] = action()
+
+    threads = [threading.Thread(target=run, args=(i, action)) for i, action in enumerate(actions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_confirmations_apply_a_payment_once(database):
+    ali = client_with_debt("Ali", "1001", 50_000)
+    ids = [add_payment("1001", 1_000) for _ in range(20)]
+
+    results = race(*[lambda: payments.confirm(ids) for _ in range(8)])
+
+    claimed = [p.payment_id for result in results for p in result]
+    assert sorted(claimed) == ids
+    assert ledger.balance(ali) == 30_000
+    assert db.query_one("SELECT COUNT(*) FROM ledger WHERE kind = 'payment'")[0] == 20
+
+
+def test_confirm_and_reject_race_claims_each_payment_once(database):
+    ali = client_with_debt("Ali", "1001", 50_000)
+    ids = [add_payment("1001", 1_000) for _ in range(20)]
+
+    confirmed, rejected = race(lambda: payments.confirm(ids), lambda: payments.reject(ids))
+
+    assert len(confirmed) + len(rejected) == 20
+    assert ledger.balance(ali) == 50_000 - 1_000 * len(confirmed)
+    assert db.query_one("SELECT COUNT(*) FROM payments")[0] == len(confirmed)
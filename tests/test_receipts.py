@@ -0,0 +1,65 @@
+import db
+import receipts
+from conftest import add_client
+
+
+def add_order(user_id, lines):
+    with db.transaction() as c:
+        total = sum(quantity * price for _, quantity, price in lines)
+        c.execute("INSERT INTO orders (user_id, order_date, total_sum, total_quantity, total_debt, "
+                  "before_order_debt, is_confirmed) VALUES (?, '2026-01-05', ?, ?, ?, 0, 0)",
+                  (user_id, total, sum(quantity for _, quantity, _ in lines), total))
+        order_id = c.execute("SELECT last_insert_rowid()").fetchone()[0]
+        c.executemany("INSERT INTO itemInOrder (order_id, product_name, quantity, price) VALUES (?, ?, ?, ?)",
+                      [(order_id, *line) for line in lines])
+    return order_id
+
+
+def test_get_renders_once_and_serves_from_cache(database):
+    order_id = add_order(add_client(), [("Olma", 2, 5000), ("Nok", 1, 7000)])
+    cache = receipts.ReceiptCache()
+
+    text = cache.get(order_id)
+    assert "- Olma: 2 x 5,000 = 10,000 so'm" in text
+    assert "💰 Jami summa: 17,000 so'm" in text
+    assert cache.get(order_id) == text
+    assert cache.stats()['hits'] == 1
+
+
+def test_missing_order_is_not_cached(database):
+    cache = receipts.ReceiptCache()
+    assert cache.get(404) is None
+    assert cache.stats()['size'] == 0
+
+
+def test_invalidate_drops_the_entry(database):
+    order_id = add_order(add_client(), [("Olma", 2, 5000)])
+    cache = receipts.ReceiptCache()
+    cache.get(order_id)
+    db.execute("DELETE FROM itemInOrder WHERE order_id = ?", (order_id,))
+    db.execute("DELETE FROM orders WHERE order_id = ?", (order_id,))
+    cache.invalidate(order_id)
+    assert cache.get(order_id) is None
+
+
+def test_render_in_flight_during_invalidation_is_not_stored(database, monkeypatch):
+    order_id = add_order(add_client(), [("Olma", 2, 5000)])
+    cache = receipts.ReceiptCache()
+    load = receipts.load
+
+    def load_then_invalidate(order_id):
+        text = load(order_id)
+        cache.invalidate(order_id)
+        return text
+
+    monkeypatch.setattr(receipts, 'load', load_then_invalidate)
+    assert cache.get(order_id) is not None
+    assert cache.stats()['size'] == 0
+
+
+def test_put_after_invalidate_is_served():
+    cache = receipts.ReceiptCache()
+    cache.put(1, "old")
+    cache.invalidate(1)
+    cache.put(1, "new")
+    assert cache.get(1) == "new"
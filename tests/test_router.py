@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+
+from router import Router
+
+
+def message(text, user_id=1):
+    return SimpleNamespace(text=text, from_user=SimpleNamespace(id=user_id))
+
+
+@pytest.fixture
+def router():
+    states = {2: 'adding_product'}
+    router = Router(lambda message: states.get(message.from_user.id))
+    calls = []
+    router.calls = calls
+    router.command('start', 'help')(lambda m: calls.append('start'))
+    router.text("Bosh menyu")(lambda m: calls.append('menu'))
+    router.state('adding_product')(lambda m: calls.append('adding_product'))
+    router.fallback(lambda m: calls.append('fallback'))
+    return router
+
+
+def test_resolution_order(router):
+    assert router.resolve(message("/start"))[0] == "command:start"
+    assert router.resolve(message("/help@AbrorBot extra"))[0] == "command:help"
+    assert router.resolve(message("Bosh menyu", user_id=2))[0] == "text:Bosh menyu"
+    assert router.resolve(message("Olma 2", user_id=2))[0] == "state:adding_product"
+    assert router.resolve(message("Olma 2"))[0] == "fallback"
+    assert router.resolve(message("/unknown"))[0] == "fallback"
+
+
+def test_dispatch_calls_the_handler_and_notifies_observers(router):
+    observed = []
+    router.add_observer(lambda route, elapsed, failed: observed.append(route))
+    router.dispatch(message("/start"))
+    router.dispatch(message("/start"))
+    router.dispatch(message("salom"))
+    assert router.calls == ['start', 'start', 'fallback']
+    assert observed == ["command:start", "command:start", "fallback"]
+
+
+def test_observers_see_failures(router):
+    observed = []
+    router.add_observer(lambda route, elapsed, failed: observed.append((route, failed)))
+
+    @router.command('boom')
+    def boom(message):
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        router.dispatch(message("/boom"))
+    router.dispatch(message("/start"))
+    assert observed == [("command:boom", True), ("command:start", False)]
+
+
+def test_no_fallback_ignores_the_message():
+    router = Router(lambda message: None)
+    observed = []
+    router.add_observer(lambda *args: observed.append(args))
+    router.dispatch(message("salom"))
+    assert observed == []
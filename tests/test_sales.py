@@ -0,0 +1,89 @@
+import db
+import migrations
+import pricing
+import sales
+from conftest import add_client
+
+AGGREGATES = ("sales_daily", "sales_daily_product", "sales_daily_client")
+
+
+def snapshot():
+    return {table: db.query_all(f"SELECT * FROM {table} ORDER BY 1, 2") for table in AGGREGATES}
+
+
+def add_products():
+    db.execute("INSERT INTO products (product_id, product_name, product_price) "
+               "VALUES (1, 'Pomidor', 5000), (2, 'Kartoshka', 3000)")
+
+
+def place_order(user_id, order_date, quantities):
+    """
+    Book an order of {product_id: quantity} through pricing.insert_order.
+    """
+    prices = {1: 5000, 2: 3000}
+    lines = [(product_id, f"#{product_id}", prices[product_id], quantity, prices[product_id])
+             for product_id, quantity in quantities.items()]
+    with db.transaction() as c:
+        return pricing.insert_order(c, user_id, order_date, lines,
+                                    sum(prices[p] * q for p, q in quantities.items()), sum(quantities.values()))
+
+
+def test_day_of_normalizes_every_order_date_format():
+    assert sales.day_of("2026-01-05 14:30:00") == "2026-01-05"
+    assert sales.day_of("2026-01-05") == "2026-01-05"
+    assert sales.day_of("05/01/2026") == "2026-01-05"
+    assert sales.day_of(" 05/01/2026 ") == "2026-01-05"
+
+
+def test_orders_are_added_to_the_aggregates(database):
+    add_products()
+    ali, vali = add_client("Ali"), add_client("Vali")
+    place_order(ali, "2026-01-05 10:00:00", {1: 2, 2: 1})
+    place_order(ali, "05/01/2026", {1: 1})
+    place_order(vali, "2026-01-06 09:00:00", {2: 4})
+
+    assert snapshot() == {
+        "sales_daily": [("2026-01-05", 2, 4, 18000), ("2026-01-06", 1, 4, 12000)],
+        "sales_daily_product": [("2026-01-05", 1, 3, 15000), ("2026-01-05", 2, 1, 3000),
+                                ("2026-01-06", 2, 4, 12000)],
+        "sales_daily_client": [("2026-01-05", ali, 2, 4, 18000), ("2026-01-06", vali, 1, 4, 12000)],
+    }
+    assert sales.totals("2026-01-01", "2026-01-31") == (3, 8, 30000)
+    assert sales.top_products("2026-01-01", "2026-01-31") == [("Kartoshka", 5, 15000), ("Pomidor", 3, 15000)]
+
+
+def test_deleted_order_is_taken_back_out(database):
+    add_products()
+    client = add_client()
+    order_id = place_order(client, "2026-01-05 10:00:00", {1: 2, 2: 1})
+
+    with db.transaction() as c:
+        sales.record_order(c, order_id, sign=-1)
+
+    assert snapshot() == {
+        "sales_daily": [("2026-01-05", 0, 0, 0)],
+        "sales_daily_product": [("2026-01-05", 1, 0, 0), ("2026-01-05", 2, 0, 0)],
+        "sales_daily_client": [("2026-01-05", client, 0, 0, 0)],
+    }
+    assert sales.totals("2026-01-01", "2026-01-31") == (0, 0, 0)
+    assert sales.top_products("2026-01-01", "2026-01-31") == []
+
+
+def test_backfill_matches_incremental_maintenance(database):
+    add_products()
+    ali, vali = add_client("Ali"), add_client("Vali")
+    place_order(ali, "2026-01-05 10:00:00", {1: 2, 2: 1})
+    place_order(ali, "2026-01-05", {2: 3})
+    place_order(ali, "05/01/2026", {1: 1})
+    place_order(vali, "05/01/2026", {1: 1, 2: 2})
+    place_order(vali, "2026-01-07 18:45:00", {2: 4})
+    incremental = snapshot()
+
+    with db.transaction() as c:
+        for table in AGGREGATES:
+            c.execute(f"DELETE FROM {table}")
+        migrations._sales_aggregates(c)
+
+    # The three spellings of 5 January are merged into one day
+    assert [row[0] for row in incremental["sales_daily"]] == ["2026-01-05", "2026-01-07"]
+    assert snapshot() == incremental
@@ -0,0 +1,94 @@
+import pickle
+
+import pytest
+
+import db
+import state_store
+
+
+class FailsToPickleOnce:
+    failed = False
+
+    def __reduce__(self):
+        if not FailsToPickleOnce.failed:
+            FailsToPickleOnce.failed = True
+            raise RuntimeError("dictionary changed size during iteration")
+        return FailsToPickleOnce, ()
+
+
+def persisted():
+    return {(ns, key): pickle.loads(value)
+            for ns, key, value in db.query_all("SELECT namespace, key, value FROM conversation_state")}
+
+
+def test_flush_writes_changes_and_deletions(database):
+    store = state_store.SQLiteStateStore()
+    carts = store.namespace('user_cart')
+    carts[1] = {'Olma': 2}
+    carts[2] = {'Nok': 1}
+    assert store.flush() == 2
+    assert persisted() == {('user_cart', '1'): {'Olma': 2}, ('user_cart', '2'): {'Nok': 1}}
+
+    del carts[1]
+    carts[2] = {'Nok': 3}
+    store.flush()
+    assert persisted() == {('user_cart', '2'): {'Nok': 3}}
+    assert store.flush() == 0
+
+
+def test_start_restores_persisted_state(database):
+    store = state_store.SQLiteStateStore()
+    store.namespace('user_states')[7] = 'adding_product'
+    store.flush()
+
+    restarted = state_store.SQLiteStateStore()
+    restarted.start()
+    try:
+        assert restarted.namespace('user_states')[7] == 'adding_product'
+    finally:
+        restarted.close()
+
+
+def test_idle_entries_are_not_restored(database):
+    store = state_store.SQLiteStateStore(idle_ttl=60)
+    store.namespace('user_states')[7] = 'adding_product'
+    store.flush()
+    db.execute("UPDATE conversation_state SET updated_at = updated_at - 120")
+
+    restarted = state_store.SQLiteStateStore(idle_ttl=60)
+    restarted.start()
+    try:
+        assert restarted.namespace('user_states').get(7) is None
+        assert persisted() == {}
+    finally:
+        restarted.close()
+
+
+def test_failed_serialization_keeps_keys_dirty(database):
+    store = state_store.SQLiteStateStore()
+    store.namespace('user_cart')[1] = {'Olma': FailsToPickleOnce()}
+    with pytest.raises(RuntimeError):
+        store.flush()
+    assert persisted() == {}
+
+    assert store.flush() == 1
+    assert list(persisted()) == [('user_cart', '1')]
+
+
+def test_failed_write_keeps_keys_dirty(database):
+    store = state_store.SQLiteStateStore()
+    store.namespace('user_cart')[1] = {'Olma': 2}
+    db.execute("ALTER TABLE conversation_state RENAME TO moved")
+    with pytest.raises(Exception):
+        store.flush()
+    db.execute("ALTER TABLE moved RENAME TO conversation_state")
+
+    assert store.flush() == 1
+    assert persisted() == {('user_cart', '1'): {'Olma': 2}}
+
+
+def test_memory_store_evicts_idle_entries():
+    store = state_store.MemoryStateStore(idle_ttl=0)
+    store.namespace('user_states')[1] = 'x'
+    assert store.evict_idle() == 1
+    assert len(store) == 0
@@ -0,0 +1,79 @@
+import http.client
+import json
+import logging
+import queue
+
+import pytest
+
+import webhook
+
+SECRET = "s3cret"
+
+
+@pytest.fixture
+def server():
+    batches = queue.Queue()
+    server = webhook.WebhookServer(None, host="127.0.0.1", port=0, secret_token=SECRET,
+                                   process_updates=batches.put).start()
+    server.batches = batches
+    yield server
+    server.stop()
+
+
+def post(server, body=b"", path="/webhook", secret=SECRET, content_length=None):
+    """
+    POST body with the raw headers given and return the response status.
+    """
+    conn = http.client.HTTPConnection(*server.address, timeout=5)
+    try:
+        conn.putrequest("POST", path)
+        if secret is not None:
+            conn.putheader(webhook.SECRET_HEADER, secret)
+        conn.putheader("Content-Length", str(len(body)) if content_length is None else content_length)
+        conn.endheaders(body)
+        return conn.getresponse().status
+    finally:
+        conn.close()
+
+
+def update(update_id):
+    return json.dumps({"update_id": update_id}).encode()
+
+
+def test_update_is_queued_and_dispatched(server):
+    assert post(server, update(1)) == 200
+    assert [u.update_id for u in server.batches.get(timeout=2)] == [1]
+
+
+@pytest.mark.parametrize("secret", [None, "wrong"])
+def test_requests_without_the_secret_token_are_refused(server, secret):
+    assert post(server, update(1), secret=secret) == 403
+    assert server.updates.empty()
+
+
+def test_unknown_path_is_not_found(server):
+    assert post(server, update(1), path="/other") == 404
+    assert server.updates.empty()
+
+
+@pytest.mark.parametrize("content_length", ["abc", "-1", "1.5"])
+def test_malformed_content_length_is_rejected_before_reading(server, content_length):
+    assert post(server, update(1), content_length=content_length) == 400
+    assert server.updates.empty()
+
+
+def test_oversized_body_is_rejected_before_reading(server):
+    assert post(server, content_length=str(webhook.MAX_BODY + 1)) == 413
+    assert server.updates.empty()
+
+
+def test_malformed_update_is_logged_and_skipped(server, caplog):
+    with caplog.at_level(logging.WARNING, logger="webhook"):
+        assert post(server, b"{not json") == 200
+        assert post(server, update(2)) == 200
+        # The two bodies may arrive in one batch or two; a batch of only the bad one is empty
+        dispatched = []
+        while not dispatched:
+            dispatched = [u.update_id for u in server.batches.get(timeout=2)]
+    assert dispatched == [2]
+    assert "Ignoring malformed update" in caplog.text
@@ -0,0 +1,195 @@
+"""
+Webhook ingestion.
+
+Instead of long polling getUpdates, Telegram POSTs every Update to a URL we
+register with set_webhook. WebhookServer is a small built-in HTTP endpoint
+for that: it checks the X-Telegram-Bot-Api-Secret-Token header, queues the raw
+body and answers 200 at once, and a dispatcher thread hands the queued updates
+to bot.process_new_updates in batches.
+
+Telegram only delivers to HTTPS on ports 443, 80, 88 or 8443; either pass a
+certificate and key, or run behind a TLS-terminating reverse proxy and point
+WEBHOOK_URL at it.
+
+run() picks the ingestion mode: BOT_MODE=webhook uses the webhook and falls
+back to polling if Telegram rejects set_webhook; anything else polls.
+"""
+import hmac
+import logging
+import queue
+import ssl
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot.types import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Largest update body we accept; Telegram updates are a few KB
+MAX_BODY = 1024 * 1024
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Telegram opens up to 40 parallel connections; the default backlog of 5 drops SYNs under bursts
+    request_queue_size = 128
+
+
+class WebhookServer:
+    def __init__(self, bot, host="0.0.0.0", port=8443, path="/webhook", secret_token=None,
+                 batch_size=100, maxsize=10000, certfile=None, keyfile=None, process_updates=None):
+        """
+        process_updates(updates) handles each batch; defaults to bot.process_new_updates.
+        """
+        self.bot = bot
+        self.process_updates = process_updates or bot.process_new_updates
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.batch_size = batch_size
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.updates = queue.Queue(maxsize)
+        self._server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def _authorized(self, headers):
+        if not self.secret_token:
+            return True
+        return hmac.compare_digest(headers.get(SECRET_HEADER, ''), self.secret_token)
+
+    def start(self):
+        webhook = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != webhook.path:
+                    self.send_error(404)
+                    return
+                if not webhook._authorized(self.headers):
+                    self.send_error(403)
+                    return
+                # Checked before reading: a bad value would raise, and a negative one would read until EOF
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    self.send_error(400)
+                    return
+                if length > MAX_BODY:
+                    self.send_error(413)
+                    return
+                try:
+                    webhook.updates.put_nowait(self.rfile.read(length))
+                except queue.Full:
+                    # Telegram retries the delivery later
+                    self.send_error(503)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self._server = _Server((self.host, self.port), Handler)
+        if self.certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.certfile, self.keyfile)
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+
+        for target, name in ((self._server.serve_forever, "webhook-http"), (self._dispatch, "webhook-dispatch")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Webhook server listening on {self.host}:{self.address[1]}{self.path}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+
+    def _next_batch(self):
+        """
+        Block for one update, then take whatever else is already queued (up to batch_size).
+        """
+        try:
+            batch = [self.updates.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        try:
+            while len(batch) < self.batch_size:
+                batch.append(self.updates.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _dispatch(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            updates = []
+            for body in batch:
+                try:
+                    updates.append(Update.de_json(body.decode('utf-8')))
+                except Exception as e:
+                    logger.warning(f"Ignoring malformed update: {e}")
+            try:
+                self.process_updates(updates)
+            except Exception as e:
+                logger.error(f"Failed to process {len(updates)} updates: {e}", exc_info=True)
+
+
+def start_webhook(bot, url, secret_token, **kwargs):
+    """
+    Start the local endpoint and register url with Telegram. Returns the running server.
+    """
+    server = WebhookServer(bot, secret_token=secret_token, **kwargs).start()
+    try:
+        certificate = None
+        if kwargs.get('certfile'):
+            # Self-signed certificates have to be uploaded so Telegram trusts them
+            with open(kwargs['certfile'], 'rb') as f:
+                certificate = f.read()
+        bot.remove_webhook()
+        bot.set_webhook(url=url, secret_token=secret_token, certificate=certificate)
+    except Exception:
+        server.stop()
+        raise
+    return server
+
+
+def run(bot, mode="polling", url=None, secret_token=None, **kwargs):
+    """
+    Receive updates until interrupted, by webhook if mode is 'webhook' and otherwise by polling.
+    """
+    if mode == "webhook":
+        try:
+            server = start_webhook(bot, url, secret_token, **kwargs)
+        except Exception as e:
+            logger.error(f"Webhook setup failed, falling back to polling: {e}", exc_info=True)
+        else:
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.stop()
+            return
+
+    # getUpdates is refused while a webhook is registered
+    bot.remove_webhook()
+    bot.polling(none_stop=True)